@@ -0,0 +1,133 @@
+"""Index of the watched addresses.
+
+Addresses are matched exactly using a set. Optionally outputs are also
+matched on the payment credential of the watched addresses, so that an
+address with the same payment (e.g. DEX script) credential but a
+different stake part is caught too.
+
+Matching on credentials needs the address decoded from bech32, this is
+only done for addresses that pass a cheap prefilter: in a bech32
+address the characters following the header encode the payment
+credential alone, so a slice of the string is compared first.
+"""
+
+from typing import Final, Iterable, Iterator, Optional
+
+try:
+    import config
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import config
+    except ModuleNotFoundError:
+        from cnt_collector_node import config
+
+BECH32_CHARSET: Final[str] = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_SEPARATOR: Final[str] = "1"
+BECH32_CHECKSUM_LENGTH: Final[int] = 6
+
+# Shelley address header types (the high nibble of the header byte) with
+# a payment part, i.e. base, pointer and enterprise addresses. The low
+# bit of the type tells whether the payment part is a script.
+SHELLEY_PAYMENT_TYPES: Final[range] = range(0, 8)
+CREDENTIAL_LENGTH: Final[int] = 28
+
+# The header byte and the first two credential bits are encoded in the
+# first two characters after the separator. The following 44 characters
+# encode credential bits only.
+FRAGMENT_START: Final[int] = 2
+FRAGMENT_END: Final[int] = 46
+
+_CHARSET_VALUES: Final[dict] = {char: idx for idx, char in enumerate(BECH32_CHARSET)}
+
+
+def bech32_data(address: str) -> Optional[bytes]:
+    """Return the data encoded in a bech32 address, the checksum is
+    not verified. None is returned if the address isn't bech32.
+    """
+    data_start = address.rfind(BECH32_SEPARATOR) + 1
+    if data_start == 0:
+        return None
+    acc = 0
+    bits = 0
+    data = bytearray()
+    try:
+        for char in address[data_start:-BECH32_CHECKSUM_LENGTH]:
+            acc = (acc << 5) | _CHARSET_VALUES[char]
+            bits += 5
+            if bits >= 8:
+                bits -= 8
+                data.append((acc >> bits) & 0xFF)
+    except KeyError:
+        return None
+    return bytes(data)
+
+
+def payment_credential(address: str) -> Optional[tuple[bool, bytes]]:
+    """Return whether the payment credential of an address is a script
+    and the credential. None is returned for addresses without one,
+    e.g. Byron or reward addresses.
+    """
+    data = bech32_data(address)
+    if not data or len(data) < 1 + CREDENTIAL_LENGTH:
+        return None
+    address_type = data[0] >> 4
+    if address_type not in SHELLEY_PAYMENT_TYPES:
+        return None
+    return bool(address_type & 1), data[1 : 1 + CREDENTIAL_LENGTH]
+
+
+def credential_fragment(address: str) -> str:
+    """Return the part of a bech32 address that encodes nothing but the
+    payment credential.
+    """
+    data_start = address.rfind(BECH32_SEPARATOR) + 1
+    fragment = address[data_start + FRAGMENT_START : data_start + FRAGMENT_END]
+    if data_start == 0 or len(fragment) < FRAGMENT_END - FRAGMENT_START:
+        return ""
+    return fragment
+
+
+class WatchedAddresses:
+    """Watched addresses built from the pairs configuration.
+
+    Behaves as a collection of the configured addresses, `match` returns
+    the configured addresses an (output) address corresponds to.
+    """
+
+    def __init__(
+        self,
+        addresses: Iterable[str],
+        match_credentials: bool = config.WATCH_PAYMENT_CREDENTIALS,
+    ):
+        self.addresses: list[str] = list(dict.fromkeys(addresses))
+        self.match_credentials = match_credentials
+        self._exact: set[str] = set(self.addresses)
+        self._fragments: set[str] = set()
+        self._credentials: dict[tuple[bool, bytes], list[str]] = {}
+        if not match_credentials:
+            return
+        for address in self.addresses:
+            credential = payment_credential(address)
+            if not credential:
+                continue
+            self._fragments.add(credential_fragment(address))
+            self._credentials.setdefault(credential, []).append(address)
+
+    def match(self, address: str) -> list[str]:
+        """Return the configured addresses matching an address."""
+        if address in self._exact:
+            return [address]
+        if not self.match_credentials:
+            return []
+        if credential_fragment(address) not in self._fragments:
+            return []
+        return self._credentials.get(payment_credential(address), [])
+
+    def __contains__(self, address: object) -> bool:
+        return isinstance(address, str) and bool(self.match(address))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.addresses)
+
+    def __len__(self) -> int:
+        return len(self.addresses)
@@ -0,0 +1,226 @@
+"""Decode Ogmios nextBlock responses into compact block structures.
+
+Blocks are decoded into the few fields the indexer reads: the block
+header, and for each transaction with an output at a watched address
+its id, inputs and outputs. Witnesses, scripts, metadata, etc. and
+transactions that don't touch a watched address are never decoded.
+
+To do so the raw response is split before decoding. The transactions
+array (the last field of an Ogmios block) is cut out of the response
+and the rest of the response decoded on its own. The array is split
+into transactions which are only decoded if one of their addresses is
+watched. The split is only trusted if the array parses as a JSON array
+with one element per transaction, its strings blanked out so that the
+transactions themselves aren't decoded. If the response isn't laid out
+as expected it is decoded in full instead, so the result is the same
+either way.
+
+orjson is used to decode JSON if it is installed.
+"""
+
+import functools
+import json
+import logging
+import re
+from typing import Callable, Container, Final, Iterator, Optional, TypedDict
+
+try:
+    import orjson as _json_impl
+except ModuleNotFoundError:
+    _json_impl = json
+
+logger = logging.getLogger(__name__)
+
+TRANSACTIONS_KEY: Final[str] = '"transactions":['
+TRANSACTION_SEPARATOR: Final[str] = '},{"id":"'
+TRANSACTION_START: Final[str] = '{"id":"'
+
+ADDRESS_RE: Final[re.Pattern] = re.compile(r'"address"\s*:\s*"([^"]+)"')
+
+
+loads: Callable[[str], object] = getattr(_json_impl, "loads", json.loads)
+
+
+class OutRef(TypedDict):
+    """Transaction input, i.e. the output it spends."""
+
+    transaction: dict
+    index: int
+
+
+class TxOutput(TypedDict):
+    """Transaction output."""
+
+    address: str
+    value: dict
+
+
+class Transaction(TypedDict):
+    """Transaction with the fields the indexer reads."""
+
+    id: str
+    inputs: list[OutRef]
+    outputs: list[TxOutput]
+
+
+class Block(TypedDict, total=False):
+    """Block header and the transactions with watched outputs.
+
+    `transaction_count` is the number of transactions in the block,
+    including those that weren't decoded.
+    """
+
+    id: str
+    ancestor: str
+    height: int
+    slot: int
+    transactions: list[Transaction]
+    transaction_count: int
+
+
+def compact_transaction(transaction: dict) -> Transaction:
+    """Return the fields of a decoded transaction the indexer reads."""
+    return Transaction(
+        id=transaction["id"],
+        inputs=[
+            OutRef(
+                transaction={"id": tx_input["transaction"]["id"]},
+                index=tx_input["index"],
+            )
+            for tx_input in transaction["inputs"]
+        ],
+        outputs=[
+            TxOutput(address=output["address"], value=output["value"])
+            for output in transaction["outputs"]
+        ],
+    )
+
+
+def _watched(text: str, watched: Container[str]) -> bool:
+    """Return True if an address in the JSON text is watched."""
+    return any(address in watched for address in ADDRESS_RE.findall(text))
+
+
+def _has_watched_output(transaction: dict, watched: Container[str]) -> bool:
+    """Return True if a decoded transaction pays to a watched address."""
+    return any(output.get("address") in watched for output in transaction["outputs"])
+
+
+def _compact_block(block: dict, watched: Container[str]) -> Block:
+    """Compact a fully decoded block."""
+    transactions = block.pop("transactions", [])
+    block["transaction_count"] = len(transactions)
+    block["transactions"] = [
+        compact_transaction(transaction)
+        for transaction in transactions
+        if _has_watched_output(transaction, watched)
+    ]
+    return block
+
+
+def _split_transactions(text: str) -> list[str]:
+    """Split the contents of a transactions array into transactions.
+
+    The split relies on transactions starting with their id. If a nested
+    object starting with an id is split by mistake, the pieces around it
+    won't decode and the caller falls back to decoding in full.
+    """
+    if not text.strip():
+        return []
+    pieces = text.split(TRANSACTION_SEPARATOR)
+    last = len(pieces) - 1
+    for idx, piece in enumerate(pieces):
+        if idx > 0:
+            piece = TRANSACTION_START + piece
+        if idx < last:
+            piece = piece + "}"
+        pieces[idx] = piece
+    return pieces
+
+
+def _array_length(text: str) -> Optional[int]:
+    """Return the number of elements of a JSON array, None if the text
+    isn't one.
+
+    The strings are blanked out before decoding, so only the structure
+    of the array is decoded. Escaped quotes can't be told apart from the
+    ends of strings this way, None is returned if there are any.
+    """
+    if '\\"' in text:
+        return None
+    segments = text.split('"')
+    if len(segments) % 2 == 0:
+        return None
+    try:
+        array = loads('""'.join(segments[0::2]))
+    except ValueError:
+        return None
+    return len(array) if isinstance(array, list) else None
+
+
+def _watched_transactions(
+    pieces: list[str], watched: Container[str]
+) -> Iterator[Transaction]:
+    """Decode the transactions paying to a watched address."""
+    for piece in pieces:
+        if not _watched(piece, watched):
+            continue
+        transaction = loads(piece)
+        if not isinstance(transaction, dict):
+            raise TypeError("transaction isn't an object")
+        if _has_watched_output(transaction, watched):
+            yield compact_transaction(transaction)
+
+
+def _decode_partial(raw: str, watched: Container[str]) -> Optional[dict]:
+    """Decode a nextBlock response without decoding the transactions
+    that don't touch a watched address. Return None if the response
+    cannot be decoded this way.
+    """
+    start = raw.find(TRANSACTIONS_KEY)
+    end = raw.rfind("]")
+    try:
+        if start == -1 or end < start:
+            raise ValueError("no transactions array")
+        resp = loads(raw[:start] + TRANSACTIONS_KEY + raw[end:])
+        block = resp["result"]["block"]
+        pieces = _split_transactions(raw[start + len(TRANSACTIONS_KEY) : end])
+        # the transactions must be the last array of the block, split at
+        # the boundaries of its elements.
+        if (
+            block.get("transactions") != []
+            or (pieces and not pieces[0].startswith(TRANSACTION_START))
+            or _array_length(raw[start + len(TRANSACTIONS_KEY) - 1 : end + 1])
+            != len(pieces)
+        ):
+            raise ValueError("unexpected transactions layout")
+        block["transactions"] = list(_watched_transactions(pieces, watched))
+    except (ValueError, KeyError, TypeError):
+        return None
+    block["transaction_count"] = len(pieces)
+    return resp
+
+
+def decode_next_block(raw: str, watched: Container[str]) -> dict:
+    """Decode a nextBlock response, see the module docstring."""
+    resp = _decode_partial(raw, watched)
+    if resp is not None:
+        return resp
+    try:
+        resp = loads(raw)
+    except ValueError as err:
+        logger.error("cannot decode Ogmios response: %s", err)
+        return {}
+    try:
+        block = resp["result"]["block"]
+    except (KeyError, TypeError):
+        return resp
+    resp["result"]["block"] = _compact_block(block, watched)
+    return resp
+
+
+def next_block_decoder(watched: Container[str]) -> Callable[[str], dict]:
+    """Return the decoder of the nextBlock requests of the chain-sync,
+    called with the raw response text.
+    """
+    return functools.partial(decode_next_block, watched=watched)
@@ -9,6 +9,103 @@ VERSION: Final[str] = "2.3.0"
 UTC_TIME_FORMAT: Final[str] = "%Y-%m-%dT%H:%M:%SZ"
 UTXOS_THREAD_TIMEOUT: Final[int] = 300
 
+# Chain-sync pipelining. Maximum number of nextBlock requests kept in
+# flight while catching up with the tip, and the distance to the tip (in
+# slots) at which the indexer goes back to one request at a time.
+CHAIN_SYNC_MAX_IN_FLIGHT: Final[int] = int(getenv("CHAIN_SYNC_MAX_IN_FLIGHT", "100"))
+CHAIN_SYNC_NEAR_TIP_SLOTS: Final[int] = int(getenv("CHAIN_SYNC_NEAR_TIP_SLOTS", "120"))
+
+# Average number of slots between two blocks on mainnet.
+SLOTS_PER_BLOCK: Final[int] = 20
+
+# Chain-sync checkpoints. The number of most recent points (slot and
+# block id) kept in the database to resume the chain-sync from, and the
+# maximum distance to the tip (in slots) the indexer will catch up on.
+# Beyond that it jumps to the tip and re-populates the UTxOs instead.
+CHAIN_SYNC_CHECKPOINTS: Final[int] = int(getenv("CHAIN_SYNC_CHECKPOINTS", "20"))
+CHAIN_SYNC_RESUME_MAX_GAP: Final[int] = int(
+    getenv("CHAIN_SYNC_RESUME_MAX_GAP", "86400")
+)
+
+# Undo journal retention in slots. Changes made by a block can only be
+# reverted while they are in the journal, this needs to cover the
+# deepest possible rollback (k=2160 blocks, ~12 hours on mainnet).
+JOURNAL_RETENTION_SLOTS: Final[int] = int(getenv("JOURNAL_RETENTION_SLOTS", "129600"))
+
+# Epochs are calculated from slots, check the calculation against
+# Ogmios every n-th epoch boundary crossed.
+EPOCH_CROSS_CHECK_EVERY: Final[int] = int(getenv("EPOCH_CROSS_CHECK_EVERY", "1"))
+
+# Time of a slot, from the Shelley era on slots last one second. The
+# reference is the first Shelley slot on mainnet and its POSIX time.
+SLOT_TIME_REFERENCE_SLOT: Final[int] = int(
+    getenv("SLOT_TIME_REFERENCE_SLOT", "4492800")
+)
+SLOT_TIME_REFERENCE_SECONDS: Final[int] = int(
+    getenv("SLOT_TIME_REFERENCE_SECONDS", "1596059091")
+)
+
+# Price history rollups. Price records are aggregated into per-minute
+# and per-hour OHLC buckets in the background every PRICE_ROLLUP_INTERVAL
+# seconds, PRICE_ROLLUP_BATCH records per transaction, once they are
+# older than the journal (i.e. can't be rolled back). Rolled up records
+# older than PRICE_RETENTION_DAYS are then deleted, 0 keeps them all.
+PRICE_ROLLUP_INTERVAL: Final[int] = int(getenv("PRICE_ROLLUP_INTERVAL", "60"))
+PRICE_ROLLUP_BATCH: Final[int] = int(getenv("PRICE_ROLLUP_BATCH", "5000"))
+PRICE_RETENTION_DAYS: Final[int] = int(getenv("PRICE_RETENTION_DAYS", "0"))
+
+# Also watch outputs to addresses that share the payment credential of a
+# watched address but have a different stake part, e.g. the same DEX
+# script delegated elsewhere.
+WATCH_PAYMENT_CREDENTIALS: Final[bool] = getenv(
+    "WATCH_PAYMENT_CREDENTIALS", "False"
+).lower() in ("true", "1", "t")
+
+# Number of watched addresses the populate_utxos sweep reads from Kupo
+# or Ogmios concurrently.
+POPULATE_UTXOS_CONCURRENCY: Final[int] = int(getenv("POPULATE_UTXOS_CONCURRENCY", "8"))
+
+# Without Kupo, the populate_utxos sweep reads the UTxOs of up to
+# OGMIOS_UTXO_QUERY_ADDRESSES watched addresses with one Ogmios query.
+# Lower it if the responses of the busiest addresses get too large.
+OGMIOS_UTXO_QUERY_ADDRESSES: Final[int] = int(
+    getenv("OGMIOS_UTXO_QUERY_ADDRESSES", "10")
+)
+
+# Read the watched addresses from Ogmios against one ledger state,
+# acquired at the tip for each populate_utxos sweep and released after
+# it, so that the pools of a sweep are all read at the same block.
+POPULATE_UTXOS_ACQUIRE_LEDGER_STATE: Final[bool] = getenv(
+    "POPULATE_UTXOS_ACQUIRE_LEDGER_STATE", "True"
+).lower() in ("true", "1", "t")
+
+# Incremental populate_utxos sweeps with Kupo. Every
+# KUPO_FULL_SWEEP_EVERY-th sweep reads the watched addresses in full,
+# the sweeps in between only read the UTxOs created since the last one
+# read at each address, less KUPO_SWEEP_OVERLAP_SLOTS to cover
+# rollbacks. 1 makes every sweep a full one.
+KUPO_FULL_SWEEP_EVERY: Final[int] = int(getenv("KUPO_FULL_SWEEP_EVERY", "1"))
+KUPO_SWEEP_OVERLAP_SLOTS: Final[int] = int(getenv("KUPO_SWEEP_OVERLAP_SLOTS", "600"))
+
+# SQLite storage profile applied to every database connection, one of
+# durable, balanced or fast, see database_initialization.
+DB_STORAGE_PROFILE: Final[str] = getenv("DB_STORAGE_PROFILE", "balanced")
+
+# The indexer's writes are applied by a single writer thread, the
+# operations queued together are committed in one transaction of up to
+# DB_WRITER_MAX_BATCH operations, see database_writer.
+DB_WRITER_MAX_BATCH: Final[int] = int(getenv("DB_WRITER_MAX_BATCH", "100"))
+
+# Open the database read-only in the submitter and read every pair of a
+# run in one read transaction, i.e. from the same snapshot. Under WAL
+# it never takes a write lock nor waits for the indexer. The price
+# records of pools read from the chain index aren't saved then.
+SUBMITTER_READ_ONLY: Final[bool] = getenv("SUBMITTER_READ_ONLY", "False").lower() in (
+    "true",
+    "1",
+    "t",
+)
+
 # Minimum ADA amount for an UTxO, otherwise ignore the UTxO
 MIN_ADA_AMOUNT = 5
 
@@ -22,6 +119,15 @@ base_path = workdir.parent if "/src" in str(workdir) else workdir
 
 FILES_PATH: Final[Path] = Path(getenv("FILES_PATH", base_path / "files"))
 CNT_DB_NAME: Final[Path] = Path(getenv("CNT_DB_NAME", base_path / "db" / "database.db"))
+
+# Optional database file of the price history (price, price_rollups),
+# attached to the CNT_DB_NAME connections as the history schema. Unset,
+# the history is kept in CNT_DB_NAME with the hot state.
+CNT_HISTORY_DB_NAME: Final[str] = getenv("CNT_HISTORY_DB_NAME", "")
+# Page cache of the history database in KiB, the history is appended to
+# and read in id order, the profile's cache is kept for the hot state.
+HISTORY_DB_CACHE_SIZE: Final[int] = int(getenv("HISTORY_DB_CACHE_SIZE", "2048"))
+
 LOG_FILE_PATH: Final[Path] = Path(
     getenv("LOG_FILE_PATH", base_path / "log" / "cnt-indexer.log")
 )
@@ -4,7 +4,7 @@
 
 import sqlite3
 from dataclasses import dataclass
-from typing import Optional
+from typing import Final, Optional
 
 try:
     import global_helpers as helpers
@@ -26,6 +26,116 @@ class DBObject:
     cursor: sqlite3.Cursor
 
 
+# Length of a transaction hash, stored as bytes.
+TX_HASH_SIZE: Final[int] = 32
+
+
+def tx_hash_to_db(tx_hash: str):
+    """Return a transaction hash as it is stored in the database, its
+    32 bytes. Values that aren't transaction hashes are stored as they
+    are.
+    """
+    if isinstance(tx_hash, str) and len(tx_hash) == TX_HASH_SIZE * 2:
+        try:
+            return bytes.fromhex(tx_hash)
+        except ValueError:
+            pass
+    return tx_hash
+
+
+def tx_hash_from_db(value) -> str:
+    """Return a transaction hash read from the database as hex."""
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+# Ids of the dimension records, as scalar subqueries so that statements
+# can take the names of pairs, sources and tokens.
+PAIR_ID: Final[str] = "(SELECT id FROM pairs WHERE name = ?)"
+SOURCE_ID: Final[str] = "(SELECT id FROM sources WHERE name = ?)"
+TOKEN_ID: Final[str] = "(SELECT id FROM tokens WHERE policy = ? AND name = ?)"
+
+# Tokens of a UTxO record.
+UTXO_TOKENS: Final[str] = (
+    "JOIN tokens AS token1 ON token1.id = utxos.token1_id "
+    "JOIN tokens AS token2 ON token2.id = utxos.token2_id"
+)
+
+
+INSERT_PAIR: Final[
+    str
+] = "INSERT INTO pairs(name) VALUES (?) ON CONFLICT(name) DO NOTHING"
+INSERT_SOURCE: Final[
+    str
+] = "INSERT INTO sources(name) VALUES (?) ON CONFLICT(name) DO NOTHING"
+INSERT_TOKEN: Final[str] = (
+    "INSERT INTO tokens(policy, name, decimals) VALUES (?, ?, ?) "
+    "ON CONFLICT(policy, name) DO UPDATE SET decimals = excluded.decimals "
+    "WHERE excluded.decimals IS NOT NULL AND excluded.decimals IS NOT decimals"
+)
+
+
+# Latest UTxO of the pairs and sources of the utxos matching
+# {condition}, upserted into latest_pool_state. max() makes SQLite read
+# the other columns from the row with the highest block height.
+REFRESH_LATEST_POOL_STATE: Final[str] = (
+    "INSERT INTO latest_pool_state(pair_id, source_id, utxo_id, block_height, "
+    "token1_id, token2_id, security_token_id, token1_amount, token2_amount, "
+    "tx_hash, output_index) "
+    "SELECT pair_id, source_id, id, max(block_height), token1_id, token2_id, "
+    "security_token_id, token1_amount, token2_amount, tx_hash, output_index "
+    "FROM utxos WHERE {condition} GROUP BY pair_id, source_id "
+    "ON CONFLICT(pair_id, source_id) DO UPDATE SET utxo_id = excluded.utxo_id, "
+    "block_height = excluded.block_height, token1_id = excluded.token1_id, "
+    "token2_id = excluded.token2_id, "
+    "security_token_id = excluded.security_token_id, "
+    "token1_amount = excluded.token1_amount, "
+    "token2_amount = excluded.token2_amount, tx_hash = excluded.tx_hash, "
+    "output_index = excluded.output_index"
+)
+
+
+def insert_pair(db: DBObject, name: str):
+    """Insert a pair into the pairs dimension if it isn't there yet."""
+    db.cursor.execute(INSERT_PAIR, (name,))
+
+
+def insert_source(db: DBObject, name: str):
+    """Insert a source into the sources dimension if it isn't there
+    yet.
+    """
+    db.cursor.execute(INSERT_SOURCE, (name,))
+
+
+def insert_token(db: DBObject, policy: str, name: str, decimals: Optional[int] = None):
+    """Insert a token into the tokens dimension if it isn't there yet,
+    or update its decimals if given.
+    """
+    db.cursor.execute(INSERT_TOKEN, (policy, name, decimals))
+
+
+def insert_tokens_pair(db: DBObject, tokens_pair: utxo_objects.TokensPair):
+    """Insert the pair, source and tokens of a configured tokens pair
+    into the dimensions.
+    """
+    insert_pair(db, tokens_pair.pair)
+    insert_source(db, tokens_pair.source)
+    insert_token(
+        db,
+        tokens_pair.token_1_policy,
+        tokens_pair.token_1_name,
+        tokens_pair.token_1_decimals,
+    )
+    insert_token(
+        db,
+        tokens_pair.token_2_policy,
+        tokens_pair.token_2_name,
+        tokens_pair.token_2_decimals,
+    )
+    insert_token(db, tokens_pair.security_token_policy, tokens_pair.security_token_name)
+
+
 def get_status(db: DBObject):
     """Retrieve status information from the database."""
     db.cursor.execute("SELECT current_block_slot FROM status")
@@ -39,7 +149,7 @@ def insert_status(db: DBObject, block: int):
     """Insert status information into the database."""
     db.cursor.execute(
         "INSERT INTO status(current_block_slot, date_time) VALUES(?, ?)",
-        (block, helpers.get_utc_timestamp_now()),
+        (block, helpers.get_timestamp_ms_now()),
     )
 
 
@@ -47,7 +157,36 @@ def update_status(db: DBObject, block: int):
     """Update status information in the database."""
     db.cursor.execute(
         "UPDATE status SET current_block_slot = ?, date_time = ?",
-        (block, helpers.get_utc_timestamp_now()),
+        (block, helpers.get_timestamp_ms_now()),
+    )
+
+
+def insert_checkpoint(db: DBObject, slot: int, block_id: str):
+    """Insert a chain-sync checkpoint into the database."""
+    db.cursor.execute(
+        "INSERT OR REPLACE INTO checkpoints(slot, block_id, date_time) "
+        "VALUES(?, ?, ?)",
+        (slot, block_id, helpers.get_timestamp_ms_now()),
+    )
+
+
+def select_checkpoints(db: DBObject, limit: int) -> list[dict]:
+    """Select the most recent chain-sync checkpoints from the database
+    as Ogmios points, most recent first.
+    """
+    db.cursor.execute(
+        "SELECT slot, block_id FROM checkpoints ORDER BY slot DESC LIMIT ?",
+        (limit,),
+    )
+    return [{"slot": row[0], "id": row[1]} for row in db.cursor.fetchall()]
+
+
+def prune_checkpoints(db: DBObject, keep: int):
+    """Delete all but the most recent chain-sync checkpoints."""
+    db.cursor.execute(
+        "DELETE FROM checkpoints WHERE slot < "
+        "(SELECT slot FROM checkpoints ORDER BY slot DESC LIMIT 1 OFFSET ?)",
+        (keep - 1,),
     )
 
 
@@ -87,13 +226,13 @@ def select_utxo_id(
 ) -> Optional[UTxOID]:
     """Select and return a UTxO ID from the database."""
     cursor.execute(
-        "SELECT id "
-        "FROM utxos "
-        "WHERE tx_hash = ? AND output_index = ? "
-        "AND (token1_policy = ? OR token2_policy = ?) "
-        "AND (token1_name = ? OR token2_name = ?)",
+        "SELECT utxos.id "
+        f"FROM utxos {UTXO_TOKENS} "
+        "WHERE utxos.tx_hash = ? AND utxos.output_index = ? "
+        "AND (token1.policy = ? OR token2.policy = ?) "
+        "AND (token1.name = ? OR token2.name = ?)",
         (
-            query_params.tx_id,
+            tx_hash_to_db(query_params.tx_id),
             query_params.tx_index,
             query_params.policy_id,
             query_params.policy_id,
@@ -163,24 +302,64 @@ def price_record_obj(
     )
 
 
-def insert_price_record(db: DBObject, price_record: PriceRecord):
-    """Insert a new price record into the database."""
+# A price record is identified by its pair, source, block and pool
+# amounts, see the price_pair index. Records written again when a block
+# is replayed, e.g. after a power loss lost the last commits of the hot
+# database but not of the history one, are ignored.
+INSERT_PRICE: Final[str] = (
+    "INSERT OR IGNORE INTO price(pair_id, epoch, block_height, price, "
+    "token1_amount, token2_amount, source_id, date_time) "
+    f"VALUES ({PAIR_ID}, ?, ?, ?, ?, ?, {SOURCE_ID}, ?)"
+)
+
+
+def _price_record_params(price_record: PriceRecord, date_time: int) -> tuple:
+    """Return the parameters of INSERT_PRICE for a price record."""
+    return (
+        price_record.pair,
+        price_record.epoch,
+        price_record.block_height,
+        price_record.price,
+        price_record.token_1_amount,
+        price_record.token_2_amount,
+        price_record.source,
+        date_time,
+    )
+
+
+def insert_price_record(db: DBObject, price_record: PriceRecord) -> Optional[int]:
+    """Insert a new price record into the database and return its
+    row id, or None if the same record is already saved and nothing
+    was inserted.
+
+    NB. the record is committed by the caller's transaction.
+    """
+    insert_pair(db, price_record.pair)
+    insert_source(db, price_record.source)
     db.cursor.execute(
-        "INSERT INTO price(pair, epoch, block_height, price, "
-        "token1_amount, token2_amount, source, date_time) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (
-            price_record.pair,
-            price_record.epoch,
-            price_record.block_height,
-            price_record.price,
-            price_record.token_1_amount,
-            price_record.token_2_amount,
-            price_record.source,
-            helpers.get_utc_timestamp_now(),
-        ),
+        INSERT_PRICE,
+        _price_record_params(price_record, helpers.get_timestamp_ms_now()),
+    )
+    if db.cursor.rowcount == 1:
+        return db.cursor.lastrowid
+    return None
+
+
+def insert_price_records(db: DBObject, price_records: list[PriceRecord]):
+    """Insert new price records into the database with executemany,
+    ignoring the ones already saved.
+
+    NB. the records are committed by the caller's transaction.
+    """
+    if not price_records:
+        return
+    db.cursor.executemany(INSERT_PAIR, [(record.pair,) for record in price_records])
+    db.cursor.executemany(INSERT_SOURCE, [(record.source,) for record in price_records])
+    date_time = helpers.get_timestamp_ms_now()
+    db.cursor.executemany(
+        INSERT_PRICE,
+        [_price_record_params(record, date_time) for record in price_records],
     )
-    db.connection.commit()
 
 
 @dataclass
@@ -240,14 +419,15 @@ def select_utxo_record_by_pair_source_and_policy(
     make this effort easier above.
     """
     db.cursor.execute(
-        "SELECT tx_hash, output_index, "
-        "token1_amount, token1_decimals, "
-        "token2_amount, token2_decimals, "
-        "token1_policy, token1_name, "
-        "token2_policy, token2_name "
-        "FROM utxos "
-        "WHERE pair = ? AND source = ? AND security_token_policy = ? "
-        "AND security_token_name = ? ORDER BY block_height DESC LIMIT 1",
+        "SELECT utxos.tx_hash, utxos.output_index, "
+        "utxos.token1_amount, token1.decimals, "
+        "utxos.token2_amount, token2.decimals, "
+        "token1.policy, token1.name, "
+        "token2.policy, token2.name "
+        f"FROM utxos {UTXO_TOKENS} "
+        f"WHERE utxos.pair_id = {PAIR_ID} AND utxos.source_id = {SOURCE_ID} "
+        f"AND utxos.security_token_id = {TOKEN_ID} "
+        "ORDER BY utxos.block_height DESC LIMIT 1",
         (
             query_obj.pair,
             query_obj.source,
@@ -258,7 +438,7 @@ def select_utxo_record_by_pair_source_and_policy(
     row = db.cursor.fetchone()
     try:
         res = UTxOSourcePolicyResults(
-            tx_hash=row[0],
+            tx_hash=tx_hash_from_db(row[0]),
             output_index=row[1],
             token_1_volume=row[2],
             token_1_decimals=row[3],
@@ -288,16 +468,21 @@ class UTxORecordResults:
     output_index: int  # [7]
 
 
+SELECT_UTXO_RECORD: Final[str] = (
+    "SELECT utxos.id, utxos.block_height, utxos.token1_amount, token1.decimals, "
+    "utxos.token2_amount, token2.decimals, utxos.tx_hash, utxos.output_index "
+    f"FROM utxos {UTXO_TOKENS}"
+)
+
+
 def select_utxo_record_by_source_address_and_policy(
     db: DBObject, query_obj: UTxOSourcePolicyQueryParams
 ):
     """Select a UTxO record by its source and security policy."""
     db.cursor.execute(
-        "SELECT id, block_height, token1_amount, token1_decimals, "
-        "token2_amount, token2_decimals, tx_hash, output_index "
-        "FROM utxos "
-        "WHERE pair = ? AND source = ? AND address = ? "
-        "AND security_token_policy = ? AND security_token_name = ?",
+        f"{SELECT_UTXO_RECORD} "
+        f"WHERE utxos.pair_id = {PAIR_ID} AND utxos.source_id = {SOURCE_ID} "
+        f"AND utxos.address = ? AND utxos.security_token_id = {TOKEN_ID}",
         (
             query_obj.pair,
             query_obj.source,
@@ -315,7 +500,7 @@ def select_utxo_record_by_source_address_and_policy(
             token_1_decimals=row[3],
             token_2_amount=row[4],
             token_2_decimals=row[5],
-            tx_hash=row[6],
+            tx_hash=tx_hash_from_db(row[6]),
             output_index=row[7],
         )
     except TypeError:
@@ -326,10 +511,7 @@ def select_utxo_record_by_source_address_and_policy(
 def select_utxo_by_id(db: DBObject, id_: int):
     """Given a UTxO ID attempt to find a match in the database."""
     db.cursor.execute(
-        "SELECT id, block_height, token1_amount, token1_decimals, "
-        "token2_amount, token2_decimals, tx_hash, output_index "
-        "FROM utxos "
-        "WHERE id = ?",
+        f"{SELECT_UTXO_RECORD} WHERE utxos.id = ?",
         (id_,),
     )
     row = db.cursor.fetchone()
@@ -341,7 +523,30 @@ def select_utxo_by_id(db: DBObject, id_: int):
             token_1_decimals=row[3],
             token_2_amount=row[4],
             token_2_decimals=row[5],
-            tx_hash=row[6],
+            tx_hash=tx_hash_from_db(row[6]),
+            output_index=row[7],
+        )
+    except TypeError:
+        return None
+    return res
+
+
+def select_utxo_by_outref(db: DBObject, tx_hash: str, output_index: int):
+    """Select the UTxO record of a transaction output."""
+    db.cursor.execute(
+        f"{SELECT_UTXO_RECORD} WHERE utxos.tx_hash = ? AND utxos.output_index = ?",
+        (tx_hash_to_db(tx_hash), output_index),
+    )
+    row = db.cursor.fetchone()
+    try:
+        res = UTxORecordResults(
+            row_id=row[0],
+            block_height=row[1],
+            token_1_amount=row[2],
+            token_1_decimals=row[3],
+            token_2_amount=row[4],
+            token_2_decimals=row[5],
+            tx_hash=tx_hash_from_db(row[6]),
             output_index=row[7],
         )
     except TypeError:
@@ -445,40 +650,77 @@ def complete_utxo_obj(
     )
 
 
+INSERT_UTXO: Final[str] = (
+    "INSERT INTO utxos(pair_id, source_id, price, block_height, address, "
+    "token1_id, token2_id, security_token_id, "
+    "token1_amount, token2_amount, tx_hash, output_index, date_time) "
+    f"VALUES ({PAIR_ID}, {SOURCE_ID}, ?, ?, ?, {TOKEN_ID}, {TOKEN_ID}, "
+    f"{TOKEN_ID}, ?, ?, ?, ?, ?)"
+)
+
+
 def insert_utxo_complete(db: DBObject, utxo_record: CompleteUTxO):
     """Insert an entirely new record for a UTxO in the database."""
-    db.cursor.execute(
-        "INSERT INTO utxos(pair, source, price, block_height, address, "
-        "token1_policy, token1_name, token1_decimals, "
-        "token2_policy, token2_name, token2_decimals, "
-        "security_token_policy, security_token_name, "
-        "token1_amount, token2_amount, tx_hash, output_index, date_time) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (
-            utxo_record.pair,
-            utxo_record.source,
-            utxo_record.price,
-            utxo_record.block_height,
-            utxo_record.address,
-            utxo_record.token_1_policy,
-            utxo_record.token_1_name,
-            utxo_record.token_1_decimals,
-            utxo_record.token_2_policy,
-            utxo_record.token_2_name,
-            utxo_record.token_2_decimals,
-            utxo_record.security_token_policy,
-            utxo_record.security_token_name,
-            utxo_record.token_1_amount,
-            utxo_record.token_2_amount,
-            utxo_record.tx_hash,
-            utxo_record.tx_index,
-            helpers.get_utc_timestamp_now(),
+    insert_utxos_complete(db, [utxo_record])
+
+
+def insert_utxos_complete(db: DBObject, utxo_records: list[CompleteUTxO]):
+    """Insert entirely new records for UTxOs in the database with
+    executemany, their dimensions first.
+    """
+    if not utxo_records:
+        return
+    db.cursor.executemany(INSERT_PAIR, [(record.pair,) for record in utxo_records])
+    db.cursor.executemany(INSERT_SOURCE, [(record.source,) for record in utxo_records])
+    tokens = []
+    for record in utxo_records:
+        tokens.append(
+            (record.token_1_policy, record.token_1_name, record.token_1_decimals)
+        )
+        tokens.append(
+            (record.token_2_policy, record.token_2_name, record.token_2_decimals)
+        )
+        tokens.append((record.security_token_policy, record.security_token_name, None))
+    db.cursor.executemany(INSERT_TOKEN, tokens)
+    date_time = helpers.get_timestamp_ms_now()
+    db.cursor.executemany(
+        INSERT_UTXO,
+        [
+            (
+                record.pair,
+                record.source,
+                record.price,
+                record.block_height,
+                record.address,
+                record.token_1_policy,
+                record.token_1_name,
+                record.token_2_policy,
+                record.token_2_name,
+                record.security_token_policy,
+                record.security_token_name,
+                record.token_1_amount,
+                record.token_2_amount,
+                tx_hash_to_db(record.tx_hash),
+                record.tx_index,
+                date_time,
+            )
+            for record in utxo_records
+        ],
+    )
+    db.cursor.executemany(
+        REFRESH_LATEST_POOL_STATE.format(
+            condition=f"pair_id = {PAIR_ID} AND source_id = {SOURCE_ID}"
         ),
+        dict.fromkeys((record.pair, record.source) for record in utxo_records),
     )
 
 
 @dataclass
 class PartialUTxO:
+    """Partial UTxO object, the values that change when a UTxO is
+    updated.
+    """
+
     block_height: int
     price: float
     token_1_amount: int
@@ -508,21 +750,63 @@ def partial_utxo_obj(
 
 def update_utxo_partial(db: DBObject, utxo_record: PartialUTxO, row_id: int):
     """Update partial UTxO records in the database."""
-    db.cursor.execute(
+    update_utxos_partial(db, [(utxo_record, row_id)])
+
+
+def update_utxos_partial(db: DBObject, updates: list[tuple[PartialUTxO, int]]):
+    """Update the partial UTxO records of the given rows with
+    executemany.
+    """
+    if not updates:
+        return
+    date_time = helpers.get_timestamp_ms_now()
+    db.cursor.executemany(
         "UPDATE utxos SET block_height = ?, price = ?, "
         "token1_amount = ?, token2_amount = ?, "
         "tx_hash = ?, output_index = ?, date_time = ? "
         "WHERE id = ?",
-        (
-            utxo_record.block_height,
-            utxo_record.price,
-            utxo_record.token_1_amount,
-            utxo_record.token_2_amount,
-            utxo_record.tx_hash,
-            utxo_record.tx_index,
-            helpers.get_utc_timestamp_now(),
-            row_id,
+        [
+            (
+                utxo_record.block_height,
+                utxo_record.price,
+                utxo_record.token_1_amount,
+                utxo_record.token_2_amount,
+                tx_hash_to_db(utxo_record.tx_hash),
+                utxo_record.tx_index,
+                date_time,
+                row_id,
+            )
+            for utxo_record, row_id in updates
+        ],
+    )
+    db.cursor.executemany(
+        REFRESH_LATEST_POOL_STATE.format(
+            condition="pair_id = (SELECT pair_id FROM utxos WHERE id = ?) "
+            "AND source_id = (SELECT source_id FROM utxos WHERE id = ?)"
         ),
+        dict.fromkeys((row_id, row_id) for _, row_id in updates),
+    )
+
+
+def select_utxo_partial_by_id(db: DBObject, id_: int) -> Optional[PartialUTxO]:
+    """Select the values of a UTxO record that change on update."""
+    db.cursor.execute(
+        "SELECT block_height, price, token1_amount, token2_amount, "
+        "tx_hash, output_index "
+        "FROM utxos "
+        "WHERE id = ?",
+        (id_,),
+    )
+    row = db.cursor.fetchone()
+    if not row:
+        return None
+    return partial_utxo_obj(
+        block_height=row[0],
+        price=row[1],
+        token_1_amount=row[2],
+        token_2_amount=row[3],
+        tx_hash=tx_hash_from_db(row[4]),
+        tx_index=row[5],
     )
 
 
@@ -532,6 +816,16 @@ def select_utxo_count_by_tx_info(db: DBObject, tx_hash: str, output_index: int):
     """
     db.cursor.execute(
         "SELECT count(*) FROM utxos WHERE tx_hash = ? AND output_index = ?",
-        (tx_hash, output_index),
+        (tx_hash_to_db(tx_hash), output_index),
     )
     return db.cursor.fetchone()[0]
+
+
+def delete_price_record(db: DBObject, id_: int):
+    """Delete a price record from the database."""
+    db.cursor.execute("DELETE FROM price WHERE id = ?", (id_,))
+
+
+def delete_checkpoints_after(db: DBObject, slot: int):
+    """Delete the chain-sync checkpoints after the given slot."""
+    db.cursor.execute("DELETE FROM checkpoints WHERE slot > ?", (slot,))
@@ -0,0 +1,277 @@
+"""Statements of the tables kept alongside the utxos and price records:
+the undo journal of the blocks, the latest pool state and the price
+rollups.
+"""
+
+# pylint: disable=R0902,R0913
+
+import json
+from dataclasses import asdict, astuple, dataclass
+from typing import Optional
+
+try:
+    import database_abstraction as dba
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import database_abstraction as dba
+    except ModuleNotFoundError:
+        from cnt_collector_node import database_abstraction as dba
+
+
+JOURNAL_INSERT = "insert"
+JOURNAL_UPDATE = "update"
+
+
+@dataclass
+class JournalEntry:
+    """Undo journal entry, records a change made by a block so that it
+    can be reverted if the block is rolled back.
+    """
+
+    id_: int
+    slot: int
+    table_name: str
+    row_id: int
+    action: str
+    previous: Optional[dict]
+
+
+def insert_journal_entry(
+    db: dba.DBObject,
+    slot: int,
+    table_name: str,
+    row_id: int,
+    action: str,
+    previous: Optional[dba.PartialUTxO] = None,
+):
+    """Record a change made by a block in the undo journal."""
+    db.cursor.execute(
+        "INSERT INTO journal(slot, table_name, row_id, action, previous) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            slot,
+            table_name,
+            row_id,
+            action,
+            json.dumps(asdict(previous)) if previous else None,
+        ),
+    )
+
+
+def select_journal_entries_after(db: dba.DBObject, slot: int) -> list[JournalEntry]:
+    """Select the journal entries recorded after the given slot, most
+    recent first, i.e. in the order they need to be reverted.
+
+    NB. entries are recorded in chain order, ordering by slot first lets
+    the journal_slot index provide the order.
+    """
+    db.cursor.execute(
+        "SELECT id, slot, table_name, row_id, action, previous "
+        "FROM journal WHERE slot > ? ORDER BY slot DESC, id DESC",
+        (slot,),
+    )
+    return [
+        JournalEntry(
+            id_=row[0],
+            slot=row[1],
+            table_name=row[2],
+            row_id=row[3],
+            action=row[4],
+            previous=json.loads(row[5]) if row[5] else None,
+        )
+        for row in db.cursor.fetchall()
+    ]
+
+
+def delete_journal_entries_after(db: dba.DBObject, slot: int):
+    """Delete the journal entries recorded after the given slot."""
+    db.cursor.execute("DELETE FROM journal WHERE slot > ?", (slot,))
+
+
+def select_first_missing_insert_slot(
+    db: dba.DBObject, table_name: str
+) -> Optional[int]:
+    """Select the slot of the first journaled insert into the given
+    table whose row is missing from it, None if there is none.
+    """
+    db.cursor.execute(
+        "SELECT min(slot) FROM journal WHERE table_name = ? AND action = ? "
+        f"AND row_id NOT IN (SELECT id FROM {table_name})",
+        (table_name, JOURNAL_INSERT),
+    )
+    return db.cursor.fetchone()[0]
+
+
+def prune_journal(db: dba.DBObject, slot: int):
+    """Delete the journal entries recorded before the given slot."""
+    db.cursor.execute("DELETE FROM journal WHERE slot < ?", (slot,))
+
+
+@dataclass
+class LatestPoolStates:
+    """Latest UTxO of every pair and source, keyed by pair, source,
+    security token policy and name, and the status block they're at.
+    """
+
+    status: Optional[int]
+    states: dict[tuple[str, str, str, str], dba.UTxOSourcePolicyResults]
+
+    def get(
+        self, query_obj: dba.UTxOSourcePolicyQueryParams
+    ) -> Optional[dba.UTxOSourcePolicyResults]:
+        """Return the latest UTxO of a pair and source, as
+        select_utxo_record_by_pair_source_and_policy.
+        """
+        return self.states.get(
+            (
+                query_obj.pair,
+                query_obj.source,
+                query_obj.security_token_policy,
+                query_obj.security_token_name,
+            )
+        )
+
+
+def select_latest_pool_states(db: dba.DBObject) -> LatestPoolStates:
+    """Select the latest UTxO of every pair and source in one query."""
+    status = dba.get_status(db)
+    db.cursor.execute(
+        "SELECT pairs.name, sources.name, security_token.policy, "
+        "security_token.name, latest_pool_state.tx_hash, "
+        "latest_pool_state.output_index, "
+        "latest_pool_state.token1_amount, token1.decimals, "
+        "latest_pool_state.token2_amount, token2.decimals, "
+        "token1.policy, token1.name, token2.policy, token2.name "
+        "FROM latest_pool_state "
+        "JOIN pairs ON pairs.id = latest_pool_state.pair_id "
+        "JOIN sources ON sources.id = latest_pool_state.source_id "
+        "JOIN tokens AS token1 ON token1.id = latest_pool_state.token1_id "
+        "JOIN tokens AS token2 ON token2.id = latest_pool_state.token2_id "
+        "JOIN tokens AS security_token "
+        "ON security_token.id = latest_pool_state.security_token_id"
+    )
+    states = {}
+    for row in db.cursor.fetchall():
+        states[tuple(row[:4])] = dba.UTxOSourcePolicyResults(
+            tx_hash=dba.tx_hash_from_db(row[4]),
+            output_index=row[5],
+            token_1_volume=row[6],
+            token_1_decimals=row[7],
+            token_2_volume=row[8],
+            token_2_decimals=row[9],
+            token_1_policy=row[10],
+            token_1_name=row[11],
+            token_2_policy=row[12],
+            token_2_name=row[13],
+        )
+    return LatestPoolStates(status=status, states=states)
+
+
+@dataclass
+class StoredPriceRecord:
+    """Price record as stored, read back to be rolled up."""
+
+    id_: int
+    pair_id: int
+    source_id: int
+    price: float
+    token_1_amount: int
+    token_2_amount: int
+    block_height: int
+    date_time: Optional[int]
+
+
+def select_price_records_after(
+    db: dba.DBObject, id_: int, limit: int
+) -> list[StoredPriceRecord]:
+    """Select the price records after the given id, oldest first."""
+    db.cursor.execute(
+        "SELECT id, pair_id, source_id, price, token1_amount, token2_amount, "
+        "block_height, date_time "
+        "FROM price WHERE id > ? ORDER BY id LIMIT ?",
+        (id_, limit),
+    )
+    return [StoredPriceRecord(*row) for row in db.cursor.fetchall()]
+
+
+def prune_price_records(db: dba.DBObject, id_: int, before: int, limit: int) -> int:
+    """Delete up to `limit` of the oldest price records, up to the given
+    id and recorded before the given time (milliseconds since the
+    epoch), and return how many were deleted.
+    """
+    db.cursor.execute(
+        "DELETE FROM price WHERE id IN "
+        "(SELECT id FROM price WHERE id <= ? ORDER BY id LIMIT ?) "
+        "AND coalesce(date_time, 0) < ?",
+        (id_, limit, before),
+    )
+    return db.cursor.rowcount
+
+
+@dataclass
+class PriceRollup:
+    """OHLC bucket of the price records of a pair on a source.
+
+    The token amounts are those of the last record of the bucket, the
+    open and close price ids order buckets merged from several batches.
+    """
+
+    bucket_seconds: int
+    pair_id: int
+    source_id: int
+    bucket_start: int
+    open: float
+    high: float
+    low: float
+    close: float
+    token_1_amount: int
+    token_2_amount: int
+    updates: int
+    open_price_id: int
+    close_price_id: int
+
+
+def upsert_price_rollups(db: dba.DBObject, rollups: list[PriceRollup]):
+    """Insert price rollup buckets or merge them into the existing
+    ones.
+    """
+    db.cursor.executemany(
+        "INSERT INTO price_rollups(bucket_seconds, pair_id, source_id, "
+        "bucket_start, open, high, low, close, token1_amount, token2_amount, "
+        "updates, open_price_id, close_price_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(bucket_seconds, pair_id, source_id, bucket_start) DO UPDATE SET "
+        "open = CASE WHEN excluded.open_price_id < open_price_id "
+        "THEN excluded.open ELSE open END, "
+        "high = max(high, excluded.high), "
+        "low = min(low, excluded.low), "
+        "close = CASE WHEN excluded.close_price_id > close_price_id "
+        "THEN excluded.close ELSE close END, "
+        "token1_amount = CASE WHEN excluded.close_price_id > close_price_id "
+        "THEN excluded.token1_amount ELSE token1_amount END, "
+        "token2_amount = CASE WHEN excluded.close_price_id > close_price_id "
+        "THEN excluded.token2_amount ELSE token2_amount END, "
+        "updates = updates + excluded.updates, "
+        "open_price_id = min(open_price_id, excluded.open_price_id), "
+        "close_price_id = max(close_price_id, excluded.close_price_id)",
+        [astuple(rollup) for rollup in rollups],
+    )
+
+
+def get_rollup_status(db: dba.DBObject) -> Optional[int]:
+    """Retrieve the id of the last price record rolled up."""
+    db.cursor.execute("SELECT last_price_id FROM rollup_status")
+    try:
+        return db.cursor.fetchone()[0]
+    except TypeError:
+        return None
+
+
+def insert_rollup_status(db: dba.DBObject, price_id: int):
+    """Insert the id of the last price record rolled up."""
+    db.cursor.execute("INSERT INTO rollup_status(last_price_id) VALUES(?)", (price_id,))
+
+
+def update_rollup_status(db: dba.DBObject, price_id: int):
+    """Update the id of the last price record rolled up."""
+    db.cursor.execute("UPDATE rollup_status SET last_price_id = ?", (price_id,))
@@ -2,100 +2,699 @@
 
 # pylint: disable=R0914
 
+import argparse
 import logging
 import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final, Optional
+
+try:
+    import config
+    import database_abstraction as dba
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import config
+        from src.cnt_collector_node import database_abstraction as dba
+    except ModuleNotFoundError:
+        from cnt_collector_node import config
+        from cnt_collector_node import database_abstraction as dba
 
 logger = logging.getLogger(__name__)
 
+# Schema of the history database when CNT_HISTORY_DB_NAME is set, see
+# attach_history, and the tables it holds.
+HISTORY_SCHEMA: Final = "history"
+HISTORY_TABLES: Final[tuple[str, ...]] = ("price", "price_rollups", "rollup_status")
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """SQLite pragmas applied to every connection.
+
+    cache_size is in KiB, mmap_size in bytes and busy_timeout in
+    milliseconds.
+    """
+
+    journal_mode: str
+    synchronous: str
+    cache_size: int
+    mmap_size: int
+    temp_store: str
+    busy_timeout: int
+
+    def pragmas(self, read_only: bool = False) -> list[str]:
+        """Return the PRAGMA statements of the profile.
+
+        The journal mode and synchronous settings are the writer's, a
+        read-only connection is made query only instead, see
+        apply_storage_profile.
+        """
+        writer = []
+        if not read_only:
+            writer = [
+                f"PRAGMA journal_mode = {self.journal_mode}",
+                f"PRAGMA synchronous = {self.synchronous}",
+            ]
+        return writer + [
+            # negative sizes are in KiB rather than pages.
+            f"PRAGMA cache_size = -{self.cache_size}",
+            f"PRAGMA mmap_size = {self.mmap_size}",
+            f"PRAGMA temp_store = {self.temp_store}",
+            f"PRAGMA busy_timeout = {self.busy_timeout}",
+        ]
+
+    def history_pragmas(self, read_only: bool = False) -> list[str]:
+        """Return the PRAGMA statements of the profile for the history
+        database, with a page cache of HISTORY_DB_CACHE_SIZE KiB.
+        """
+        cache = [
+            f"PRAGMA {HISTORY_SCHEMA}.cache_size = -{config.HISTORY_DB_CACHE_SIZE}"
+        ]
+        if read_only:
+            return cache
+        return [
+            f"PRAGMA {HISTORY_SCHEMA}.journal_mode = {self.journal_mode}",
+            f"PRAGMA {HISTORY_SCHEMA}.synchronous = {self.synchronous}",
+        ] + cache
+
+
+# All profiles use the write-ahead log so that the submitter can read
+# while the indexer writes. They differ in what a crash can cost:
+#
+#   durable:  every commit is synced to disk, nothing committed is lost
+#             even on power loss.
+#   balanced: the WAL is synced at checkpoints only, a power loss or OS
+#             crash can lose the last commits but never corrupts the
+#             database. Safe against the indexer itself crashing.
+#   fast:     nothing is synced, a power loss or OS crash can corrupt
+#             the database. The utxos table can be re-populated from
+#             the chain but the price history cannot.
+STORAGE_PROFILES: Final[dict[str, StorageProfile]] = {
+    "durable": StorageProfile(
+        journal_mode="WAL",
+        synchronous="FULL",
+        cache_size=8192,
+        mmap_size=0,
+        temp_store="DEFAULT",
+        busy_timeout=10000,
+    ),
+    "balanced": StorageProfile(
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        cache_size=32768,
+        mmap_size=268435456,
+        temp_store="MEMORY",
+        busy_timeout=10000,
+    ),
+    "fast": StorageProfile(
+        journal_mode="WAL",
+        synchronous="OFF",
+        cache_size=131072,
+        mmap_size=1073741824,
+        temp_store="MEMORY",
+        busy_timeout=10000,
+    ),
+}
+
+
+def storage_profile(name: Optional[str] = None) -> StorageProfile:
+    """Return the named storage profile, by default the configured one."""
+    name = name or config.DB_STORAGE_PROFILE
+    try:
+        return STORAGE_PROFILES[name]
+    except KeyError as err:
+        raise ValueError(
+            f"unknown storage profile '{name}', use one of: "
+            f"{', '.join(STORAGE_PROFILES)}"
+        ) from err
+
+
+def apply_storage_profile(
+    conn: sqlite3.Connection, profile: StorageProfile, read_only: bool = False
+) -> None:
+    """Apply the pragmas of a storage profile to a connection, and to
+    its history database if attached.
+    """
+    pragmas = profile.pragmas(read_only=read_only)
+    history = has_history(conn)
+    if history:
+        pragmas += profile.history_pragmas(read_only=read_only)
+    cur = conn.cursor()
+    for pragma in pragmas:
+        cur.execute(pragma)
+    if history:
+        # setting temp_store drops the temporary objects, and a query
+        # only connection can't create them.
+        cur.execute(_statement(CREATE_PRICE_RECORDS_TEMP_VIEW))
+    if read_only:
+        cur.execute("PRAGMA query_only = ON")
+    cur.close()
+
+
+def _read_only_uri(db_name: str) -> str:
+    """Return the read-only URI of a database file."""
+    return f"{Path(db_name).resolve().as_uri()}?mode=ro"
+
+
+def connect(
+    db_name: str,
+    profile: Optional[str] = None,
+    read_only: bool = False,
+    history_db_name: Optional[str] = None,
+) -> sqlite3.Connection:
+    """Connect to the database with the pragmas of a storage profile,
+    by default the configured one, attaching the history database, by
+    default CNT_HISTORY_DB_NAME if set.
+
+    A read-only connection opens the database through a read-only URI,
+    it never takes a write lock and, under WAL, never waits for the
+    writer.
+    """
+    if history_db_name is None:
+        history_db_name = config.CNT_HISTORY_DB_NAME
+    if read_only:
+        conn = sqlite3.connect(_read_only_uri(db_name), uri=True)
+    else:
+        conn = sqlite3.connect(db_name)
+    if history_db_name:
+        attach_history(conn, history_db_name, read_only=read_only)
+    apply_storage_profile(conn, storage_profile(profile), read_only=read_only)
+    return conn
+
+
+def attach_history(
+    conn: sqlite3.Connection, history_db_name: str, read_only: bool = False
+) -> None:
+    """Attach the history database to a connection.
+
+    Unqualified table names are looked up in the main database first,
+    the statements of database_abstraction use the history tables once
+    _create_database moved them out of the main database. A view cannot
+    refer to another database, price_records is a temporary view of the
+    connection instead, created by apply_storage_profile.
+    """
+    if read_only:
+        history_db_name = _read_only_uri(history_db_name)
+    conn.execute(f"ATTACH DATABASE ? AS {HISTORY_SCHEMA}", (str(history_db_name),))
+
+
+def has_history(conn: sqlite3.Connection) -> bool:
+    """Return whether the history database is attached to a connection."""
+    return any(row[1] == HISTORY_SCHEMA for row in conn.execute("PRAGMA database_list"))
+
+
+def checkpoint_history(conn: sqlite3.Connection) -> None:
+    """Checkpoint the write-ahead log of the history database, if
+    attached, and truncate it.
+
+    The automatic checkpoints run on commit, when the log of the
+    database written to reaches its threshold. The history database is
+    checkpointed on its own schedule, between the price rollups.
+    """
+    if has_history(conn):
+        conn.execute(f"PRAGMA {HISTORY_SCHEMA}.wal_checkpoint(TRUNCATE)")
+
+
+# Dimension tables, the pairs, sources and tokens (including security
+# tokens) the utxos and price records refer to by id. They hold a row
+# per configured value so they stay small and cached.
+CREATE_PAIRS_TABLE: Final = """CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY NOT NULL,
+    name TEXT NOT NULL UNIQUE
+)
+"""
+
+CREATE_SOURCES_TABLE: Final = """CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY NOT NULL,
+    name TEXT NOT NULL UNIQUE
+)
+"""
+
+CREATE_TOKENS_TABLE: Final = """CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY NOT NULL,
+    policy TEXT NOT NULL,
+    name TEXT NOT NULL,
+    decimals INTEGER,
+    UNIQUE(policy, name)
+)
+"""
+
+CREATE_PRICE_TABLE: Final = """CREATE TABLE IF NOT EXISTS price (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    pair_id INTEGER NOT NULL REFERENCES pairs(id),
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    price FLOAT NOT NULL,
+    token1_amount INTEGER NOT NULL,
+    token2_amount INTEGER NOT NULL,
+    epoch INTEGER NOT NULL,
+    block_height INTEGER NOT NULL,
+    date_time INTEGER
+)
+"""
+
+CREATE_STATUS_TABLE: Final = """CREATE TABLE IF NOT EXISTS status (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    current_block_slot INTEGER NOT NULL,
+    date_time INTEGER
+)
+"""
+
+CREATE_UTXOS_TABLE: Final = """CREATE TABLE IF NOT EXISTS utxos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    pair_id INTEGER NOT NULL REFERENCES pairs(id),
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    price FLOAT NOT NULL,
+    block_height INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    token1_id INTEGER NOT NULL REFERENCES tokens(id),
+    token2_id INTEGER NOT NULL REFERENCES tokens(id),
+    security_token_id INTEGER NOT NULL REFERENCES tokens(id),
+    token1_amount INTEGER NOT NULL,
+    token2_amount INTEGER NOT NULL,
+    tx_hash BLOB NOT NULL,
+    output_index INTEGER NOT NULL,
+    date_time INTEGER
+)
+"""
+
+# Latest UTxO of each pair on each source, maintained by
+# database_abstraction in the transactions writing the utxos table so
+# that the submitter reads all its feeds with one query.
+CREATE_LATEST_POOL_STATE_TABLE: Final = """\
+CREATE TABLE IF NOT EXISTS latest_pool_state (
+    pair_id INTEGER NOT NULL REFERENCES pairs(id),
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    utxo_id INTEGER NOT NULL,
+    block_height INTEGER NOT NULL,
+    token1_id INTEGER NOT NULL REFERENCES tokens(id),
+    token2_id INTEGER NOT NULL REFERENCES tokens(id),
+    security_token_id INTEGER NOT NULL REFERENCES tokens(id),
+    token1_amount INTEGER NOT NULL,
+    token2_amount INTEGER NOT NULL,
+    tx_hash BLOB NOT NULL,
+    output_index INTEGER NOT NULL,
+    PRIMARY KEY (pair_id, source_id)
+) WITHOUT ROWID
+"""
+
+CREATE_CHECKPOINTS_TABLE: Final = """CREATE TABLE IF NOT EXISTS checkpoints (
+    slot INTEGER PRIMARY KEY NOT NULL,
+    block_id TEXT NOT NULL,
+    date_time INTEGER
+)
+"""
+
+CREATE_JOURNAL_TABLE: Final = """CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    slot INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    previous TEXT
+)
+"""
+
+# Price history rolled up into OHLC buckets per pair and source, see
+# price_rollups. bucket_start is in milliseconds since the epoch, of the
+# block time of the price records it aggregates.
+CREATE_PRICE_ROLLUPS_TABLE: Final = """CREATE TABLE IF NOT EXISTS price_rollups (
+    bucket_seconds INTEGER NOT NULL,
+    pair_id INTEGER NOT NULL REFERENCES pairs(id),
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    bucket_start INTEGER NOT NULL,
+    open FLOAT NOT NULL,
+    high FLOAT NOT NULL,
+    low FLOAT NOT NULL,
+    close FLOAT NOT NULL,
+    token1_amount INTEGER NOT NULL,
+    token2_amount INTEGER NOT NULL,
+    updates INTEGER NOT NULL,
+    open_price_id INTEGER NOT NULL,
+    close_price_id INTEGER NOT NULL,
+    PRIMARY KEY (bucket_seconds, pair_id, source_id, bucket_start)
+) WITHOUT ROWID
+"""
+
+CREATE_ROLLUP_STATUS_TABLE: Final = """CREATE TABLE IF NOT EXISTS rollup_status (
+    last_price_id INTEGER NOT NULL
+)
+"""
+
+# Transaction hashes are stored as 32 bytes and timestamps as
+# milliseconds since the epoch, database_abstraction converts them.
+TX_HASH_HEX: Final = (
+    "CASE WHEN typeof({column}) = 'blob' THEN lower(hex({column})) ELSE {column} END"
+)
+DATE_TIME_TEXT: Final = "strftime('%Y-%m-%dT%H:%M:%SZ', {column} / 1000, 'unixepoch')"
+DATE_TIME_MS: Final = "CAST(strftime('%s', {column}) AS INTEGER) * 1000"
+
+# The utxos and price records with the names of their pairs, sources
+# and tokens, hex transaction hashes and formatted timestamps, as laid
+# out before the dimension tables, for reading the database by hand or
+# from other tools.
+CREATE_UTXO_RECORDS_VIEW: Final = f"""CREATE VIEW IF NOT EXISTS utxo_records AS
+    SELECT utxos.id, pairs.name AS pair, sources.name AS source, utxos.price,
+    utxos.block_height, utxos.address,
+    token1.policy AS token1_policy, token1.name AS token1_name,
+    token1.decimals AS token1_decimals,
+    token2.policy AS token2_policy, token2.name AS token2_name,
+    token2.decimals AS token2_decimals,
+    security_token.policy AS security_token_policy,
+    security_token.name AS security_token_name,
+    utxos.token1_amount, utxos.token2_amount,
+    {TX_HASH_HEX.format(column='utxos.tx_hash')} AS tx_hash, utxos.output_index,
+    {DATE_TIME_TEXT.format(column='utxos.date_time')} AS date_time
+    FROM utxos
+    JOIN pairs ON pairs.id = utxos.pair_id
+    JOIN sources ON sources.id = utxos.source_id
+    JOIN tokens AS token1 ON token1.id = utxos.token1_id
+    JOIN tokens AS token2 ON token2.id = utxos.token2_id
+    JOIN tokens AS security_token ON security_token.id = utxos.security_token_id
+"""
+
+CREATE_PRICE_RECORDS_VIEW: Final = f"""CREATE VIEW IF NOT EXISTS price_records AS
+    SELECT price.id, pairs.name AS pair, sources.name AS source, price.price,
+    price.token1_amount, price.token2_amount, price.epoch, price.block_height,
+    {DATE_TIME_TEXT.format(column='price.date_time')} AS date_time
+    FROM price
+    JOIN pairs ON pairs.id = price.pair_id
+    JOIN sources ON sources.id = price.source_id
+"""
+
+CREATE_PRICE_RECORDS_TEMP_VIEW: Final = CREATE_PRICE_RECORDS_VIEW.replace(
+    "CREATE VIEW", "CREATE TEMP VIEW", 1
+)
 
-def create_database(db_name: str) -> None:
+# The utxos and latest_pool_state tables, dropped and re-created empty
+# when the indexer cannot resume from its checkpoints.
+DROP_UTXOS_TABLES: Final[list[str]] = [
+    "DROP TABLE IF EXISTS utxos",
+    "DROP TABLE IF EXISTS latest_pool_state",
+]
+
+# The indexes are designed from the query plans of the statements in
+# database_abstraction and database_derived, see tests/test_query_plans.py.
+UTXOS_SCHEMA: Final[list[str]] = [
+    CREATE_UTXOS_TABLE,
+    CREATE_LATEST_POOL_STATE_TABLE,
+    # UTxOs spent by a transaction input and their count, the id (rowid)
+    # is part of every index so the lookups never read the table.
+    "CREATE INDEX IF NOT EXISTS utxos_tx_output ON utxos("
+    "tx_hash, output_index, token1_id, token2_id)",
+    # Latest UTxO of a pair on a source, by address or not, in block
+    # order so the ORDER BY doesn't need sorting.
+    "CREATE INDEX IF NOT EXISTS utxos_pair_source ON utxos("
+    "pair_id, source_id, security_token_id, block_height)",
+    "CREATE INDEX IF NOT EXISTS utxos_date_time ON utxos(date_time)",
+]
+
+# Migrations of existing databases. The n-th list of statements upgrades
+# a database from version n to n + 1, the version is kept in the
+# user_version pragma. Migrations run before _create_database creates
+# the missing tables and indexes, new databases start at the current
+# version.
+MIGRATIONS: Final[list[list[str]]] = [
+    # 1: single column utxos indexes, superseded by the composite ones.
+    [
+        "DROP INDEX IF EXISTS utxos_name",
+        "DROP INDEX IF EXISTS utxos_token1_policy",
+        "DROP INDEX IF EXISTS utxos_token2_policy",
+        "DROP INDEX IF EXISTS utxos_security_token_policy",
+        "DROP INDEX IF EXISTS utxos_tx_hash",
+    ],
+    # 2: pairs, sources and tokens moved to dimension tables. The price
+    # history is converted keeping its ids, the utxos table is dropped
+    # to be re-populated from the chain, with the journal entries of
+    # its rows.
+    [
+        CREATE_PAIRS_TABLE,
+        CREATE_SOURCES_TABLE,
+        CREATE_TOKENS_TABLE,
+        CREATE_JOURNAL_TABLE,
+        "ALTER TABLE price RENAME TO price_v1",
+        CREATE_PRICE_TABLE,
+        "INSERT OR IGNORE INTO pairs(name) SELECT DISTINCT pair FROM price_v1",
+        "INSERT OR IGNORE INTO sources(name) SELECT DISTINCT source FROM price_v1",
+        "INSERT INTO price(id, pair_id, source_id, price, token1_amount, "
+        "token2_amount, epoch, block_height, date_time) "
+        "SELECT price_v1.id, pairs.id, sources.id, price_v1.price, "
+        "price_v1.token1_amount, price_v1.token2_amount, price_v1.epoch, "
+        "price_v1.block_height, price_v1.date_time "
+        "FROM price_v1 "
+        "JOIN pairs ON pairs.name = price_v1.pair "
+        "JOIN sources ON sources.name = price_v1.source",
+        "DROP TABLE price_v1",
+        "DROP TABLE IF EXISTS utxos",
+        "DELETE FROM journal WHERE table_name = 'utxos'",
+    ],
+    # 3: storage format v2, transaction hashes as 32 bytes and timestamps
+    # as milliseconds since the epoch. The declared types of existing
+    # columns are kept, SQLite stores the converted values as they are.
+    [
+        CREATE_STATUS_TABLE,
+        CREATE_UTXOS_TABLE,
+        CREATE_CHECKPOINTS_TABLE,
+        "UPDATE utxos SET tx_hash = tx_hash_to_db(tx_hash) "
+        "WHERE typeof(tx_hash) = 'text'",
+    ]
+    + [
+        f"UPDATE {table} SET date_time = {DATE_TIME_MS.format(column='date_time')} "
+        "WHERE typeof(date_time) = 'text'"
+        for table in ("price", "status", "utxos", "checkpoints")
+    ]
+    + [
+        "DROP VIEW IF EXISTS utxo_records",
+        "DROP VIEW IF EXISTS price_records",
+    ],
+    # 4: latest UTxO of each pair on each source, from the kept utxos.
+    [
+        CREATE_LATEST_POOL_STATE_TABLE,
+        dba.REFRESH_LATEST_POOL_STATE.format(condition="true"),
+    ],
+    # 5: price records unique on their pair, source, block and amounts,
+    # the records saved again by replayed blocks are dropped. The
+    # price_pair index is created again as unique.
+    [
+        "DELETE FROM price WHERE id NOT IN (SELECT min(id) FROM price "
+        "GROUP BY pair_id, source_id, block_height, token1_amount, token2_amount)",
+        "DROP INDEX IF EXISTS price_pair",
+    ],
+]
+
+SCHEMA_VERSION: Final[int] = len(MIGRATIONS)
+
+
+def _statement(sql: str) -> str:
+    """Return a statement on a single line."""
+    return " ".join(sql.split())
+
+
+def _in_history(sql: str) -> str:
+    """Return a CREATE ... IF NOT EXISTS statement creating its table or
+    index in the history database.
+    """
+    return sql.replace("IF NOT EXISTS ", f"IF NOT EXISTS {HISTORY_SCHEMA}.", 1)
+
+
+def move_history_tables(conn: sqlite3.Connection) -> None:
+    """Move the history tables left in the main database to the
+    attached history database, keeping the ids of their rows.
+
+    The history tables must have been created. The rows are copied
+    ignoring the ones already there, so that a move interrupted between
+    the two databases is completed by the next one.
+    """
+    cur = conn.cursor()
+    cur.execute("DROP VIEW IF EXISTS main.price_records")
+    for table in HISTORY_TABLES:
+        in_main = cur.execute(
+            "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+            (table,),
+        ).fetchone()
+        if not in_main:
+            continue
+        logger.info("moving the %s table to the history database", table)
+        cur.execute(
+            f"INSERT OR IGNORE INTO {HISTORY_SCHEMA}.{table} SELECT * FROM main.{table}"
+        )
+        cur.execute(f"DROP TABLE main.{table}")
+    conn.commit()
+
+
+def migrate_database(conn: sqlite3.Connection) -> int:
+    """Apply the migrations a database hasn't been through yet and
+    return its schema version.
+
+    Each migration, with its new version, is applied in a transaction
+    of its own. sqlite3 would otherwise commit the DDL statements as
+    they run, leaving a migration interrupted halfway that cannot be
+    applied again.
+    """
+    conn.create_function("tx_hash_to_db", 1, dba.tx_hash_to_db, deterministic=True)
+    conn.commit()
+    cur = conn.cursor()
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    for idx, migration in enumerate(MIGRATIONS[version:], start=version):
+        logger.info("migrating the database to version %s", idx + 1)
+        cur.execute("BEGIN")
+        try:
+            for statement in migration:
+                cur.execute(_statement(statement))
+            cur.execute(f"PRAGMA user_version = {idx + 1}")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+    return max(version, SCHEMA_VERSION)
+
+
+def create_database(db_name: str, drop_utxos: bool = True) -> None:
     """Create the sqlite3 database and tables if they don't exist"""
-    conn = sqlite3.connect(db_name)
-    _create_database(conn)
+    conn = connect(db_name)
+    _create_database(conn, drop_utxos=drop_utxos)
     conn.close()
 
 
-def _create_database(conn: sqlite3.Connection) -> None:
-    """Create the underlying database structure given a database
-    connection."""
-
-    drop_utxos = "DROP TABLE IF EXISTS utxos"
-
-    create_price_table = """CREATE TABLE IF NOT EXISTS price (
-        id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
-        pair TEXT NOT NULL,
-        source TEXT NOT NULL,
-        price FLOAT NOT NULL,
-        token1_amount INTEGER NOT NULL,
-        token2_amount INTEGER NOT NULL,
-        epoch INTEGER NOT NULL,
-        block_height INTEGER NOT NULL,
-        date_time timestamp
-    )
-    """
+def reset_utxos(conn: sqlite3.Connection) -> None:
+    """Re-create the utxos tables empty, to be re-populated, and delete
+    the journal entries of their rows.
 
-    create_status_table = """CREATE TABLE IF NOT EXISTS status (
-        id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
-        current_block_slot INTEGER NOT NULL,
-        date_time timestamp
-    )
+    NB. the tables are reset in the caller's transaction.
     """
+    for statement in DROP_UTXOS_TABLES + UTXOS_SCHEMA:
+        conn.execute(_statement(statement))
+    conn.execute("DELETE FROM journal WHERE table_name = 'utxos'")
 
-    create_utxos_table = """CREATE TABLE IF NOT EXISTS utxos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
-                pair TEXT NOT NULL,
-                source TEXT NOT NULL,
-                price FLOAT NOT NULL,
-                block_height INTEGER NOT NULL,
-                address TEXT NOT NULL,
-                token1_policy TEXT NOT NULL,
-                token1_name TEXT NOT NULL,
-                token1_decimals INTEGER NOT NULL,
-                token2_policy TEXT NOT NULL,
-                token2_name TEXT NOT NULL,
-                token2_decimals INTEGER NOT NULL,
-                security_token_policy TEXT NOT NULL,
-                security_token_name TEXT NOT NULL,
-                token1_amount INTEGER NOT NULL,
-                token2_amount INTEGER NOT NULL,
-                tx_hash TEXT NOT NULL,
-                output_index INTEGER NOT NULL,
-                date_time timestamp
-                )"""
-
-    index_price_pair = "CREATE INDEX IF NOT EXISTS price_pair ON price(pair)"
-    index_price_epoch = "CREATE INDEX IF NOT EXISTS price_epoch ON price(epoch)"
 
-    index_utxos_name = "CREATE INDEX IF NOT EXISTS utxos_name ON utxos(pair, source)"
-    index_utxos_token1_policy = (
-        "CREATE INDEX IF NOT EXISTS utxos_token1_policy ON utxos(token1_policy)"
-    )
-    index_utxos_token2_policy = (
-        "CREATE INDEX IF NOT EXISTS utxos_token2_policy ON utxos(token2_policy)"
-    )
-    index_utxos_security_policy = "CREATE INDEX IF NOT EXISTS utxos_security_token_policy ON utxos(security_token_policy)"
-    index_utxos_tx_hash = "CREATE INDEX IF NOT EXISTS utxos_tx_hash ON utxos(tx_hash)"
-    index_utxos_data_time = (
-        "CREATE INDEX IF NOT EXISTS utxos_date_time ON utxos(date_time)"
+def _create_database(conn: sqlite3.Connection, drop_utxos: bool = True) -> None:
+    """Create the underlying database structure given a database
+    connection.
+
+    The utxos table is dropped by default so that it is re-populated,
+    it is kept when the indexer can resume from its checkpoints.
+    Existing databases are migrated to the current schema first.
+    """
+
+    # The indexes are designed from the query plans of the statements in
+    # database_abstraction and database_derived, see
+    # tests/test_query_plans.py.
+    #
+    # Price history of a pair on a source, unique so that replayed
+    # blocks don't save their price records twice, see INSERT_PRICE.
+    index_price_pair = (
+        "CREATE UNIQUE INDEX IF NOT EXISTS price_pair ON price("
+        "pair_id, source_id, block_height, token1_amount, token2_amount)"
     )
+    index_price_epoch = "CREATE INDEX IF NOT EXISTS price_epoch ON price(epoch)"
+    index_journal_slot = "CREATE INDEX IF NOT EXISTS journal_slot ON journal(slot)"
 
     schema = [
-        drop_utxos,
-        create_price_table,
-        create_status_table,
-        create_utxos_table,
+        CREATE_PAIRS_TABLE,
+        CREATE_SOURCES_TABLE,
+        CREATE_TOKENS_TABLE,
+        CREATE_STATUS_TABLE,
+        CREATE_CHECKPOINTS_TABLE,
+        CREATE_JOURNAL_TABLE,
+        *UTXOS_SCHEMA,
+        CREATE_UTXO_RECORDS_VIEW,
+        index_journal_slot,
+    ]
+    # The price history, in the history database if attached.
+    history_schema = [
+        CREATE_PRICE_TABLE,
+        CREATE_PRICE_ROLLUPS_TABLE,
+        CREATE_ROLLUP_STATUS_TABLE,
         index_price_pair,
         index_price_epoch,
-        index_utxos_name,
-        index_utxos_token1_policy,
-        index_utxos_token2_policy,
-        index_utxos_security_policy,
-        index_utxos_tx_hash,
-        index_utxos_data_time,
     ]
+    history = has_history(conn)
+    if history:
+        history_schema = [_in_history(item) for item in history_schema]
+    else:
+        history_schema.append(CREATE_PRICE_RECORDS_VIEW)
 
     cur = conn.cursor()
-    for item in schema:
-        cur.execute(item.strip().replace("  ", " ").replace("\n", " "))
+    if drop_utxos:
+        for statement in DROP_UTXOS_TABLES:
+            cur.execute(statement)
+    price_table = cur.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'price'"
+    ).fetchone()
+    if not price_table:
+        # nothing to migrate.
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    migrate_database(conn)
+    for item in schema + history_schema:
+        cur.execute(_statement(item))
+    if history:
+        move_history_tables(conn)
 
     logger.info("database initialization complete")
+
+
+def migrate(
+    db_name: str, vacuum: bool = True, history_db_name: Optional[str] = None
+) -> int:
+    """Migrate an existing database to the current schema in one go and
+    return its schema version.
+
+    With a history database, by default CNT_HISTORY_DB_NAME if set, the
+    price history is moved to it. The database files are rewritten
+    afterwards (VACUUM) to give back the space freed by the migrations.
+    """
+    if not Path(db_name).is_file():
+        raise FileNotFoundError(f"database not found: {db_name}")
+    conn = connect(db_name, history_db_name=history_db_name)
+    try:
+        _create_database(conn, drop_utxos=False)
+        if vacuum:
+            logger.info("rewriting the database file")
+            conn.execute("VACUUM")
+            if has_history(conn):
+                conn.execute(f"VACUUM {HISTORY_SCHEMA}")
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    """Primary entry point for this script."""
+    parser = argparse.ArgumentParser(
+        prog="cnt-migrate-db",
+        description="Migrate a CNT indexer database to the current schema",
+    )
+    parser.add_argument(
+        "--database-location",
+        "-d",
+        help="database location to migrate",
+        default=config.CNT_DB_NAME,
+        type=str,
+    )
+    parser.add_argument(
+        "--history-database-location",
+        help="history database to move the price history to",
+        default=config.CNT_HISTORY_DB_NAME,
+        type=str,
+    )
+    parser.add_argument(
+        "--no-vacuum",
+        help="don't rewrite the database file after migrating it",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    size = Path(args.database_location).stat().st_size
+    version = migrate(
+        args.database_location,
+        vacuum=not args.no_vacuum,
+        history_db_name=args.history_database_location,
+    )
+    print(
+        f"{args.database_location}: schema version {version}, "
+        f"{size} bytes -> {Path(args.database_location).stat().st_size} bytes"
+    )
+
+
+if __name__ == "__main__":
+    main()
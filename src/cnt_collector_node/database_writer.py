@@ -0,0 +1,259 @@
+"""Single writer of the indexer database.
+
+The block parser and the populate_utxos thread don't write to the
+database themselves: they submit write operations, functions taking a
+DBObject, to one DatabaseWriter. It owns the only write connection and
+applies the operations from its own thread, in the order they were
+submitted. Operations queued together are grouped into one transaction,
+each in a savepoint so that a failing operation is rolled back alone,
+and committed at once. Writers never contend for the SQLite write lock
+and a group shares a single sync to disk.
+
+If the writer thread dies, e.g. when the database cannot be opened, the
+operations waiting in the queue fail with the error and submit raises a
+WriterError from then on.
+
+The queue depth and commit latency are kept in WriterStats and logged
+with the block statistics.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+try:
+    import config
+    import database_abstraction as dba
+    import database_initialization
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import config
+        from src.cnt_collector_node import database_abstraction as dba
+        from src.cnt_collector_node import database_initialization
+    except ModuleNotFoundError:
+        from cnt_collector_node import config
+        from cnt_collector_node import database_abstraction as dba
+        from cnt_collector_node import database_initialization
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WriterStats:
+    """Metrics of the database writer."""
+
+    operations: int = 0
+    failed_operations: int = 0
+    transactions: int = 0
+    max_queue_depth: int = 0
+    commit_seconds: float = 0.0
+    max_commit_seconds: float = 0.0
+
+    @property
+    def mean_commit_ms(self) -> float:
+        """Mean commit latency, in milliseconds."""
+        if not self.transactions:
+            return 0.0
+        return self.commit_seconds / self.transactions * 1000
+
+
+class WriterError(Exception):
+    """The database writer thread is dead."""
+
+
+@dataclass
+class _Operation:
+    """Write operation waiting in the queue."""
+
+    function: Callable
+    args: tuple
+    kwargs: dict
+    future: Future
+
+
+# Queued by stop() after the last operation.
+_STOP: Any = object()
+
+
+class DatabaseWriter:
+    """Apply the write operations submitted by any thread on a single
+    connection, grouped into transactions of up to `max_batch`
+    operations.
+    """
+
+    def __init__(self, db_name: str, max_batch: Optional[int] = None):
+        self.db_name = db_name
+        self.max_batch = max_batch or config.DB_WRITER_MAX_BATCH
+        self.stats = WriterStats()
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        # set under the lock when the writer thread dies, so that no
+        # operation is queued after the queue is drained.
+        self._error: Optional[Exception] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "DatabaseWriter":
+        """Start the writer thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="database-writer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Apply the operations already submitted and stop the writer
+        thread.
+        """
+        self._queue.put(_STOP)
+        if self._thread:
+            self._thread.join()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of operations waiting to be applied."""
+        return self._queue.qsize()
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """Queue `function(database, *args, **kwargs)` and return a
+        future resolved with its result once its transaction is
+        committed. Raise WriterError if the writer thread is dead.
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._error:
+                raise WriterError(
+                    f"the database writer is dead: {self._error}"
+                ) from self._error
+            self._queue.put(_Operation(function, args, kwargs, future))
+        return future
+
+    def write(self, function: Callable, *args, **kwargs) -> Any:
+        """Apply a write operation and wait for it to be committed, see
+        submit. Exceptions raised by the operation are raised here.
+        """
+        return self.submit(function, *args, **kwargs).result()
+
+    async def write_async(self, function: Callable, *args, **kwargs) -> Any:
+        """Apply a write operation without blocking the event loop, see
+        write.
+        """
+        return await asyncio.wrap_future(self.submit(function, *args, **kwargs))
+
+    def log_stats(self) -> None:
+        """Log the writer metrics."""
+        logger.info(
+            "database writer: queue depth: %s (max: %s), operations: %s "
+            "(failed: %s), transactions: %s, commit: %.3fms mean, %.3fms max",
+            self.queue_depth,
+            self.stats.max_queue_depth,
+            self.stats.operations,
+            self.stats.failed_operations,
+            self.stats.transactions,
+            self.stats.mean_commit_ms,
+            self.stats.max_commit_seconds * 1000,
+        )
+
+    def _next_batch(self) -> list:
+        """Wait for an operation and return it with the ones queued
+        after it, up to max_batch.
+        """
+        batch = [self._queue.get()]
+        self.stats.max_queue_depth = max(
+            self.stats.max_queue_depth, self._queue.qsize() + 1
+        )
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        """Apply the queued operations until stopped, fail them if the
+        writer cannot go on.
+        """
+        batch: list = []
+        try:
+            conn = database_initialization.connect(self.db_name)
+        except Exception as err:  # pylint: disable=W0718
+            self._fail(batch, err)
+            return
+        database = dba.DBObject(connection=conn, cursor=conn.cursor())
+        try:
+            while True:
+                batch = self._next_batch()
+                operations = [item for item in batch if item is not _STOP]
+                if operations:
+                    self._apply(database, operations)
+                if len(operations) < len(batch):
+                    return
+        except Exception as err:  # pylint: disable=W0718
+            self._fail(batch, err)
+        finally:
+            conn.close()
+
+    def _fail(self, batch: list, err: Exception) -> None:
+        """Mark the writer as dead and fail the operations of the current
+        batch and of the queue with `err`.
+        """
+        logger.error("database writer stopped: %s", err)
+        with self._lock:
+            self._error = err
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for operation in batch:
+            if operation is not _STOP and not operation.future.done():
+                operation.future.set_exception(err)
+                self.stats.failed_operations += 1
+
+    def _apply(self, database: dba.DBObject, operations: list[_Operation]) -> None:
+        """Apply operations in one transaction and resolve their
+        futures once it is committed.
+        """
+        conn = database.connection
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation in operations:
+                conn.execute("SAVEPOINT operation")
+                try:
+                    result = operation.function(
+                        database, *operation.args, **operation.kwargs
+                    )
+                except Exception as err:  # pylint: disable=W0718
+                    conn.execute("ROLLBACK TO operation")
+                    self.stats.failed_operations += 1
+                    results.append((operation, None, err))
+                else:
+                    results.append((operation, result, None))
+                finally:
+                    conn.execute("RELEASE operation")
+            started = time.perf_counter()
+            conn.commit()
+            elapsed = time.perf_counter() - started
+        except Exception as err:  # pylint: disable=W0718
+            # e.g. the database stayed locked past the busy timeout, none
+            # of the operations is applied.
+            conn.rollback()
+            logger.error("cannot commit the database writes: %s", err)
+            for operation in operations:
+                operation.future.set_exception(err)
+            self.stats.failed_operations += len(operations)
+            return
+        self.stats.operations += len(operations)
+        self.stats.transactions += 1
+        self.stats.commit_seconds += elapsed
+        self.stats.max_commit_seconds = max(self.stats.max_commit_seconds, elapsed)
+        for operation, result, err in results:
+            if err:
+                operation.future.set_exception(err)
+            else:
+                operation.future.set_result(result)
@@ -0,0 +1,240 @@
+"""Resolve Cardano epochs from slots without querying Ogmios for
+every block.
+
+The era summaries returned by Ogmios describe, for each era, the slot
+and epoch it started at and the length of its epochs. The epoch of any
+slot within the known eras can be calculated from these. The summaries
+are read once per run and only re-read when a slot falls outside of
+them, i.e. past the forecast horizon of the current era.
+"""
+
+# pylint: disable=W1203
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Final, Optional, Union
+
+try:
+    import config
+    import ogmios_helper
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import config, ogmios_helper
+    except ModuleNotFoundError:
+        from cnt_collector_node import config, ogmios_helper
+
+logger = logging.getLogger(__name__)
+
+EPOCH_UNKNOWN: Final[int] = 0
+
+# Ogmios queries the resolver asks for, see EpochResolver._resolve.
+_QUERY_ERAS: Final[str] = "eras"
+_QUERY_EPOCH: Final[str] = "epoch"
+
+
+@dataclass(frozen=True)
+class EraSummary:
+    """Slot and epoch boundaries of a single era."""
+
+    start_slot: int
+    start_epoch: int
+    end_slot: Optional[int]
+    epoch_length: int
+
+
+def era_summaries_from_ogmios(response: dict) -> list[EraSummary]:
+    """Convert an Ogmios queryLedgerState/eraSummaries response into a
+    list of era summary objects.
+    """
+    eras = []
+    for era in response.get("result") or []:
+        try:
+            end = era.get("end")
+            eras.append(
+                EraSummary(
+                    start_slot=era["start"]["slot"],
+                    start_epoch=era["start"]["epoch"],
+                    end_slot=end["slot"] if end else None,
+                    epoch_length=era["parameters"]["epochLength"],
+                )
+            )
+        except (KeyError, TypeError) as err:
+            logger.error("cannot read era summary: %s (%s)", era, err)
+            return []
+    return eras
+
+
+def epoch_bounds_from_slot(
+    slot: int, eras: list[EraSummary]
+) -> Optional[tuple[int, int, int]]:
+    """Return the epoch of a slot along with the first slot of that
+    epoch and the first slot of the following epoch.
+
+    None is returned if the slot isn't covered by the era summaries.
+    """
+    for era in eras:
+        if slot < era.start_slot:
+            continue
+        if era.end_slot is not None and slot >= era.end_slot:
+            continue
+        epochs_into_era = (slot - era.start_slot) // era.epoch_length
+        epoch_start = era.start_slot + epochs_into_era * era.epoch_length
+        return (
+            era.start_epoch + epochs_into_era,
+            epoch_start,
+            epoch_start + era.epoch_length,
+        )
+    return None
+
+
+def slot_time_ms(slot: int) -> int:
+    """Return the time of a slot in milliseconds since the epoch.
+
+    Slots last one second from the SLOT_TIME_REFERENCE_SLOT on, the
+    shorter Byron slots before it aren't taken into account.
+    """
+    return (
+        config.SLOT_TIME_REFERENCE_SECONDS + slot - config.SLOT_TIME_REFERENCE_SLOT
+    ) * 1000
+
+
+class EpochResolver:
+    """Calculate epochs from slots using the era summaries.
+
+    The epoch and its slot boundaries are cached, so for most blocks
+    resolving the epoch is a comparison. When a slot crosses an epoch
+    boundary the epoch is calculated again and, every
+    `cross_check_every` boundaries, checked against Ogmios.
+
+    Ogmios connections are passed in on each call, a sync connection to
+    `epoch` and an asyncio client to `epoch_async`, so that one resolver
+    can serve both. The cache is shared under a lock, Ogmios is queried
+    without holding it.
+    """
+
+    def __init__(self, cross_check_every: int = config.EPOCH_CROSS_CHECK_EVERY):
+        self.eras: list[EraSummary] = []
+        self.cross_check_every = cross_check_every
+        self._epoch: Optional[int] = None
+        self._epoch_start: int = 0
+        self._epoch_end: int = 0
+        self._boundaries: int = 0
+        self._lock = threading.Lock()
+
+    def load(self, ogmios_ws: Any) -> bool:
+        """(Re)load the era summaries from Ogmios."""
+        return self._set_eras(ogmios_helper.ogmios_era_summaries(ogmios_ws))
+
+    async def load_async(self, client: Any) -> bool:
+        """(Re)load the era summaries using an asyncio Ogmios client."""
+        return self._set_eras(await client.era_summaries())
+
+    def epoch(self, slot: int, ogmios_ws: Any) -> int:
+        """Return the epoch for the given slot.
+
+        Sync calls can be made from several threads, e.g. the reads of
+        the populate_utxos sweep.
+        """
+        reloaded, ledger = False, None
+        while True:
+            result = self._resolve(slot, reloaded, ledger)
+            if isinstance(result, int):
+                return result
+            if result == _QUERY_ERAS:
+                self.load(ogmios_ws)
+                reloaded = True
+            else:
+                ledger = ogmios_helper.ogmios_epoch(ogmios_ws)
+
+    async def epoch_async(self, slot: int, client: Any) -> int:
+        """Return the epoch for the given slot using an asyncio Ogmios
+        client, see epoch.
+        """
+        reloaded, ledger = False, None
+        while True:
+            result = self._resolve(slot, reloaded, ledger)
+            if isinstance(result, int):
+                return result
+            if result == _QUERY_ERAS:
+                await self.load_async(client)
+                reloaded = True
+            else:
+                ledger = await client.epoch()
+
+    def _resolve(
+        self, slot: int, reloaded: bool, ledger: Optional[dict]
+    ) -> Union[int, str]:
+        """Return the epoch of a slot, or the Ogmios query needed to
+        resolve it: the era summaries if they weren't `reloaded` yet or
+        the epoch of the ledger tip if `ledger` is still missing.
+
+        The cache is checked and updated under the lock, the queries
+        are made by the caller without holding it.
+        """
+        with self._lock:
+            if self._epoch is not None and self._epoch_start <= slot < self._epoch_end:
+                return self._epoch
+            bounds = epoch_bounds_from_slot(slot, self.eras)
+            if bounds is None and not reloaded:
+                return _QUERY_ERAS
+            checked = bounds is None or self._cross_check_due()
+            if checked and ledger is None:
+                if bounds is None:
+                    logger.warning(
+                        "slot '%s' outside of known eras, querying epoch", slot
+                    )
+                return _QUERY_EPOCH
+            if bounds is None or (
+                checked and not self.cross_check(bounds[0], _epoch_result(ledger))
+            ):
+                return _epoch_result(ledger)
+            return self._accept(bounds)
+
+    def cross_check(self, epoch: int, ledger_epoch: int) -> bool:
+        """Check a calculated epoch against the epoch of the ledger tip.
+
+        A block can be older than the tip (e.g. when catching up) but
+        can never be in a later epoch than the ledger, if it is the
+        era summaries are out of date and are discarded. Called with the
+        lock held.
+        """
+        if not ledger_epoch or epoch <= ledger_epoch:
+            return True
+        logger.error(
+            "calculated epoch '%s' is ahead of the ledger epoch '%s'",
+            epoch,
+            ledger_epoch,
+        )
+        self.eras = []
+        self._epoch = None
+        return False
+
+    def _set_eras(self, response: dict) -> bool:
+        """Replace the era summaries with those in an Ogmios response."""
+        eras = era_summaries_from_ogmios(response)
+        with self._lock:
+            self.eras = eras
+        if not eras:
+            logger.warning("era summaries unavailable, epochs will be queried")
+            return False
+        logger.info("loaded '%s' era summaries", len(eras))
+        return True
+
+    def _cross_check_due(self) -> bool:
+        """Return True if the next epoch boundary is to be checked."""
+        return self._boundaries % self.cross_check_every == 0
+
+    def _accept(self, bounds: tuple[int, int, int]) -> int:
+        """Cache a calculated epoch and its slot boundaries."""
+        self._boundaries += 1
+        self._epoch, self._epoch_start, self._epoch_end = bounds
+        logger.info("epoch '%s' (slots '%s' to '%s')", *bounds)
+        return self._epoch
+
+
+def _epoch_result(response: dict) -> int:
+    """Return the epoch from an Ogmios epoch query, the fallback for
+    the resolver.
+    """
+    return response.get("result", EPOCH_UNKNOWN)
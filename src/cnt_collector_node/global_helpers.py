@@ -63,6 +63,10 @@ class AppContext:
     main_event: Event
     thread_event: Event
     reconnect_event: Event
+    epoch_resolver: Any = None
+    pool_states: Any = None
+    read_only: bool = False
+    writer: Any = None
 
 
 logger = logging.getLogger(__name__)
@@ -106,6 +110,11 @@ def get_utc_timestamp_now() -> str:
     return datetime.now(timezone.utc).strftime(config.UTC_TIME_FORMAT)
 
 
+def get_timestamp_ms_now() -> int:
+    """Get a UTC timestamp for 'now' in milliseconds since the epoch."""
+    return time.time_ns() // 1_000_000
+
+
 async def read_identity(identity_file: str) -> dict:
     """Read the node identity file."""
     try:
@@ -261,7 +270,10 @@ def display_block(block: dict) -> int:
         logger.info("block parent:       %s", block["ancestor"])
         logger.info("block height:       %s", block["height"])
         logger.info("block slot:         %s", block["slot"])
-        logger.info("transactions count: %s", len(block["transactions"]))
+        logger.info(
+            "transactions count: %s",
+            block.get("transaction_count", len(block["transactions"])),
+        )
         block_slot = block["slot"]
     except KeyError:
         logger.error("block data cannot be accessed: %s", block)
@@ -5,39 +5,58 @@
 # pylint: disable = C0302; # too many lines > 1000.
 
 # Standard library imports
+import asyncio
 import logging
 import sqlite3
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from threading import Event
 from time import sleep
-from typing import Final, Union
+from typing import Any, Callable, Final, Iterator, Optional, Union
 
 # Third-party imports
 import websocket
 
 # Local imports
 try:
+    import address_index
+    import block_decoder
     import config
     import database_abstraction as dba
+    import database_derived as derived
     import database_initialization
     import global_helpers as helpers
     import kupo_helper
+    import ogmios_client
     import ogmios_helper
     import utxo_objects
 except ModuleNotFoundError:
     try:
-        from src.cnt_collector_node import config
+        from src.cnt_collector_node import address_index, block_decoder, config
         from src.cnt_collector_node import database_abstraction as dba
+        from src.cnt_collector_node import database_derived as derived
         from src.cnt_collector_node import database_initialization
         from src.cnt_collector_node import global_helpers as helpers
-        from src.cnt_collector_node import kupo_helper, ogmios_helper, utxo_objects
+        from src.cnt_collector_node import (
+            kupo_helper,
+            ogmios_client,
+            ogmios_helper,
+            utxo_objects,
+        )
     except ModuleNotFoundError:
-        from cnt_collector_node import config
+        from cnt_collector_node import address_index, block_decoder, config
         from cnt_collector_node import database_abstraction as dba
+        from cnt_collector_node import database_derived as derived
+        from cnt_collector_node import database_initialization
         from cnt_collector_node import global_helpers as helpers
-        from cnt_collector_node import kupo_helper, ogmios_helper, utxo_objects
+        from cnt_collector_node import (
+            kupo_helper,
+            ogmios_client,
+            ogmios_helper,
+            utxo_objects,
+        )
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +76,9 @@ TOKEN_POLICY_NAME_BLANK: Final[str] = ""
 
 CHAIN_DIRECTION_FWD: Final[str] = "forward"
 
+TABLE_UTXOS: Final[str] = "utxos"
+TABLE_PRICE: Final[str] = "price"
+
 
 volume_from_tokens = helpers.cnt_volume_from_tokens
 
@@ -64,7 +86,7 @@ volume_from_tokens = helpers.cnt_volume_from_tokens
 @contextmanager
 def database_connection(db_name: str):
     """Context manager for database connections."""
-    conn = sqlite3.connect(db_name)
+    conn = database_initialization.connect(db_name)
     try:
         yield conn
     finally:
@@ -72,15 +94,48 @@ def database_connection(db_name: str):
         conn.close()
 
 
+@contextmanager
+def database_transaction(db_name: str):
+    """Context manager for a single database transaction.
+
+    Changes are committed if the block completes and rolled back if it
+    raises.
+    """
+    conn = database_initialization.connect(db_name)
+    try:
+        yield dba.DBObject(connection=conn, cursor=conn.cursor())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@contextmanager
+def database_savepoint(database: dba.DBObject, name: str):
+    """Context manager for a savepoint in the current transaction.
+
+    Changes made in the block are rolled back to the savepoint if it
+    raises, leaving the rest of the transaction as it was.
+    """
+    database.connection.execute(f"SAVEPOINT {name}")
+    try:
+        yield database
+    except BaseException:
+        database.connection.execute(f"ROLLBACK TO {name}")
+        raise
+    finally:
+        database.connection.execute(f"RELEASE {name}")
+
+
 def search_db_utxo(
-    app_context: helpers.AppContext, tx_inputs: dict, output_contents: dict
+    database: dba.DBObject, tx_inputs: dict, output_contents: dict
 ) -> list:
     """Search for the transactions inputs into the utxos table."""
-    with database_connection(app_context.db_name) as conn:
-        utxo_ids = _search_db_utxo(
-            conn=conn, tx_inputs=tx_inputs, output_contents=output_contents
-        )
-    return utxo_ids
+    return _search_db_utxo(
+        conn=database.connection, tx_inputs=tx_inputs, output_contents=output_contents
+    )
 
 
 def _search_db_utxo(
@@ -157,9 +212,9 @@ def check_utxo_for_tokens_pair(
 
 
 def _parse_block_transactions_single_tx(  # pylint: disable=R0913
-    app_context: helpers.AppContext,
+    database: dba.DBObject,
     transaction: dict,
-    watched_addresses: list,
+    watched_addresses: address_index.WatchedAddresses,
     slot: int,
     epoch: int,
     pairs_config_dict: dict,
@@ -175,50 +230,21 @@ def _parse_block_transactions_single_tx(  # pylint: disable=R0913
     output_counter = 0
     for output in transaction_outputs:
         output_counter += 1
-        if output["address"] not in watched_addresses:
+        configured_addresses = watched_addresses.match(output["address"])
+        if not configured_addresses:
             continue
         logger.info("new transaction for %s", output.get("address"))
         try:
-            output_contents = ogmios_helper.get_output_content(output)
-            utxo_ids = search_db_utxo(
-                app_context=app_context,
-                tx_inputs=transaction_inputs,
-                output_contents=output_contents,
-            )
-            if not utxo_ids:
-                utxo_ids = []
-            for tokens_pair in pairs_config_dict[output["address"]]:
-                # return if the UTxO doesn't contains a known security token
-                if (
-                    tokens_pair.security_token_policy not in output_contents["assets"]
-                    or tokens_pair.security_token_name
-                    not in output_contents["assets"][tokens_pair.security_token_policy]
-                ):
-                    continue
-                # return if the minimum amount of ADA is not reached for a ADA pair
-                if (
-                    tokens_pair.pair.startswith("ADA-")
-                    or tokens_pair.pair.endswith("-ADA")
-                ) and (output_contents["amount"] < config.MIN_ADA_AMOUNT):
-                    continue
-                # make sure the UTxO contains both tokens of a tokens pair that we are watching
-                # because some security tokens are identical for many tokens pairs (MinSwapV2)
-                if not check_utxo_for_tokens_pair(tokens_pair, output_contents):
-                    # exit if no watched tokens pair was found
-                    continue
-                initial_chain_context = utxo_objects.InitialChainContext(
-                    block_height=slot,
+            with database_savepoint(database, "block_output"):
+                _parse_block_output(
+                    database=database,
+                    transaction=transaction,
+                    output=output,
+                    output_index=output_counter - 1,
+                    configured_addresses=configured_addresses,
+                    slot=slot,
                     epoch=epoch,
-                    address=output["address"],
-                    tx_hash=transaction_id,
-                    output_index=(output_counter - 1),
-                    utxo_ids=utxo_ids,
-                )
-                save_output(
-                    app_context=app_context,
-                    initial_chain_context=initial_chain_context,
-                    tokens_pair=tokens_pair,
-                    output_contents=output_contents,
+                    pairs_config_dict=pairs_config_dict,
                 )
         except Exception as err:
             if unsafe:
@@ -227,15 +253,80 @@ def _parse_block_transactions_single_tx(  # pylint: disable=R0913
             logger.warning("parse block output: %s", output)
 
 
+def _parse_block_output(  # pylint: disable=R0913
+    database: dba.DBObject,
+    transaction: dict,
+    output: dict,
+    output_index: int,
+    configured_addresses: list[str],
+    slot: int,
+    epoch: int,
+    pairs_config_dict: dict,
+):
+    """Save the price of the tokens pairs found in a watched output of
+    a block transaction.
+    """
+    output_contents = ogmios_helper.get_output_content(output)
+    utxo_ids = search_db_utxo(
+        database=database,
+        tx_inputs=transaction["inputs"],
+        output_contents=output_contents,
+    )
+    if not utxo_ids:
+        utxo_ids = []
+    tokens_pairs = [
+        tokens_pair
+        for address in configured_addresses
+        for tokens_pair in pairs_config_dict[address]
+    ]
+    for tokens_pair in tokens_pairs:
+        # return if the UTxO doesn't contains a known security token
+        if (
+            tokens_pair.security_token_policy not in output_contents["assets"]
+            or tokens_pair.security_token_name
+            not in output_contents["assets"][tokens_pair.security_token_policy]
+        ):
+            continue
+        # return if the minimum amount of ADA is not reached for a ADA pair
+        if (
+            tokens_pair.pair.startswith("ADA-") or tokens_pair.pair.endswith("-ADA")
+        ) and (output_contents["amount"] < config.MIN_ADA_AMOUNT):
+            continue
+        # make sure the UTxO contains both tokens of a tokens pair that we are watching
+        # because some security tokens are identical for many tokens pairs (MinSwapV2)
+        if not check_utxo_for_tokens_pair(tokens_pair, output_contents):
+            # exit if no watched tokens pair was found
+            continue
+        initial_chain_context = utxo_objects.InitialChainContext(
+            block_height=slot,
+            epoch=epoch,
+            address=output["address"],
+            tx_hash=transaction["id"],
+            output_index=output_index,
+            utxo_ids=utxo_ids,
+        )
+        _save_output(
+            database=database,
+            initial_chain_context=initial_chain_context,
+            tokens_pair=tokens_pair,
+            output_contents=output_contents,
+        )
+
+
 def parse_block_transactions(  # pylint: disable = R0913
-    app_context: helpers.AppContext,
+    database: dba.DBObject,
     epoch: int,
     block: dict,
-    watched_addresses: list,
+    watched_addresses: address_index.WatchedAddresses,
     pairs_config_dict: dict,
     unsafe: bool,
 ) -> None:
-    """Parse block transactions"""
+    """Parse block transactions
+
+    NB. the caller is responsible for the transaction so that the block
+    is saved as a whole or not at all. Outputs that cannot be parsed
+    are rolled back on their own.
+    """
 
     transactions = block["transactions"]
     slot = block["slot"]
@@ -244,7 +335,7 @@ def parse_block_transactions(  # pylint: disable = R0913
         counter += 1
         logger.info("--------------- new tx (%s) ---------------", counter)
         _parse_block_transactions_single_tx(
-            app_context=app_context,
+            database=database,
             transaction=transaction,
             watched_addresses=watched_addresses,
             slot=slot,
@@ -254,94 +345,441 @@ def parse_block_transactions(  # pylint: disable = R0913
         )
 
 
-def find_start_block(
-    ogmios_ws: websocket.WebSocket,
+async def find_start_block(
+    ogmios_ws: ogmios_client.OgmiosClient,
 ) -> dict:
     """Find the start block after connecting to Ogmios"""
-    tip = ogmios_helper.ogmios_tip(ogmios_ws)
+    tip = await ogmios_ws.tip()
     start_block = tip["result"]
-    intersection = ogmios_helper.ogmios_intersection(ogmios_ws, start_block)
+    intersection = await ogmios_ws.find_intersection([start_block])
+    return intersection
+
+
+def save_checkpoint(database: dba.DBObject, block: dict) -> None:
+    """Save the point of a processed block as a chain-sync checkpoint
+    and prune the checkpoints we no longer need.
+    """
+    dba.insert_checkpoint(db=database, slot=block["slot"], block_id=block["id"])
+    dba.prune_checkpoints(db=database, keep=config.CHAIN_SYNC_CHECKPOINTS)
+
+
+def load_checkpoints(db_name: str) -> list[dict]:
+    """Load the chain-sync checkpoints from the database, most recent
+    first. Return an empty list if there aren't any (yet).
+    """
+    try:
+        with database_connection(db_name) as conn:
+            db = dba.DBObject(connection=conn, cursor=conn.cursor())
+            return dba.select_checkpoints(db=db, limit=config.CHAIN_SYNC_CHECKPOINTS)
+    except sqlite3.OperationalError as err:
+        logger.info("no chain-sync checkpoints available: %s", err)
+        return []
+
+
+def load_dimensions(db_name: str, pairs_config_dict: dict) -> None:
+    """Load the pairs, sources and tokens of the pairs config into the
+    dimension tables the utxos and price records refer to.
+    """
+    with database_transaction(db_name) as database:
+        for tokens_pairs in pairs_config_dict.values():
+            for tokens_pair in tokens_pairs:
+                dba.insert_tokens_pair(db=database, tokens_pair=tokens_pair)
+
+
+async def resume_start_block(
+    ogmios_ws: ogmios_client.OgmiosClient, db_name: str
+) -> dict:
+    """Find the start block from the checkpoints saved in the database.
+
+    Return the intersection if the chain-sync can resume from one of
+    the checkpoints. An empty dict is returned if there are no
+    checkpoints, none of them are on the chain any more, or the most
+    recent one is too far behind the tip to catch up with.
+    """
+    points = load_checkpoints(db_name)
+    if not points:
+        return {}
+    tip = (await ogmios_ws.tip()).get("result")
+    if not tip:
+        return {}
+    gap = tip["slot"] - points[0]["slot"]
+    if gap > config.CHAIN_SYNC_RESUME_MAX_GAP:
+        logger.info(
+            "last checkpoint is '%s' slots behind the tip (max: '%s'), not resuming",
+            gap,
+            config.CHAIN_SYNC_RESUME_MAX_GAP,
+        )
+        return {}
+    intersection = await ogmios_ws.find_intersection(points)
+    if "result" not in intersection:
+        logger.warning("checkpoints not found on chain: %s", intersection)
+        return {}
+    logger.info(
+        "resuming chain-sync from: %s ('%s' slots behind the tip)",
+        intersection["result"].get("intersection"),
+        gap,
+    )
+    return intersection
+
+
+def resolve_epoch(
+    app_context: helpers.AppContext,
+    ogmios_ws: ogmios_client.SyncOgmiosClient,
+    slot: int,
+) -> int:
+    """Return the epoch for a slot.
+
+    The epoch is calculated from the slot when the context provides an
+    epoch resolver, otherwise it is queried from Ogmios.
+    """
+    if app_context.epoch_resolver and slot:
+        return app_context.epoch_resolver.epoch(slot, ogmios_ws)
+    return ogmios_helper.ogmios_epoch(ogmios_ws).get("result", 0)
+
+
+async def resolve_block_epoch(
+    app_context: helpers.AppContext, ogmios_ws: ogmios_client.OgmiosClient, slot: int
+) -> int:
+    """Return the epoch for a slot from the event loop, see
+    resolve_epoch.
+    """
+    if app_context.epoch_resolver and slot:
+        return await app_context.epoch_resolver.epoch_async(slot, ogmios_ws)
+    return (await ogmios_ws.epoch()).get("result", 0)
+
+
+def chain_sync_pipeline_depth(
+    next_block: dict,
+    max_in_flight: int = config.CHAIN_SYNC_MAX_IN_FLIGHT,
+) -> int:
+    """Return the number of nextBlock requests to keep in flight given
+    the last chain-sync response.
+
+    Near the tip blocks arrive every ~20 seconds and one request at a
+    time is enough. When we are behind (e.g. after a restart) the depth
+    grows with the estimated number of blocks left to catch up with so
+    that we aren't bound by one round trip per block.
+    """
+    try:
+        result = next_block["result"]
+        tip_slot = result["tip"]["slot"]
+        if result["direction"] == CHAIN_DIRECTION_FWD:
+            slot = result["block"]["slot"]
+        else:
+            slot = result["point"]["slot"]
+    except (KeyError, TypeError):
+        return 1
+    distance = tip_slot - slot
+    if distance <= config.CHAIN_SYNC_NEAR_TIP_SLOTS:
+        return 1
+    blocks_behind = distance // config.SLOTS_PER_BLOCK
+    return max(1, min(max_in_flight, blocks_behind))
+
+
+async def request_next_blocks(
+    ogmios_ws: ogmios_client.OgmiosClient,
+    in_flight: int,
+    depth: int,
+    decode: Callable[[str], dict] = ogmios_client.decode_response,
+) -> int:
+    """Top up the chain-sync pipeline so that `depth` nextBlock
+    requests are in flight and return the new in-flight count.
+
+    The pipeline is never drained on purpose, if the depth drops the
+    requests already sent are simply consumed as they arrive.
+    """
+    while in_flight < depth:
+        await ogmios_ws.request_next_block(decode)
+        in_flight += 1
+    return in_flight
+
+
+async def write_transaction(
+    app_context: helpers.AppContext, function, *args, **kwargs
+) -> Any:
+    """Apply `function(database, *args, **kwargs)` in a transaction,
+    through the database writer if the context has one.
+    """
+    if app_context.writer:
+        return await app_context.writer.write_async(function, *args, **kwargs)
+    with database_transaction(app_context.db_name) as database:
+        return function(database, *args, **kwargs)
+
+
+def save_block(  # pylint: disable=R0913
+    database: dba.DBObject,
+    block: dict,
+    block_height: int,
+    epoch: int,
+    watched_addresses: address_index.WatchedAddresses,
+    pairs_config_dict: dict,
+    unsafe: bool,
+) -> None:
+    """Save a block: the status, the UTxOs of the watched addresses,
+    the checkpoint, and prune the undo journal.
+    """
+    update_status(
+        db_name=None,
+        database=database,
+        block=block_height,
+    )
+    parse_block_transactions(
+        database=database,
+        epoch=epoch,
+        block=block,
+        watched_addresses=watched_addresses,
+        pairs_config_dict=pairs_config_dict,
+        unsafe=unsafe,
+    )
+    save_checkpoint(database=database, block=block)
+    derived.prune_journal(
+        db=database,
+        slot=block_height - config.JOURNAL_RETENTION_SLOTS,
+    )
+
+
+@dataclass
+class ChainSyncState:
+    """Counters and pipeline of the chain-sync loop of parse_blocks."""
+
+    counter: int = 0
+    counter_fwd: int = 0
+    counter_bck: int = 0
+    in_flight: int = 0
+    depth: int = 1
+
+    def log_stats(self) -> None:
+        """Log the chain-sync counters."""
+        logger.info("counter:  %s", self.counter)
+        logger.info("forward:  %s", self.counter_fwd)
+        logger.info("backward: %s", self.counter_bck)
+
+
+async def _receive_next_block(
+    ogmios_ws: ogmios_client.OgmiosClient,
+    state: ChainSyncState,
+    decode: Callable[[str], dict],
+) -> dict:
+    """Top up the pipeline, receive the next chain-sync response and
+    adjust the pipeline depth to it.
+    """
+    logger.info("requesting next block...")
+    state.in_flight = await request_next_blocks(
+        ogmios_ws, state.in_flight, state.depth, decode
+    )
+    next_block = await ogmios_helper.ogmios_receive_next_block(ogmios_ws)
+    state.in_flight -= 1
+    logger.info("next block received")
+    if "direction" not in next_block.get("result", {}):
+        logger.info("%s", next_block)
+        sys.exit(1)
+    state.depth = chain_sync_pipeline_depth(next_block)
+    state.counter += 1
+    return next_block
+
+
+async def _roll_forward(  # pylint: disable=R0913
+    app_context: helpers.AppContext,
+    state: ChainSyncState,
+    block: dict,
+    watched_addresses: address_index.WatchedAddresses,
+    pairs_config_dict: dict,
+    unsafe: bool,
+) -> None:
+    """Save a block received from the chain-sync."""
+    state.counter_fwd += 1
+    logger.info(
+        "============================= '%s' =============================",
+        state.counter,
+    )
+    block_height = helpers.display_block(block)
+    epoch = await resolve_block_epoch(app_context, app_context.ogmios_ws, block_height)
+    # a block is saved as a whole or not at all.
+    await write_transaction(
+        app_context,
+        save_block,
+        block=block,
+        block_height=block_height,
+        epoch=epoch,
+        watched_addresses=watched_addresses,
+        pairs_config_dict=pairs_config_dict,
+        unsafe=unsafe,
+    )
+
+
+async def _roll_backward(
+    app_context: helpers.AppContext, state: ChainSyncState, point: Union[dict | str]
+) -> None:
+    """Revert the blocks after a chain-sync rollback point."""
+    state.counter_bck += 1
+    reverted = await write_transaction(app_context, rollback_to_point, point=point)
+    logger.info("rolled back to: %s ('%s' change(s) reverted)", point, reverted)
+
+
+async def _reconnect_chain_sync(
+    app_context: helpers.AppContext, state: ChainSyncState
+) -> None:
+    """Reconnect to Ogmios and find where to continue the chain-sync
+    from.
+    """
+    ogmios_ws: ogmios_client.OgmiosClient = app_context.ogmios_ws
+    await asyncio.sleep(1)
+    logger.info("reconnecting to Ogmios...")
+    # reconnect to Ogmios
+    await ogmios_ws.reconnect()
+    # pipelined requests were lost with the old connection.
+    state.in_flight = 0
+    state.depth = 1
+    await start_chain_sync(app_context)
+
+
+def _reset_utxos(database: dba.DBObject) -> None:
+    """Write operation re-creating the utxos tables, see
+    database_initialization.reset_utxos.
+    """
+    database_initialization.reset_utxos(database.connection)
+
+
+def _set_status(database: dba.DBObject, block: int) -> None:
+    """Write operation updating the status, see update_status."""
+    update_status(db_name=None, database=database, block=block)
+
+
+async def start_chain_sync(app_context: helpers.AppContext) -> dict:
+    """Find where the chain-sync starts from and return the
+    intersection.
+
+    The chain-sync resumes from the last checkpoint if it is still on
+    chain and close enough to the tip, keeping the utxos table, the
+    blocks missed are processed as we catch up. Otherwise it starts from
+    the tip: the utxos table is re-created and the populate_utxos thread
+    is told to re-populate it. The status is set to the start point.
+
+    The blocks whose price records were lost by a crash are rolled back
+    first, see reconcile_history.
+    """
+    ogmios_ws: ogmios_client.OgmiosClient = app_context.ogmios_ws
+    await write_transaction(app_context, reconcile_history)
+    intersection = await resume_start_block(ogmios_ws, app_context.db_name)
+    if not intersection:
+        await write_transaction(app_context, _reset_utxos)
+        app_context.reconnect_event.set()
+        intersection = await find_start_block(ogmios_ws)
+    logger.info("%s", intersection)
+    point = intersection.get("result", {}).get("intersection")
+    if isinstance(point, dict):
+        await write_transaction(app_context, _set_status, block=point["slot"])
     return intersection
 
 
 async def parse_blocks(
     app_context: helpers.AppContext,
-    watched_addresses: list,
+    watched_addresses: address_index.WatchedAddresses,
     pairs_config_dict: dict,
     unsafe: bool,
 ) -> None:
-    """Parse the realtime blocks"""
-    db_name = app_context.db_name
-    ogmios_ws: websocket.WebSocket = app_context.ogmios_ws
+    """Parse the realtime blocks from the start point of the chain-sync,
+    see start_chain_sync.
+    """
+    ogmios_ws: ogmios_client.OgmiosClient = app_context.ogmios_ws
     main_event: Event = app_context.main_event
-    thread_event: Event = app_context.thread_event
-    # find the tip, to start from it
-    intersection = find_start_block(ogmios_ws)
-    counter = 0
-    counter_fwd = 0
-    counter_bck = 0
+    # only the transactions paying to watched addresses are decoded.
+    decode = block_decoder.next_block_decoder(watched_addresses)
+    state = ChainSyncState()
     while not main_event.is_set():
         try:
-            logger.info("requesting next block...")
-            next_block = await ogmios_helper.ogmios_next_block(ogmios_ws)
-            epoch = ogmios_helper.ogmios_epoch(ogmios_ws).get("result", 0)
-            logger.info("next block received")
-            try:
-                direction = next_block["result"]["direction"]
-            except KeyError:
-                logger.info("%s", next_block)
-                sys.exit(1)
-            counter += 1
-            if direction == CHAIN_DIRECTION_FWD:
-                counter_fwd += 1
-                block = next_block["result"]["block"]
-                logger.info(
-                    "============================= '%s' =============================",
-                    counter,
-                )
-                block_height = helpers.display_block(block)
-                update_status(
-                    db_name=db_name,
-                    database={},
-                    block=block_height,
-                )
-                parse_block_transactions(
-                    app_context=app_context,
-                    epoch=epoch,
-                    block=block,
-                    watched_addresses=watched_addresses,
-                    pairs_config_dict=pairs_config_dict,
-                    unsafe=unsafe,
+            result = (await _receive_next_block(ogmios_ws, state, decode))["result"]
+            if result["direction"] == CHAIN_DIRECTION_FWD:
+                await _roll_forward(
+                    app_context,
+                    state,
+                    result["block"],
+                    watched_addresses,
+                    pairs_config_dict,
+                    unsafe,
                 )
             else:
-                counter_bck += 1
+                await _roll_backward(app_context, state, result["point"])
             # statistics
-            if counter % 100 == 0:
-                logger.info("counter:  %s", counter)
-                logger.info("forward:  %s", counter_fwd)
-                logger.info("backward: %s", counter_bck)
+            if state.counter % 100 == 0:
+                state.log_stats()
+                logger.info(
+                    "pipeline: %s (in flight: %s)", state.depth, state.in_flight
+                )
+                ogmios_ws.log_stats()
+                if app_context.writer:
+                    app_context.writer.log_stats()
         except KeyboardInterrupt:
             main_event.set()
-            thread_event.set()
-        except (
-            ConnectionResetError,
-            websocket.WebSocketConnectionClosedException,
-        ) as err:
+            app_context.thread_event.set()
+        except ConnectionError as err:
             logger.error("%s", err)
-            sleep(1)
-            logger.info("reconnecting to Ogmios...")
-            # reconnect to Ogmios
-            ogmios_ws = websocket.create_connection(app_context.ogmios_url)
-            app_context.reconnect_event.set()
-            # drop the table utxos on reconnect, to update the table records
-            database_initialization.create_database(app_context.db_name)
-            # start again from the tip
-            intersection = find_start_block(ogmios_ws)
-            logger.info("%s", intersection)
+            await _reconnect_chain_sync(app_context, state)
     # stats before exiting
-    logger.info("counter:  %s", counter)
-    logger.info("forward:  %s", counter_fwd)
-    logger.info("backward: %s", counter_bck)
+    state.log_stats()
+
+
+def rollback_to_point(database: dba.DBObject, point: Union[dict | str]) -> int:
+    """Revert the changes recorded in the undo journal by the blocks
+    after the given point and return the number of changes reverted.
+
+    UTxO updates are reverted to their previous values unless the
+    record has since been written by a block before the point (i.e. by
+    populate_utxos). Price records are deleted. The checkpoints and the
+    status are moved back to the point.
+
+    NB. the caller is responsible for the transaction so that the
+    rollback is applied as a whole or not at all.
+    """
+    slot = point["slot"] if isinstance(point, dict) else 0
+    entries = derived.select_journal_entries_after(db=database, slot=slot)
+    for entry in entries:
+        if entry.table_name == TABLE_PRICE and entry.action == derived.JOURNAL_INSERT:
+            dba.delete_price_record(db=database, id_=entry.row_id)
+            continue
+        if entry.table_name == TABLE_UTXOS and entry.action == derived.JOURNAL_UPDATE:
+            current = dba.select_utxo_partial_by_id(db=database, id_=entry.row_id)
+            if not current or current.block_height <= slot:
+                continue
+            dba.update_utxo_partial(
+                db=database,
+                utxo_record=dba.PartialUTxO(**entry.previous),
+                row_id=entry.row_id,
+            )
+            continue
+        logger.error("unexpected journal entry: %s", entry)
+    derived.delete_journal_entries_after(db=database, slot=slot)
+    dba.delete_checkpoints_after(db=database, slot=slot)
+    status = dba.get_status(database)
+    if status is not None and status > slot:
+        dba.update_status(db=database, block=slot)
+    return len(entries)
+
+
+def reconcile_history(database: dba.DBObject) -> Optional[int]:
+    """Write operation rolling back the blocks whose price records
+    didn't make it to the history database and return the slot rolled
+    back to, None if no price record is missing.
+
+    The main database commits first: a crash before the history database
+    commits keeps the status, the checkpoints and the journal of blocks
+    whose price records are lost. The blocks from the first one with a
+    journaled price record missing are rolled back so that the
+    chain-sync indexes them again.
+    """
+    if not database_initialization.has_history(database.connection):
+        return None
+    slot = derived.select_first_missing_insert_slot(database, TABLE_PRICE)
+    if slot is None:
+        return None
+    logger.warning(
+        "price records of slot '%s' missing from the history database, "
+        "rolling back to slot '%s'",
+        slot,
+        slot - 1,
+    )
+    rollback_to_point(database, {"slot": slot - 1})
+    return slot - 1
 
 
 def _validate_min_ada(token_volume: float, decimals: int, lovelace_amount: int = -1):
@@ -529,15 +967,95 @@ def check_if_configured_pair(
             )
 
 
+@dataclass(frozen=True)
+class SweepPoint:
+    """Chain point a populate_utxos sweep reads the watched addresses at,
+    with the ledger state point acquired for it, if any, and the Ogmios
+    connection it is acquired on.
+    """
+
+    block_height: int
+    epoch: int
+    acquired: Optional[dict] = None
+    ogmios_ws: Optional[ogmios_client.SyncOgmiosClient] = None
+
+
+@contextmanager
+def populate_utxos_sweep_point(app_context: helpers.AppContext):
+    """Context manager capturing the tip, as block height and epoch,
+    once for a populate_utxos sweep.
+
+    Reading the UTxOs from Ogmios, the ledger state is acquired at the
+    tip if POPULATE_UTXOS_ACQUIRE_LEDGER_STATE so that every address is
+    read against it, and released afterwards. It is acquired on a
+    connection of its own, closed after the sweep: the shared one keeps
+    answering the block parser's ledger state queries (e.g. the epoch)
+    at the tip. Kupo reads its own index, the ledger state isn't
+    acquired then.
+    """
+    ogmios_ws = app_context.ogmios_ws
+    tip = ogmios_helper.ogmios_tip(ogmios_ws).get("result")
+    if not tip:
+        helpers.log_and_raise_error(
+            "An Ogmios error has occurred", helpers.OgmiosError, "populate_utxos"
+        )
+    sweep_point = SweepPoint(
+        block_height=tip["slot"],
+        epoch=resolve_epoch(app_context, ogmios_ws, tip["slot"]),
+    )
+    if config.POPULATE_UTXOS_ACQUIRE_LEDGER_STATE and not app_context.kupo_url:
+        sweep_point = _acquire_sweep_point(app_context, sweep_point, tip)
+    try:
+        yield sweep_point
+    finally:
+        if sweep_point.ogmios_ws:
+            try:
+                if sweep_point.acquired:
+                    ogmios_helper.ogmios_release_ledger_state(sweep_point.ogmios_ws)
+            finally:
+                sweep_point.ogmios_ws.close()
+
+
+def _acquire_sweep_point(
+    app_context: helpers.AppContext, sweep_point: SweepPoint, tip: dict
+) -> SweepPoint:
+    """Acquire the ledger state at the tip on a new Ogmios connection
+    and return the sweep point with it, the sweep point as it is if the
+    connection cannot be opened.
+    """
+    try:
+        ogmios_ws = ogmios_client.SyncOgmiosClient(app_context.ogmios_url)
+    except (ConnectionError, OSError) as err:
+        logger.warning("cannot connect to Ogmios to acquire the ledger state: %s", err)
+        return sweep_point
+    point = {"slot": tip["slot"], "id": tip["id"]}
+    res = ogmios_helper.ogmios_acquire_ledger_state(ogmios_ws, point)
+    if "result" not in res:
+        logger.warning(
+            "cannot acquire the ledger state at %s: %s", point, res.get("error")
+        )
+        ogmios_ws.close()
+        return sweep_point
+    return replace(sweep_point, acquired=point, ogmios_ws=ogmios_ws)
+
+
 def _populate_utxos_make_context(
     app_context: helpers.AppContext,
     address: str,
+    sweep_point: Optional[SweepPoint] = None,
 ):
     """Create a context object for populate UTxOs and return it to
-    the caller.
+    the caller, at the sweep point if given, otherwise at the tip.
     """
+    if sweep_point:
+        return utxo_objects.InitialChainContext(
+            address=address,
+            epoch=sweep_point.epoch,
+            block_height=sweep_point.block_height,
+            tx_hash=None,
+            output_index=None,
+        )
     ogmios_ws = app_context.ogmios_ws
-    epoch_from_ogmios = ogmios_helper.ogmios_epoch(ogmios_ws)
     block_height = ogmios_helper.ogmios_last_block_slot(ogmios_ws)
     if not block_height:
         helpers.log_and_raise_error(
@@ -545,7 +1063,7 @@ def _populate_utxos_make_context(
         )
     chain_context = utxo_objects.InitialChainContext(
         address=address,
-        epoch=epoch_from_ogmios.get("result", 0),
+        epoch=resolve_epoch(app_context, ogmios_ws, block_height),
         block_height=block_height,
         tx_hash=None,
         output_index=None,
@@ -553,23 +1071,229 @@ def _populate_utxos_make_context(
     return chain_context
 
 
-def _populate_utxos_from_on_chain(app_context: helpers.AppContext, address: str):
-    """Retrieve utxos and their content from Kupo or Ogmios."""
-    utxos = []
+def kupo_tokens_pairs_matches(
+    kupo_url: str,
+    address: str,
+    tokens_pairs: Optional[list] = None,
+    created_after: Optional[int] = None,
+) -> list:
+    """Get the unspent matches at an address that can be the UTxOs of
+    the tokens pairs from Kupo: those holding their security tokens.
+
+    The address is scanned, i.e. all its matches are returned, if no
+    tokens pairs are given or one of them has no security token policy
+    to query by.
+    """
+    assets = list(
+        dict.fromkeys(
+            (tokens_pair.security_token_policy, tokens_pair.security_token_name or "")
+            for tokens_pair in tokens_pairs or []
+        )
+    )
+    if not assets or not all(policy for policy, _ in assets):
+        return kupo_helper.get_kupo_matches(
+            kupo_url, address, created_after=created_after
+        )
+    return kupo_helper.get_kupo_asset_matches(
+        kupo_url, address, assets, created_after=created_after
+    )
+
+
+@dataclass
+class SweepCheckpoints:
+    """Slot of the most recent UTxO read from Kupo at each watched
+    address by the populate_utxos sweeps, to read only the UTxOs created
+    since then.
+
+    Every KUPO_FULL_SWEEP_EVERY-th sweep reads the addresses in full.
+    The UTxOs spent since the checkpoint aren't read: an incremental
+    sweep doesn't see the pool kept in the utxos table unless it
+    changed, a pool it reads replaces it only if bigger, see
+    collect_utxo_record. The chain-sync follows the kept pool meanwhile.
+    """
+
+    slots: dict[str, int] = field(default_factory=dict)
+    # slots read by the current sweep, kept once it is saved.
+    pending: dict[str, int] = field(default_factory=dict)
+    sweeps: int = 0
+    full: bool = True
+
+    def start(self) -> None:
+        """Start a sweep, a full one if due."""
+        self.full = self.sweeps % max(1, config.KUPO_FULL_SWEEP_EVERY) == 0
+        self.pending = {}
+        logger.info("%s sweep", "full" if self.full else "incremental")
+
+    @property
+    def incremental(self) -> bool:
+        """Whether the sweep reads some addresses from their
+        checkpoints only.
+        """
+        return not self.full and bool(self.slots)
+
+    def created_after(self, address: str) -> Optional[int]:
+        """Return the slot to read the UTxOs of an address created after,
+        None to read them all.
+        """
+        slot = self.slots.get(address)
+        if self.full or slot is None:
+            return None
+        return max(0, slot - config.KUPO_SWEEP_OVERLAP_SLOTS)
+
+    def read(self, address: str, utxos: list) -> None:
+        """Record the Kupo matches read at an address."""
+        slot = max(
+            [kupo_helper.kupo_created_slot(utxo) for utxo in utxos]
+            + [self.slots.get(address, 0), self.pending.get(address, 0)]
+        )
+        if slot:
+            self.pending[address] = slot
+
+    def done(self) -> None:
+        """Keep the slots read once the sweep is saved."""
+        self.slots.update(self.pending)
+        self.pending = {}
+        self.sweeps += 1
+
+    def reset(self) -> None:
+        """Read the addresses in full on the next sweep, e.g. once the
+        utxos table is re-created.
+        """
+        self.slots = {}
+        self.sweeps = 0
+
+
+def _populate_utxos_from_on_chain(
+    app_context: helpers.AppContext,
+    addresses: list,
+    pairs_config_dict: Optional[dict] = None,
+    checkpoints: Optional[SweepCheckpoints] = None,
+) -> Iterator[tuple[str, Optional[list]]]:
+    """Retrieve the UTxOs of watched addresses from Kupo, one address at
+    a time, or from Ogmios with one query, and return an iterator
+    yielding them grouped by address, in the order of the addresses.
+
+    The addresses are read when called, the content of their UTxOs is
+    decoded as they are yielded. The UTxOs are None if Ogmios returned
+    an error.
+
+    Kupo is only asked for the UTxOs holding the security tokens of the
+    tokens pairs of an address, if given, see kupo_tokens_pairs_matches,
+    and created since the checkpoint of the address, if given.
+    """
     if app_context.kupo_url:
         # Use Kupo.
-        kupo_utxos = kupo_helper.get_kupo_matches(app_context.kupo_url, address)
-        for item in kupo_utxos:
-            content = kupo_helper.get_kupo_utxo_content(item)
-            utxos.append(content)
-        return utxos
+        matches = {}
+        for address in addresses:
+            kupo_utxos = kupo_tokens_pairs_matches(
+                app_context.kupo_url,
+                address,
+                (pairs_config_dict or {}).get(address),
+                created_after=(
+                    checkpoints.created_after(address) if checkpoints else None
+                ),
+            )
+            if checkpoints and kupo_utxos is not None:
+                checkpoints.read(address, kupo_utxos)
+            matches[address] = kupo_utxos
+        return _decode_utxos(matches, kupo_helper.get_kupo_utxo_content)
     # Use Ogmios.
-    result = ogmios_helper.ogmios_addresses_utxos(app_context.ogmios_ws, [address])
+    result = ogmios_helper.ogmios_addresses_utxos(app_context.ogmios_ws, addresses)
     ogmios_utxos = result.get("result")
+    if ogmios_utxos is None:
+        # reported for each address by the sweep.
+        return _decode_utxos(dict.fromkeys(addresses), None)
+    matches = {address: [] for address in addresses}
     for item in ogmios_utxos:
-        content = ogmios_helper.get_ogmios_utxo_content(item)
-        utxos.append(content)
-    return utxos
+        utxos = matches.get(item.get("address"))
+        if utxos is not None:
+            utxos.append(item)
+    return _decode_utxos(matches, ogmios_helper.get_ogmios_utxo_content)
+
+
+def _decode_utxos(
+    matches: dict, decode: Optional[Callable]
+) -> Iterator[tuple[str, Optional[list]]]:
+    """Yield the address and the decoded content of the UTxOs of each
+    address of `matches`.
+    """
+    for address, utxos in matches.items():
+        yield address, None if utxos is None else [decode(utxo) for utxo in utxos]
+
+
+def _populate_utxos_fetch_batch(
+    app_context: helpers.AppContext,
+    addresses: list,
+    pairs_config_dict: dict,
+    checkpoints: Optional[SweepCheckpoints] = None,
+    sweep_point: Optional[SweepPoint] = None,
+) -> Iterator[tuple[str, utxo_objects.InitialChainContext, Optional[list]]]:
+    """Read a batch of watched addresses, see
+    _populate_utxos_from_on_chain, and return an iterator yielding the
+    chain context and the UTxOs of each address as they are decoded.
+    """
+    logger.info("reading the UTxOs from %s address(es)...", len(addresses))
+    utxos = _populate_utxos_from_on_chain(
+        app_context=app_context,
+        addresses=addresses,
+        pairs_config_dict=pairs_config_dict,
+        checkpoints=checkpoints,
+    )
+    return (
+        (
+            address,
+            _populate_utxos_make_context(
+                app_context=app_context,
+                address=address,
+                sweep_point=sweep_point,
+            ),
+            address_utxos,
+        )
+        for address, address_utxos in utxos
+    )
+
+
+def _populate_utxos_fetch(
+    app_context: helpers.AppContext,
+    watched_addresses: list,
+    pairs_config_dict: dict,
+    checkpoints: Optional[SweepCheckpoints] = None,
+    sweep_point: Optional[SweepPoint] = None,
+) -> Iterator[tuple[str, utxo_objects.InitialChainContext, list]]:
+    """Read the watched addresses concurrently, up to
+    POPULATE_UTXOS_CONCURRENCY batches at a time, and yield them in the
+    order of watched_addresses whatever the order they are read in.
+
+    Without Kupo, the batches are of OGMIOS_UTXO_QUERY_ADDRESSES
+    addresses read with one Ogmios query each, otherwise of a single
+    address. Each batch is yielded as soon as it and the ones before it
+    are read, decoded address by address, while the next ones are read.
+    Errors reading an address are raised when it is reached. The reads
+    not started yet are cancelled if the caller stops early.
+    """
+    addresses = list(watched_addresses)
+    size = 1 if app_context.kupo_url else max(1, config.OGMIOS_UTXO_QUERY_ADDRESSES)
+    batches = [addresses[idx : idx + size] for idx in range(0, len(addresses), size)]
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(config.POPULATE_UTXOS_CONCURRENCY, len(batches))),
+        thread_name_prefix="populate-utxos",
+    )
+    try:
+        futures = [
+            executor.submit(
+                _populate_utxos_fetch_batch,
+                app_context,
+                batch,
+                pairs_config_dict,
+                checkpoints,
+                sweep_point,
+            )
+            for batch in batches
+        ]
+        for future in futures:
+            yield from future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
 
 
 def _populate_utxos_collect_runner(
@@ -577,48 +1301,54 @@ def _populate_utxos_collect_runner(
     utxos_dict: dict,
     watched_addresses: list,
     pairs_config_dict: dict,
-    thread_event: Event,
+    checkpoints: Optional[SweepCheckpoints] = None,
 ):
-    """Loops through each watched address and populates a UTxO
-    dictionary with updated information.
+    """Reads the watched addresses and populates a UTxO dictionary with
+    updated information, until the app context's thread_event is set.
+
+    The addresses are read concurrently, at the same point, and merged
+    in order so the dictionary is the same as if they were read one at
+    a time.
     """
+    thread_event: Event = app_context.thread_event
 
-    # Loop all watched addresses.
-    for address in watched_addresses:
-        # Make sure that the context is configured correctly.
-        chain_context = _populate_utxos_make_context(
-            app_context=app_context,
-            address=address,
-        )
-        logger.info("reading the UTxOs from the address %s...", address)
-        # Read UTxOs from onchain.
-        utxos = _populate_utxos_from_on_chain(
-            app_context=app_context,
-            address=address,
-        )
-        # Log how many UTxOs were discovered. If we haven't
-        # usable data log the exception.
-        try:
-            logger.info("%s UTxO(s) found", len(utxos))
-        except TypeError as err:
-            logger.error("%s", err)
-            logger.warning("%s", utxos)
-            continue
-        # For each UTxO perform a check to see if they were
-        # configured and if so, save the UTxO.
-        for utxo in utxos:
+    # Every address is read at the same point, on the connection the
+    # ledger state is acquired on, if any.
+    with populate_utxos_sweep_point(app_context) as sweep_point:
+        sweep_context = app_context
+        if sweep_point.ogmios_ws:
+            sweep_context = replace(app_context, ogmios_ws=sweep_point.ogmios_ws)
+        # Loop all watched addresses.
+        for address, chain_context, utxos in _populate_utxos_fetch(
+            app_context=sweep_context,
+            watched_addresses=watched_addresses,
+            pairs_config_dict=pairs_config_dict,
+            checkpoints=checkpoints,
+            sweep_point=sweep_point,
+        ):
+            # Log how many UTxOs were discovered. If we haven't
+            # usable data log the exception.
+            try:
+                logger.info("%s: %s UTxO(s) found", address, len(utxos))
+            except TypeError as err:
+                logger.error("%s", err)
+                logger.warning("%s", utxos)
+                continue
+            # For each UTxO perform a check to see if they were
+            # configured and if so, save the UTxO.
+            for utxo in utxos:
+                if thread_event.is_set():
+                    break
+                for tokens_pair in pairs_config_dict[address]:
+                    # Saves to database if configured.
+                    check_if_configured_pair(
+                        initial_chain_context=chain_context,
+                        tokens_pair=tokens_pair,
+                        utxo=utxo,
+                        utxos_dict=utxos_dict,
+                    )
             if thread_event.is_set():
                 break
-            for tokens_pair in pairs_config_dict[address]:
-                # Saves to database if configured.
-                check_if_configured_pair(
-                    initial_chain_context=chain_context,
-                    tokens_pair=tokens_pair,
-                    utxo=utxo,
-                    utxos_dict=utxos_dict,
-                )
-        if thread_event.is_set():
-            break
 
 
 def populate_utxos(
@@ -631,9 +1361,14 @@ def populate_utxos(
     main_event: Event = app_context.main_event
     reconnect_event: Event = app_context.reconnect_event
     utxos_dict = {}
+    checkpoints = SweepCheckpoints()
     while not thread_event.is_set():
+        if reconnect_event.is_set():
+            # the utxos table is re-populated.
+            checkpoints.reset()
         reconnect_event.clear()
         try:
+            checkpoints.start()
             # NB. needs to return a utxos_dict object not modify it
             # implicitly.
             _populate_utxos_collect_runner(
@@ -641,14 +1376,26 @@ def populate_utxos(
                 utxos_dict=utxos_dict,
                 watched_addresses=watched_addresses,
                 pairs_config_dict=pairs_config_dict,
-                thread_event=thread_event,
+                checkpoints=checkpoints,
             )
             if thread_event.is_set():
                 main_event.set()
                 break
             # Inserts a datapoint into the database if the parameters
             # are correct.
-            save_utxos_dict(app_context.db_name, utxos_dict)
+            if app_context.writer:
+                app_context.writer.write(
+                    _save_utxos_dict,
+                    utxos_dict=utxos_dict,
+                    incremental=checkpoints.incremental,
+                )
+            else:
+                save_utxos_dict(
+                    app_context.db_name,
+                    utxos_dict,
+                    incremental=checkpoints.incremental,
+                )
+            checkpoints.done()
             # Clear the UTxOs dict so as not to maintain state, and
             # then sleep.
             utxos_dict = {}
@@ -667,29 +1414,27 @@ def populate_utxos(
             sleep(1)
         except (
             ConnectionResetError,
-            websocket.WebSocketConnectionClosedException,
             helpers.OgmiosError,
         ) as err:
             logger.error("%s", err)
             sleep(1)
             logger.info("reconnecting to Ogmios...")
             # reconnect to Ogmios
-            ogmios_ws = websocket.create_connection(app_context.ogmios_url)
-            # drop the table utxos on reconnect, to update the table records
-            # start again from the tip
-            intersection = find_start_block(ogmios_ws)
-            logger.info("%s", intersection)
+            try:
+                app_context.ogmios_ws.reconnect()
+            except (ConnectionError, OSError) as conn_err:
+                logger.error("cannot reconnect to Ogmios: %s", conn_err)
         except KeyboardInterrupt:
             main_event.set()
             thread_event.set()
 
 
-def save_utxos_dict(db_name: str, utxos_dict: dict) -> None:
+def save_utxos_dict(db_name: str, utxos_dict: dict, incremental: bool = False) -> None:
     """Wrap _save_utxos_dict to make it testable.
 
     NB. IMPLICIT MODIFIER.
     """
-    conn = sqlite3.connect(db_name)
+    conn = database_initialization.connect(db_name)
     cur = conn.cursor()
     db = dba.DBObject(
         connection=conn,
@@ -698,6 +1443,7 @@ def save_utxos_dict(db_name: str, utxos_dict: dict) -> None:
     _save_utxos_dict(
         database=db,
         utxos_dict=utxos_dict,
+        incremental=incremental,
     )
     # Bookend from the _save_utxos_dict.
     # Double check if we need to close the connection here at all.
@@ -705,8 +1451,115 @@ def save_utxos_dict(db_name: str, utxos_dict: dict) -> None:
     conn.close()
 
 
-def _save_utxos_dict(database: dba.DBObject, utxos_dict: dict) -> None:
-    """Save the liquidity pools UTxOs from the polulate_utxos thread into the database"""
+@dataclass
+class SweepWrites:
+    """Writes collected from a populate_utxos sweep, applied together
+    by apply_sweep_writes.
+    """
+
+    inserts: list[dba.CompleteUTxO] = field(default_factory=list)
+    updates: list[tuple[dba.PartialUTxO, int]] = field(default_factory=list)
+    prices: list[dba.PriceRecord] = field(default_factory=list)
+    block_height: int = 0
+
+
+def collect_utxo_record(
+    database: dba.DBObject,
+    utxo_update_context: utxo_objects.UTxOUpdateContext,
+    tokens_pair: utxo_objects.TokensPair,
+    writes: SweepWrites,
+    incremental: bool = False,
+) -> bool:
+    """Collect the insert or update of the UTxO record of a tokens pair
+    found by the populate_utxos thread, and its price record.
+
+    The pool of an incremental sweep is compared to the ones it read
+    only, it replaces the pool of the record only if bigger.
+
+    Returns True if a write was collected.
+    """
+    pair_name = f"{tokens_pair.pair} on {tokens_pair.source}"
+    query_obj = dba.utxo_source_policy_query_obj(
+        pair=tokens_pair.pair,
+        source=tokens_pair.source,
+        address=utxo_update_context.address,
+        security_token_policy=tokens_pair.security_token_policy,
+        security_token_name=tokens_pair.security_token_name,
+    )
+    res = dba.select_utxo_record_by_source_address_and_policy(
+        db=database, query_obj=query_obj
+    )
+    if not res:
+        logger.info("inserting '%s' into the utxos table...", pair_name)
+        writes.inserts.append(
+            dba.complete_utxo_obj_from_dicts(
+                tokens_pair=tokens_pair,
+                utxo_update_context=utxo_update_context,
+            )
+        )
+    elif utxo_update_allowed(res=res, utxo_update_context=utxo_update_context) and (
+        not incremental or bigger_pool(res=res, utxo_update_context=utxo_update_context)
+    ):
+        logger.info("updating '%s' in the utxos table...", pair_name)
+        writes.updates.append(
+            (
+                dba.partial_utxo_obj(
+                    block_height=utxo_update_context.block_height,
+                    price=utxo_update_context.price,
+                    token_1_amount=utxo_update_context.token_1_amount,
+                    token_2_amount=utxo_update_context.token_2_amount,
+                    tx_hash=utxo_update_context.tx_hash,
+                    tx_index=utxo_update_context.output_index,
+                ),
+                res.row_id,
+            )
+        )
+    else:
+        return False
+    writes.prices.append(
+        dba.price_record_obj_from_dicts(
+            tokens_pair=tokens_pair,
+            utxo_update_context=utxo_update_context,
+        )
+    )
+    writes.block_height = max(writes.block_height, utxo_update_context.block_height)
+    return True
+
+
+def bigger_pool(
+    res: dba.UTxORecordResults,
+    utxo_update_context: utxo_objects.UTxOUpdateContext,
+) -> bool:
+    """Return whether the pool of the context holds more of both tokens
+    than the pool of the record, as utxos_dict_update compares them.
+    """
+    return (
+        utxo_update_context.token_1_amount > res.token_1_amount
+        and utxo_update_context.token_2_amount > res.token_2_amount
+    )
+
+
+def apply_sweep_writes(database: dba.DBObject, writes: SweepWrites) -> None:
+    """Apply the writes of a populate_utxos sweep with executemany and
+    update the status once, in the caller's transaction.
+    """
+    if not writes.prices:
+        return
+    dba.insert_utxos_complete(db=database, utxo_records=writes.inserts)
+    dba.update_utxos_partial(db=database, updates=writes.updates)
+    dba.insert_price_records(db=database, price_records=writes.prices)
+    update_status(db_name="", database=database, block=writes.block_height)
+
+
+def _save_utxos_dict(
+    database: dba.DBObject, utxos_dict: dict, incremental: bool = False
+) -> None:
+    """Save the liquidity pools UTxOs from the polulate_utxos thread into the database.
+
+    The UTxO and price records of the sweep are collected first, then
+    written together, see collect_utxo_record for incremental sweeps.
+    """
+    writes = SweepWrites()
     for pair in utxos_dict:
         for source in utxos_dict[pair]:
             context = utxos_dict[pair][source]["context"]
@@ -724,25 +1577,21 @@ def _save_utxos_dict(database: dba.DBObject, utxos_dict: dict) -> None:
                 token_2_amount=context["token2_amount"],
                 price=context["price"],
             )
-            saved_utxo_record = save_utxo_record(
+            collect_utxo_record(
                 database=database,
                 utxo_update_context=utxo_update_context,
                 tokens_pair=tokens_pair,
+                writes=writes,
+                incremental=incremental,
             )
-            if not saved_utxo_record:
-                continue
-            price_record = dba.price_record_obj_from_dicts(
-                tokens_pair=tokens_pair,
-                utxo_update_context=utxo_update_context,
-            )
-            dba.insert_price_record(db=database, price_record=price_record)
+    apply_sweep_writes(database=database, writes=writes)
 
 
 def update_status(db_name: str, database: dict, block: int) -> None:
     """Update the status table on the script startup"""
     db = database
     if not database:
-        conn = sqlite3.connect(db_name)
+        conn = database_initialization.connect(db_name)
         cur = conn.cursor()
         db = dba.DBObject(
             connection=conn,
@@ -879,7 +1728,9 @@ def parse_utxo(
                 token_2_amount=token2_amount,
                 source=tokens_details.get("source"),
             )
-            dba.insert_price_record(db=database, price_record=price_record)
+            if database:
+                # No database in the submitter's read-only mode.
+                dba.insert_price_record(db=database, price_record=price_record)
             info = {
                 "utxo": f"{utxo['tx_hash']}#{str(utxo['tx_index'])}",
                 "token1_volume": token1_real_amount,
@@ -1022,11 +1873,18 @@ def retrieve_utxo_token_info_from_db(
     database: dba.DBObject,
     tokens_pair: utxo_objects.TokensPair,
     last_block_slot: int,
+    pool_states: derived.LatestPoolStates = None,
 ):
-    """Retrieve utxo and token information from the database."""
-    # Check if the information is in the indexer table "utxos"
-    # Get the current block height from the status table to check if the database data is current or old
-    current_status_block = get_status_block(database.cursor)
+    """Retrieve utxo and token information from the database.
+
+    pool_states are the latest UTxOs loaded at the start of the run,
+    they are read from the database if not given.
+    """
+    # Check if the information is in the indexer table "latest_pool_state"
+    # The status block tells if the database data is current or old
+    if pool_states is None:
+        pool_states = derived.select_latest_pool_states(database)
+    current_status_block = pool_states.status or 0
     query_obj = dba.utxo_source_policy_query_obj(
         pair=tokens_pair.pair,
         source=tokens_pair.source,
@@ -1034,9 +1892,7 @@ def retrieve_utxo_token_info_from_db(
         security_token_policy=tokens_pair.security_token_policy,
         security_token_name=tokens_pair.security_token_name,
     )
-    row = dba.select_utxo_record_by_pair_source_and_policy(
-        db=database, query_obj=query_obj
-    )
+    row = pool_states.get(query_obj)
     logger.info(
         "last_block_slot: %s, current_status_block: %s",
         last_block_slot,
@@ -1080,12 +1936,12 @@ def retrieve_utxo_token_info_from_chain_index(
         tokens_pair.source,
         tokens_pair.address,
     )
-    ogmios_ws: websocket.WebSocket = app_context.ogmios_ws
+    ogmios_ws: ogmios_client.SyncOgmiosClient = app_context.ogmios_ws
     kupo_url: str = app_context.kupo_url
     # 1. Connect to Ogmios.
-    epoch = ogmios_helper.ogmios_epoch(ogmios_ws).get("result", 0)
+    epoch = resolve_epoch(app_context, ogmios_ws, last_block_slot)
     if app_context.use_kupo:
-        utxos = kupo_helper.get_kupo_matches(kupo_url, tokens_pair.address)
+        utxos = kupo_tokens_pairs_matches(kupo_url, tokens_pair.address, [tokens_pair])
     else:
         # 2. Connect to Ogmios.
         result = ogmios_helper.ogmios_addresses_utxos(ogmios_ws, [tokens_pair.address])
@@ -1096,12 +1952,15 @@ def retrieve_utxo_token_info_from_chain_index(
         utxos=utxos,
     )
     info = check_dex_tokens_pair(
-        database=app_context.database,
+        database=None if app_context.read_only else app_context.database,
         epoch=epoch,
         block_height=last_block_slot,
         tokens_pair=tokens_pair,
         utxos=utxos_content,
     )
+    if not app_context.read_only:
+        # commit the price records of the tokens pair in one go.
+        app_context.database.connection.commit()
     if not info:
         logger.error(
             "information object for '%s' couldn't be created", tokens_pair.pair
@@ -1150,6 +2009,7 @@ def check_address_pair(
         database=app_context.database,
         tokens_pair=tokens_pair,
         last_block_slot=last_block_slot,
+        pool_states=app_context.pool_states,
     )
     if info:
         for key, value in info.items():
@@ -1176,7 +2036,7 @@ async def _get_source_messages(
     """Query on-chain for the data we require for each pair at each
     given source.
     """
-    ogmios_ws: websocket.WebSocket = app_context.ogmios_ws
+    ogmios_ws: ogmios_client.SyncOgmiosClient = app_context.ogmios_ws
     last_block_slot = ogmios_helper.ogmios_last_block_slot(ogmios_ws)
     source_messages = []
     for source in tokens_pair.get("sources", []):
@@ -1233,17 +2093,11 @@ async def check_tokens_pair(
     return message, now_dt
 
 
-def validate_and_save_utxo_update(
-    database: dba.DBObject,
+def utxo_update_allowed(
     res: dba.UTxORecordResults,
-    pair_name: str,
     utxo_update_context: utxo_objects.UTxOUpdateContext,
-):
-    """Given a request to save the UTxO check that it can be saved
-    and then perform the database update or insert.
-
-    NB. NEEDS RETURN.
-    """
+) -> bool:
+    """Check that a UTxO record can be updated from the given context."""
     # first, check if the block is more recent than the block when the record was updated previously
     # then, make sure at least one of the tokens amounts is bigger than the previous ones
     # this resolves 2 issues:
@@ -1251,25 +2105,24 @@ def validate_and_save_utxo_update(
     #   1. make sure this is the biggest liquidity pool on this DEX for this tokens pair
     #   2. do not update (the populate_utxos could do this) if nothing has changed (no new transactions occurred)
     #
-    updated = False
     context_block_height = utxo_update_context.block_height
     action = utxo_update_context.caller
     if not context_block_height >= res.block_height:
-        return updated
+        return False
     context_tx_hash = utxo_update_context.tx_hash
     context_output_index = utxo_update_context.output_index
     if (
         f"{res.tx_hash}#{res.output_index}"
         == f"{context_tx_hash}#{context_output_index}"
     ):
-        return updated
+        return False
     token_1_volume = volume_from_tokens(res.token_1_amount, res.token_1_decimals)
     token_2_volume = volume_from_tokens(res.token_2_amount, res.token_2_decimals)
     if not (
         token_1_volume > config.MIN_ADA_AMOUNT
         and token_2_volume > config.MIN_ADA_AMOUNT
     ):
-        return updated
+        return False
     context_utxo_ids = utxo_update_context.utxo_ids
     if not context_utxo_ids:
         context_utxo_ids = []
@@ -1277,7 +2130,26 @@ def validate_and_save_utxo_update(
         (action != ACTION_SAVE_UTXO and len(context_utxo_ids) > 0)
         or action == ACTION_SAVE_UTXO
     ):
+        return False
+    return True
+
+
+def validate_and_save_utxo_update(
+    database: dba.DBObject,
+    res: dba.UTxORecordResults,
+    pair_name: str,
+    utxo_update_context: utxo_objects.UTxOUpdateContext,
+):
+    """Given a request to save the UTxO check that it can be saved
+    and then perform the database update or insert.
+
+    NB. NEEDS RETURN.
+    """
+    updated = False
+    if not utxo_update_allowed(res=res, utxo_update_context=utxo_update_context):
         return updated
+    context_block_height = utxo_update_context.block_height
+    action = utxo_update_context.caller
     logger.info("updating '%s' in the utxos table...", pair_name)
     context_price = utxo_update_context.price
     context_token_1_amount = utxo_update_context.token_1_amount
@@ -1292,6 +2164,17 @@ def validate_and_save_utxo_update(
         tx_hash=context_tx_hash,
         tx_index=context_tx_index,
     )
+    if action == ACTION_SAVE_OUTPUT:
+        # Record the previous values so that the update can be
+        # reverted if the block is rolled back.
+        derived.insert_journal_entry(
+            db=database,
+            slot=context_block_height,
+            table_name=TABLE_UTXOS,
+            row_id=res.row_id,
+            action=derived.JOURNAL_UPDATE,
+            previous=dba.select_utxo_partial_by_id(db=database, id_=res.row_id),
+        )
     dba.update_utxo_partial(db=database, utxo_record=utxo_obj, row_id=res.row_id)
     updated = update_status(
         db_name="",
@@ -1369,34 +2252,6 @@ def save_utxo_record(
     return updated
 
 
-def save_output(
-    app_context: helpers.AppContext,
-    initial_chain_context: utxo_objects.InitialChainContext,
-    tokens_pair: utxo_objects.TokensPair,
-    output_contents: dict,
-):
-    """Wrapper for _save_output to separate database connection
-    calls from function logic.
-
-    NB. IMPLICIT MODIFIER.
-    """
-    conn = sqlite3.connect(app_context.db_name)
-    cur = conn.cursor()
-    db = dba.DBObject(
-        connection=conn,
-        cursor=cur,
-    )
-    _save_output(
-        database=db,
-        initial_chain_context=initial_chain_context,
-        tokens_pair=tokens_pair,
-        output_contents=output_contents,
-    )
-    # Bookend save_output database functions.
-    conn.commit()
-    conn.close()
-
-
 def _save_output(
     database: dba.DBObject,
     initial_chain_context: utxo_objects.InitialChainContext,
@@ -1513,7 +2368,18 @@ def _save_output(
         tokens_pair=tokens_pair,
         utxo_update_context=update_utxo_chain_context,
     )
-    dba.insert_price_record(db=database, price_record=price_record_obj)
+    price_id = dba.insert_price_record(db=database, price_record=price_record_obj)
+    if price_id is None:
+        # the same record is saved already, its row isn't this one's
+        # to delete on a rollback.
+        return
+    derived.insert_journal_entry(
+        db=database,
+        slot=initial_chain_context.block_height,
+        table_name=TABLE_PRICE,
+        row_id=price_id,
+        action=derived.JOURNAL_INSERT,
+    )
     return
 
 
@@ -6,54 +6,74 @@
 import argparse
 import asyncio
 import copy
+import dataclasses
 import logging
 import sys
-from contextlib import closing
 from pathlib import Path
 from threading import Event, Thread
 
-# Third-party imports
-import websocket
-
 # Local imports
 try:
+    import address_index
     import config
     import database_initialization
+    import database_writer
+    import epoch_helper
     import global_helpers as helpers
     import helper_functions
     import kupo_helper
     import load_pairs
-    import ogmios_helper
+    import ogmios_client
+    import price_rollups
 except ModuleNotFoundError:
     try:
-        from src.cnt_collector_node import config, database_initialization
+        from src.cnt_collector_node import (
+            address_index,
+            config,
+            database_initialization,
+            database_writer,
+            epoch_helper,
+        )
         from src.cnt_collector_node import global_helpers as helpers
         from src.cnt_collector_node import (
             helper_functions,
             kupo_helper,
             load_pairs,
-            ogmios_helper,
+            ogmios_client,
+            price_rollups,
         )
     except ModuleNotFoundError:
-        from cnt_collector_node import config, database_initialization
+        from cnt_collector_node import (
+            address_index,
+            config,
+            database_initialization,
+            database_writer,
+            epoch_helper,
+        )
         from cnt_collector_node import global_helpers as helpers
         from cnt_collector_node import (
             helper_functions,
             kupo_helper,
             load_pairs,
-            ogmios_helper,
+            ogmios_client,
+            price_rollups,
         )
 
 logger = logging.getLogger(__name__)
 
 
 def db_init(db_name: str) -> None:
-    """Initialize the database directory if required."""
+    """Initialize the database directory if required.
+
+    The utxos table is kept, it is re-created once the chain-sync is
+    known not to resume from its checkpoints, see
+    helper_functions.start_chain_sync.
+    """
     db_path = Path(db_name)
     if not db_path.parent.exists():
         logger.info("creating database directory: %s", db_path)
         db_path.parent.mkdir(parents=True, exist_ok=True)
-    database_initialization.create_database(db_name)
+    database_initialization.create_database(db_name, drop_utxos=False)
 
 
 def start_thread(target, args: tuple) -> Thread:
@@ -77,64 +97,72 @@ async def indexer_main(
     pairs_config_dict = helpers.read_pairs_config(
         source_config=pairs.DEX_PAIRS.copy(),
     )
-    watched_addresses = list(pairs_config_dict.keys())
-
-    with closing(websocket.create_connection(ogmios_url)) as ogmios_ws:
+    helper_functions.load_dimensions(db_name, pairs_config_dict)
+    watched_addresses = address_index.WatchedAddresses(pairs_config_dict.keys())
+
+    # One connection is shared by the block parser and, through the
+    # sync wrapper, the populate_utxos thread. Requests are tagged with
+    # ids so their responses can be interleaved.
+    async with ogmios_client.OgmiosClient(ogmios_url) as ogmios_shared:
+        ogmios_ws = ogmios_client.SyncOgmiosClient(
+            client=ogmios_shared, loop=asyncio.get_running_loop()
+        )
         if config.USE_KUPO and kupo_url:
             if not kupo_helper.kupo_health(kupo_url):
                 logger.info("kupo is not healthy!")
                 sys.exit(1)
             logger.info("kupo is healthy")
 
-        intersection = helper_functions.find_start_block(ogmios_ws)
-        logger.info(intersection)
-
-        last_block_slot = ogmios_helper.ogmios_last_block_slot(ogmios_ws)
-        helper_functions.update_status(
-            db_name=db_name, database={}, block=last_block_slot
+        # the block parser and the populate_utxos thread submit their
+        # writes to a single writer owning the write connection.
+        writer = database_writer.DatabaseWriter(db_name).start()
+
+        app_context = helpers.AppContext(
+            db_name=db_name,
+            database=None,
+            ogmios_url=ogmios_url,
+            ogmios_ws=ogmios_ws,
+            kupo_url=kupo_url,
+            use_kupo=copy.copy(config.USE_KUPO),
+            main_event=Event(),
+            thread_event=Event(),
+            reconnect_event=Event(),
+            epoch_resolver=epoch_helper.EpochResolver(),
+            writer=writer,
         )
-
-        main_event = Event()
-        thread_event = Event()
-        reconnect_event = Event()
+        # the block parser shares the events and the writer of the
+        # populate_utxos thread, and queries Ogmios from the event loop.
+        parser_context = dataclasses.replace(
+            app_context,
+            ogmios_ws=ogmios_shared,
+            epoch_resolver=epoch_helper.EpochResolver(),
+        )
+        # before the utxos table is populated, it is re-created if the
+        # chain-sync doesn't resume.
+        await helper_functions.start_chain_sync(parser_context)
         thread_populate_utxos = start_thread(
             helper_functions.populate_utxos,
-            (
-                helpers.AppContext(
-                    db_name=db_name,
-                    database=None,
-                    ogmios_url=ogmios_url,
-                    ogmios_ws=ogmios_ws,
-                    kupo_url=kupo_url,
-                    use_kupo=copy.copy(config.USE_KUPO),
-                    main_event=main_event,
-                    thread_event=thread_event,
-                    reconnect_event=reconnect_event,
-                ),
-                watched_addresses,
-                pairs_config_dict,
-            ),
+            (app_context, watched_addresses, pairs_config_dict),
         )
 
-        with closing(websocket.create_connection(ogmios_url)) as ogmios_blocks_ws:
-            await helper_functions.parse_blocks(
-                app_context=helpers.AppContext(
-                    db_name=db_name,
-                    database=None,
-                    ogmios_url=ogmios_url,
-                    ogmios_ws=ogmios_blocks_ws,
-                    kupo_url=kupo_url,
-                    use_kupo=copy.copy(config.USE_KUPO),
-                    main_event=main_event,
-                    thread_event=thread_event,
-                    reconnect_event=reconnect_event,
-                ),
-                watched_addresses=watched_addresses,
-                pairs_config_dict=pairs_config_dict,
-                unsafe=unsafe,
-            )
-        thread_event.set()
-        thread_populate_utxos.join()
+        # aggregates the price history through the writer.
+        thread_price_rollups = start_thread(
+            price_rollups.rollup_prices, (db_name, writer, app_context.thread_event)
+        )
+
+        await helper_functions.parse_blocks(
+            app_context=parser_context,
+            watched_addresses=watched_addresses,
+            pairs_config_dict=pairs_config_dict,
+            unsafe=unsafe,
+        )
+        app_context.thread_event.set()
+        # the thread may be waiting on the shared connection, don't
+        # block the loop serving it.
+        await asyncio.to_thread(thread_populate_utxos.join)
+        await asyncio.to_thread(thread_price_rollups.join)
+        await asyncio.to_thread(writer.stop)
+        writer.log_stats()
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -5,7 +5,7 @@
 # Standard library imports
 import json
 import logging
-from typing import Final
+from typing import Final, Optional
 
 # Third-party imports
 import requests
@@ -47,11 +47,26 @@ def kupo_health(kupo_url: str) -> bool:
         return False
 
 
-def get_kupo_matches(kupo_url: str, pattern: str) -> list:
-    """Get all the matches from Kupo"""
+def get_kupo_matches(
+    kupo_url: str,
+    pattern: str,
+    policy_id: str = "",
+    asset_name: str = "",
+    created_after: Optional[int] = None,
+) -> list:
+    """Get all the matches from Kupo, or only those holding an asset if
+    a policy id is given (any asset of the policy if the asset name is
+    blank), and created after a slot if given.
+    """
     try:
         # Searching for all the matches (UTxOs)
         url = f"{kupo_url}/matches/{pattern}?unspent"
+        if policy_id:
+            url = f"{url}&policy_id={policy_id}"
+            if asset_name:
+                url = f"{url}&asset_name={asset_name}"
+        if created_after is not None:
+            url = f"{url}&created_after={created_after}"
         resp = requests.get(url, timeout=120)
         matches = json.loads(resp.text)
         return matches
@@ -63,6 +78,33 @@ def get_kupo_matches(kupo_url: str, pattern: str) -> list:
         return None
 
 
+def get_kupo_asset_matches(
+    kupo_url: str,
+    pattern: str,
+    assets: list[tuple[str, str]],
+    created_after: Optional[int] = None,
+) -> list:
+    """Get the matches from Kupo holding any of the given assets,
+    (policy id, asset name) tuples, with one query per asset. Matches
+    holding several of the assets are returned once.
+    """
+    matches = {}
+    for policy_id, asset_name in assets:
+        asset_matches = get_kupo_matches(
+            kupo_url, pattern, policy_id, asset_name, created_after
+        )
+        if asset_matches is None:
+            return None
+        for match in asset_matches:
+            matches.setdefault((match["transaction_id"], match["output_index"]), match)
+    return list(matches.values())
+
+
+def kupo_created_slot(utxo: dict) -> int:
+    """Return the slot a Kupo match was created at."""
+    return utxo["created_at"]["slot_no"]
+
+
 def get_kupo_utxo_content(utxo: dict) -> dict:
     """Parse the contents of a Kupo UTxO
     Return a dictionary with the amounts of lovelace and tokens in an UTxO
@@ -0,0 +1,606 @@
+"""Asyncio Ogmios JSON-RPC client.
+
+The client speaks WebSocket (RFC 6455) directly on top of asyncio
+streams so that Ogmios can be queried from the event loop without
+blocking it. Only what Ogmios needs is implemented: text frames,
+fragmented messages, ping/pong and the closing handshake.
+
+SyncOgmiosClient wraps a client for code that isn't async, e.g. the
+populate_utxos thread and the ogmios_helper functions.
+"""
+
+# pylint: disable=R0904
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import ssl
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Final, Optional
+from urllib.parse import urlsplit
+
+try:
+    import block_decoder
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import block_decoder
+    except ModuleNotFoundError:
+        from cnt_collector_node import block_decoder
+
+logger = logging.getLogger(__name__)
+
+JSONRPC_VERSION: Final[str] = "2.0"
+
+WS_GUID: Final[bytes] = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_CONTINUATION: Final[int] = 0x0
+OPCODE_TEXT: Final[int] = 0x1
+OPCODE_BINARY: Final[int] = 0x2
+OPCODE_CLOSE: Final[int] = 0x8
+OPCODE_PING: Final[int] = 0x9
+OPCODE_PONG: Final[int] = 0xA
+
+# Responses end with the id of the request, reading it from the end of
+# the text avoids decoding a response to find out who it is for.
+RESPONSE_ID_RE: Final[re.Pattern] = re.compile(r'"id"\s*:\s*(\d+)\s*}\s*$')
+
+
+class ConnectionClosed(ConnectionResetError):
+    """Exception to raise when the Ogmios connection is closed.
+
+    Subclasses ConnectionResetError so that the existing reconnect
+    handlers catch it.
+    """
+
+
+class HandshakeError(ConnectionError):
+    """Exception to raise when the WebSocket handshake fails."""
+
+
+def message(method: str, params: Optional[dict] = None) -> dict:
+    """Return an Ogmios JSON-RPC request."""
+    msg = {"jsonrpc": JSONRPC_VERSION, "method": method}
+    if params is not None:
+        msg["params"] = params
+    return msg
+
+
+def decode_response(raw: str) -> dict:
+    """Decode a response, return an empty dict if it cannot be decoded."""
+    try:
+        resp = block_decoder.loads(raw)
+    except ValueError as err:
+        logger.error("cannot decode Ogmios response: %s", err)
+        return {}
+    return resp if isinstance(resp, dict) else {}
+
+
+def response_id(raw: str) -> Optional[int]:
+    """Return the id at the end of a raw response, if there is one."""
+    match = RESPONSE_ID_RE.search(raw[-64:])
+    return int(match.group(1)) if match else None
+
+
+def _mask(data: bytes, key: bytes) -> bytes:
+    """Mask (or unmask) a frame payload."""
+    if not data:
+        return data
+    size = len(data)
+    repeated = (key * (size // 4 + 1))[:size]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")).to_bytes(
+        size, "big"
+    )
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = True) -> bytes:
+    """Encode a single, final, WebSocket frame.
+
+    Frames sent by clients must be masked, frames sent by servers must
+    not be.
+    """
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    size = len(payload)
+    if size < 126:
+        header.append(mask_bit | size)
+    elif size < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", size)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", size)
+    if not mask:
+        return bytes(header) + payload
+    key = os.urandom(4)
+    return bytes(header) + key + _mask(payload, key)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[bool, int, bytes]:
+    """Read a WebSocket frame and return its fin bit, opcode and
+    unmasked payload.
+    """
+    try:
+        first, second = await reader.readexactly(2)
+        size = second & 0x7F
+        if size == 126:
+            (size,) = struct.unpack("!H", await reader.readexactly(2))
+        elif size == 127:
+            (size,) = struct.unpack("!Q", await reader.readexactly(8))
+        key = await reader.readexactly(4) if second & 0x80 else b""
+        payload = await reader.readexactly(size)
+    except asyncio.IncompleteReadError as err:
+        raise ConnectionClosed("connection closed by Ogmios") from err
+    if key:
+        payload = _mask(payload, key)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def handshake_request(netloc: str, path: str, query: str, key: str) -> bytes:
+    """Return the HTTP request upgrading a connection to WebSocket."""
+    path = path or "/"
+    if query:
+        path = f"{path}?{query}"
+    return (
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {netloc}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n"
+        "\r\n"
+    ).encode()
+
+
+def check_handshake_response(response: bytes, key: str) -> None:
+    """Raise a HandshakeError unless the server accepted the upgrade
+    requested with `key`.
+    """
+    status, *lines = response.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+    if " 101 " not in f"{status} " or headers.get("sec-websocket-accept") != accept:
+        raise HandshakeError(f"websocket handshake failed: {status}")
+
+
+class WebSocket:
+    """Minimal asyncio WebSocket client connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, url: str, timeout: float = 30) -> "WebSocket":
+        """Open a connection to a ws:// or wss:// URL."""
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parts.hostname,
+                parts.port or (443 if secure else 80),
+                ssl=ssl.create_default_context() if secure else None,
+                limit=2**20,
+            ),
+            timeout,
+        )
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(handshake_request(parts.netloc, parts.path, parts.query, key))
+        await writer.drain()
+        response = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        try:
+            check_handshake_response(response, key)
+        except HandshakeError:
+            writer.close()
+            raise
+        return cls(reader, writer)
+
+    async def send(self, text: str) -> None:
+        """Send a text message."""
+        if self.closed:
+            raise ConnectionClosed("connection to Ogmios is closed")
+        self.writer.write(encode_frame(OPCODE_TEXT, text.encode()))
+        await self.writer.drain()
+
+    async def recv(self) -> str:
+        """Receive the next text message, answering pings on the way."""
+        fragments = []
+        while True:
+            if self.closed:
+                raise ConnectionClosed("connection to Ogmios is closed")
+            fin, opcode, payload = await read_frame(self.reader)
+            if opcode == OPCODE_PING:
+                self.writer.write(encode_frame(OPCODE_PONG, payload))
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode == OPCODE_CLOSE:
+                await self.close(payload[:2])
+                raise ConnectionClosed("connection closed by Ogmios")
+            fragments.append(payload)
+            if fin:
+                return b"".join(fragments).decode()
+
+    async def close(self, code: bytes = struct.pack("!H", 1000)) -> None:
+        """Send a close frame and close the connection."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.writer.write(encode_frame(OPCODE_CLOSE, code))
+            await self.writer.drain()
+        except (ConnectionError, RuntimeError):
+            pass
+        self.writer.close()
+
+
+@dataclass
+class MethodLatency:
+    """Round-trip latency of the requests made for one method."""
+
+    count: int = 0
+    total: float = 0.0
+    maximum: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        """Mean round-trip time in seconds."""
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, elapsed: float) -> None:
+        """Record the round-trip time of a request."""
+        self.count += 1
+        self.total += elapsed
+        self.maximum = max(self.maximum, elapsed)
+
+
+@dataclass
+class ClientStats:
+    """Metrics of an Ogmios client."""
+
+    requests: int = 0
+    max_in_flight: int = 0
+    latency: dict[str, MethodLatency] = field(default_factory=dict)
+
+
+@dataclass
+class PendingRequest:
+    """Request waiting for its response."""
+
+    future: asyncio.Future
+    method: str
+    started: float
+    decode: Callable[[str], dict] = decode_response
+
+
+class OgmiosClient:
+    """Ogmios JSON-RPC client for use from the event loop.
+
+    Every request is tagged with a JSON-RPC id and a reader task routes
+    the responses to the futures of the callers waiting for them, so
+    any number of requests can be in flight on one connection, from
+    any number of coroutines (or threads via SyncOgmiosClient).
+
+    `send` and `receive` keep the pipelining interface of the chain-sync:
+    responses to the requests sent with `send` are returned in order
+    by `receive`. They are meant for a single consumer.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.ws: Optional[WebSocket] = None
+        self.stats = ClientStats()
+        self._pending: dict[int, PendingRequest] = {}
+        self._sent: deque[asyncio.Future] = deque()
+        self._reader: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests waiting for a response."""
+        return len(self._pending)
+
+    async def connect(self) -> "OgmiosClient":
+        """Connect to Ogmios."""
+        self.ws = await WebSocket.connect(self.url)
+        self._reader = asyncio.create_task(self._read_responses(self.ws))
+        if not self._connect_lock:
+            self._connect_lock = asyncio.Lock()
+        return self
+
+    async def reconnect(self) -> None:
+        """Replace the connection if it was closed, e.g. after Ogmios
+        restarted.
+
+        Safe to call from every user of a shared client, the first call
+        reconnects and the following ones find the new connection open.
+        """
+        async with self._connect_lock:
+            if self.ws and not self.ws.closed:
+                return
+            await self.close()
+            await self.connect()
+
+    async def close(self) -> None:
+        """Close the connection to Ogmios."""
+        if self.ws:
+            await self.ws.close()
+        if self._reader:
+            self._reader.cancel()
+            self._reader = None
+        self._fail_pending(ConnectionClosed("connection to Ogmios is closed"))
+
+    async def __aenter__(self) -> "OgmiosClient":
+        return await self.connect()
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def submit(
+        self, msg: dict, decode: Callable[[str], dict] = decode_response
+    ) -> asyncio.Future:
+        """Send a request and return a future for its response.
+
+        `decode` is called with the raw text of the response, e.g. to
+        decode blocks partially.
+        """
+        if not self.ws or self.ws.closed:
+            raise ConnectionClosed("not connected to Ogmios")
+        # requests are numbered from 1.
+        self.stats.requests += 1
+        id_ = self.stats.requests
+        future = asyncio.get_running_loop().create_future()
+        self._pending[id_] = PendingRequest(
+            future=future,
+            method=msg.get("method", ""),
+            started=time.monotonic(),
+            decode=decode,
+        )
+        self.stats.max_in_flight = max(self.stats.max_in_flight, self.in_flight)
+        try:
+            await self.ws.send(json.dumps({**msg, "id": id_}))
+        except ConnectionError:
+            self._pending.pop(id_, None)
+            raise
+        return future
+
+    async def request(self, msg: dict) -> dict:
+        """Send a request and return its response."""
+        return await (await self.submit(msg))
+
+    async def send(
+        self, msg: dict, decode: Callable[[str], dict] = decode_response
+    ) -> None:
+        """Send a request, its response is returned by `receive`."""
+        self._sent.append(await self.submit(msg, decode))
+
+    async def receive(self) -> dict:
+        """Receive the response to the oldest request sent with `send`."""
+        if not self._sent:
+            raise ConnectionClosed("no response pending")
+        return await self._sent.popleft()
+
+    def log_stats(self) -> None:
+        """Log the requests in flight and the latency per method."""
+        logger.info(
+            "ogmios requests: %s, in flight: %s (max: %s)",
+            self.stats.requests,
+            self.in_flight,
+            self.stats.max_in_flight,
+        )
+        for method, latency in sorted(self.stats.latency.items()):
+            logger.info(
+                "ogmios '%s': %s request(s), mean: %.1fms, max: %.1fms",
+                method,
+                latency.count,
+                latency.mean * 1000,
+                latency.maximum * 1000,
+            )
+
+    async def _read_responses(self, ws: WebSocket) -> None:
+        """Route the responses to the futures waiting for them."""
+        try:
+            while True:
+                raw = await ws.recv()
+                resp = None
+                id_ = response_id(raw)
+                if id_ is None:
+                    resp = decode_response(raw)
+                    id_ = resp.get("id")
+                pending = self._pending.pop(id_, None)
+                if not pending:
+                    logger.warning("unexpected Ogmios response: %s", raw[:256])
+                    continue
+                self.stats.latency.setdefault(pending.method, MethodLatency()).add(
+                    time.monotonic() - pending.started
+                )
+                if pending.future.done():
+                    continue
+                try:
+                    if resp is None:
+                        resp = pending.decode(raw)
+                    pending.future.set_result(resp)
+                except Exception as err:  # pylint: disable=W0718
+                    pending.future.set_exception(err)
+        except ConnectionError as err:
+            await ws.close()
+            self._fail_pending(err)
+
+    def _fail_pending(self, err: Exception) -> None:
+        """Raise a connection error in every caller waiting for a response."""
+        pending = [request.future for request in self._pending.values()]
+        self._pending.clear()
+        self._sent.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(err)
+                # Responses nobody waits for any more (e.g. pipelined
+                # requests) must not log "exception never retrieved".
+                future.exception()
+
+    async def tip(self) -> dict:
+        """Ogmios tip"""
+        return await self.request(message("queryNetwork/tip"))
+
+    async def epoch(self) -> dict:
+        """Ogmios epoch"""
+        return await self.request(message("queryLedgerState/epoch"))
+
+    async def era_summaries(self) -> dict:
+        """Ogmios era summaries"""
+        return await self.request(message("queryLedgerState/eraSummaries"))
+
+    async def find_intersection(self, points: list) -> dict:
+        """Ogmios intersection given a list of candidate points, most
+        recent first.
+        """
+        return await self.request(message("findIntersection", {"points": points}))
+
+    async def next_block(self) -> dict:
+        """Ogmios next block"""
+        return await self.request(message("nextBlock"))
+
+    async def request_next_block(
+        self, decode: Callable[[str], dict] = decode_response
+    ) -> None:
+        """Ogmios next block, request only.
+
+        Ogmios answers pipelined nextBlock requests in the order they
+        were sent, the responses are read with `receive`.
+        """
+        await self.send(message("nextBlock"), decode)
+
+    async def utxos_by_address(self, addresses: list) -> dict:
+        """Ogmios UTxOs at the given addresses"""
+        return await self.request(
+            message("queryLedgerState/utxo", {"addresses": addresses})
+        )
+
+    async def acquire_ledger_state(self, point: Any) -> dict:
+        """Ogmios acquire ledger state"""
+        return await self.request(message("acquireLedgerState", {"point": point}))
+
+    async def release_ledger_state(self) -> dict:
+        """Ogmios release ledger state"""
+        return await self.request(message("releaseLedgerState"))
+
+    async def mempool_size(self) -> dict:
+        """Ogmios mempool size"""
+        return await self.request(message("sizeOfMempool"))
+
+    async def mempool_acquire(self) -> dict:
+        """Ogmios mempool snapshot"""
+        return await self.request(message("acquireMempool"))
+
+    async def mempool_release(self) -> dict:
+        """Ogmios mempool release"""
+        return await self.request(message("releaseMempool"))
+
+    async def mempool_transactions(self) -> dict:
+        """Ogmios mempool transactions"""
+        return await self.request(message("nextTransaction", {"fields": "all"}))
+
+
+class SyncOgmiosClient:
+    """Blocking wrapper around an OgmiosClient.
+
+    Either runs its own client on an event loop in a background thread,
+    or shares a client running on another loop (e.g. the indexer's main
+    loop) so that threads can use the same connection. Calls block the
+    calling thread until the response arrives and must not be made from
+    the thread running the loop.
+    """
+
+    def __init__(
+        self,
+        url: str = "",
+        client: Optional[OgmiosClient] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self._sent: deque[asyncio.Future] = deque()
+        self._thread: Optional[threading.Thread] = None
+        if client is not None:
+            self.client = client
+            self.loop = loop
+            return
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="ogmios-client", daemon=True
+        )
+        self._thread.start()
+        self.client = OgmiosClient(url)
+        try:
+            self.run(self.client.connect())
+        except Exception:
+            self._stop()
+            raise
+
+    def run(self, coro) -> Any:
+        """Run a coroutine on the client's loop and return its result."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coro.close()
+            raise RuntimeError("SyncOgmiosClient called from its own event loop")
+        future: Future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result()
+
+    def request(self, msg: dict) -> dict:
+        """Send a request and return its response."""
+        return self.run(self.client.request(msg))
+
+    def send(self, msg: dict) -> None:
+        """Send a request, its response is returned by `receive`."""
+        self._sent.append(self.run(self.client.submit(msg)))
+
+    def receive(self) -> dict:
+        """Receive the response to the oldest request sent with `send`."""
+        if not self._sent:
+            raise ConnectionClosed("no response pending")
+        return self.run(_wait(self._sent.popleft()))
+
+    def reconnect(self) -> None:
+        """Replace the connection if it was closed."""
+        self._sent.clear()
+        self.run(self.client.reconnect())
+
+    def close(self) -> None:
+        """Close the connection and stop the background loop.
+
+        Shared clients are left to their owner to close.
+        """
+        if self._thread is None or self.loop.is_closed():
+            return
+        self.run(self.client.close())
+        self._stop()
+
+    def _stop(self) -> None:
+        """Stop the background loop."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def __enter__(self) -> "SyncOgmiosClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+async def _wait(future: asyncio.Future) -> Any:
+    """Await a future from run_coroutine_threadsafe."""
+    return await future
@@ -8,9 +8,16 @@ from typing import Dict, Final, List, Union
 
 import requests
 import requests.exceptions
-import websocket
 
-JSONRPC_VERSION = "2.0"
+try:
+    import ogmios_client
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import ogmios_client
+    except ModuleNotFoundError:
+        from cnt_collector_node import ogmios_client
+
+JSONRPC_VERSION = ogmios_client.JSONRPC_VERSION
 
 logger = logging.getLogger(__name__)
 
@@ -34,24 +41,44 @@ def ogmios_version(ogmios_url: str) -> str:
         raise
 
 
-def send_ws_request(ws: websocket.WebSocket, msg: dict) -> dict:
+def send_ws_request(ws: ogmios_client.SyncOgmiosClient, msg: dict) -> dict:
     """Send a WebSocket request and return the response."""
     try:
-        ws.send(json.dumps(msg))
-        resp = json.loads(ws.recv())
-        return resp
-    except (websocket.WebSocketException, json.JSONDecodeError, BrokenPipeError) as err:
+        return ws.request(msg)
+    except (ConnectionError, OSError) as err:
+        logger.error("websocket communication failed: %s", err)
+        return {}
+
+
+def send_ws_message(ws: ogmios_client.SyncOgmiosClient, msg: dict) -> bool:
+    """Send a WebSocket request without waiting for the response.
+
+    Used to pipeline requests, the responses are collected in order
+    using receive_ws_response.
+    """
+    try:
+        ws.send(msg)
+        return True
+    except (ConnectionError, OSError) as err:
+        logger.error("websocket communication failed: %s", err)
+        return False
+
+
+def receive_ws_response(ws: ogmios_client.SyncOgmiosClient) -> dict:
+    """Receive the next WebSocket response."""
+    try:
+        return ws.receive()
+    except (ConnectionError, OSError) as err:
         logger.error("websocket communication failed: %s", err)
         return {}
 
 
-def ogmios_tip(ws: websocket.WebSocket) -> dict:
+def ogmios_tip(ws: ogmios_client.SyncOgmiosClient) -> dict:
     """Ogmios tip"""
-    msg = {"jsonrpc": JSONRPC_VERSION, "method": "queryNetwork/tip"}
-    return send_ws_request(ws, msg)
+    return send_ws_request(ws, ogmios_client.message("queryNetwork/tip"))
 
 
-def ogmios_last_block_slot(ws: websocket.WebSocket) -> int | None:
+def ogmios_last_block_slot(ws: ogmios_client.SyncOgmiosClient) -> int | None:
     """Find out the latest block slot."""
     tip = ogmios_tip(ws).get("result")
     if not tip:
@@ -59,74 +86,94 @@ def ogmios_last_block_slot(ws: websocket.WebSocket) -> int | None:
     return tip.get("slot") if tip else None
 
 
-def ogmios_epoch(ws: websocket.WebSocket) -> dict:
+def ogmios_epoch(ws: ogmios_client.SyncOgmiosClient) -> dict:
     """Ogmios epoch"""
-    msg = {"jsonrpc": JSONRPC_VERSION, "method": "queryLedgerState/epoch"}
-    return send_ws_request(ws, msg)
+    return send_ws_request(ws, ogmios_client.message("queryLedgerState/epoch"))
+
 
+def ogmios_era_summaries(ws: ogmios_client.SyncOgmiosClient) -> dict:
+    """Ogmios era summaries"""
+    return send_ws_request(ws, ogmios_client.message("queryLedgerState/eraSummaries"))
 
-def ogmios_intersection(ws: websocket.WebSocket, point: dict) -> dict:
+
+def ogmios_intersection(ws: ogmios_client.SyncOgmiosClient, point: dict) -> dict:
     """Ogmios intersection"""
-    msg = {
-        "jsonrpc": JSONRPC_VERSION,
-        "method": "findIntersection",
-        "params": {"points": [point]},
-    }
-    return send_ws_request(ws, msg)
+    return ogmios_intersection_points(ws, [point])
 
 
-async def ogmios_next_block(ws: websocket.WebSocket) -> dict:
+def ogmios_intersection_points(
+    ws: ogmios_client.SyncOgmiosClient, points: List[dict]
+) -> dict:
+    """Ogmios intersection given a list of candidate points.
+
+    Ogmios returns the first point in the list that is on the chain,
+    points should be ordered from most to least recent.
+    """
+    return send_ws_request(
+        ws, ogmios_client.message("findIntersection", {"points": points})
+    )
+
+
+async def ogmios_next_block(client: ogmios_client.OgmiosClient) -> dict:
     """Ogmios next block"""
-    msg = {"jsonrpc": JSONRPC_VERSION, "method": "nextBlock"}
-    return send_ws_request(ws, msg)
+    return await client.next_block()
 
 
-def ogmios_addresses_utxos(ws: websocket.WebSocket, addresses: List[str]) -> Dict:
-    """Ogmios intersection"""
-    msg = {
-        "jsonrpc": JSONRPC_VERSION,
-        "method": "queryLedgerState/utxo",
-        "params": {"addresses": addresses},
-    }
-    return send_ws_request(ws, msg)
+def ogmios_request_next_block(ws: ogmios_client.SyncOgmiosClient) -> bool:
+    """Ogmios next block, request only.
+
+    Ogmios answers pipelined nextBlock requests in the order they were
+    sent, so several requests can be in flight at once.
+    """
+    return send_ws_message(ws, ogmios_client.message("nextBlock"))
 
 
-def ogmios_acquire_ledger_state(ws: websocket.WebSocket, point) -> dict:
+async def ogmios_receive_next_block(client: ogmios_client.OgmiosClient) -> dict:
+    """Ogmios next block, response only."""
+    return await client.receive()
+
+
+def ogmios_addresses_utxos(
+    ws: ogmios_client.SyncOgmiosClient, addresses: List[str]
+) -> Dict:
+    """Ogmios UTxOs at the given addresses"""
+    return send_ws_request(
+        ws, ogmios_client.message("queryLedgerState/utxo", {"addresses": addresses})
+    )
+
+
+def ogmios_acquire_ledger_state(ws: ogmios_client.SyncOgmiosClient, point) -> dict:
     """Ogmios acquire ledger state"""
-    msg = {
-        "jsonrpc": JSONRPC_VERSION,
-        "method": "acquireLedgerState",
-        "params": {"point": point},
-    }
-    return send_ws_request(ws, msg)
+    return send_ws_request(
+        ws, ogmios_client.message("acquireLedgerState", {"point": point})
+    )
+
 
+def ogmios_release_ledger_state(ws: ogmios_client.SyncOgmiosClient) -> dict:
+    """Ogmios release ledger state"""
+    return send_ws_request(ws, ogmios_client.message("releaseLedgerState"))
 
-def ogmios_mempool_size(ws: websocket.WebSocket) -> dict:
+
+def ogmios_mempool_size(ws: ogmios_client.SyncOgmiosClient) -> dict:
     """Ogmios mempool size"""
-    msg = {"jsonrpc": JSONRPC_VERSION, "method": "sizeOfMempool"}
-    return send_ws_request(ws, msg)
+    return send_ws_request(ws, ogmios_client.message("sizeOfMempool"))
 
 
-def ogmios_mempool_acquire(ws: websocket.WebSocket) -> dict:
+def ogmios_mempool_acquire(ws: ogmios_client.SyncOgmiosClient) -> dict:
     """Ogmios mempool snapshot"""
-    msg = {"jsonrpc": JSONRPC_VERSION, "method": "acquireMempool"}
-    return send_ws_request(ws, msg)
+    return send_ws_request(ws, ogmios_client.message("acquireMempool"))
 
 
-def ogmios_mempool_release(ws: websocket.WebSocket) -> dict:
+def ogmios_mempool_release(ws: ogmios_client.SyncOgmiosClient) -> dict:
     """Ogmios mempool release"""
-    msg = {"jsonrpc": JSONRPC_VERSION, "method": "releaseMempool"}
-    return send_ws_request(ws, msg)
+    return send_ws_request(ws, ogmios_client.message("releaseMempool"))
 
 
-def ogmios_mempool_transactions(ws: websocket.WebSocket) -> dict:
+def ogmios_mempool_transactions(ws: ogmios_client.SyncOgmiosClient) -> dict:
     """Ogmios mempool transactions"""
-    msg = {
-        "jsonrpc": JSONRPC_VERSION,
-        "method": "nextTransaction",
-        "params": {"fields": "all"},
-    }
-    return send_ws_request(ws, msg)
+    return send_ws_request(
+        ws, ogmios_client.message("nextTransaction", {"fields": "all"})
+    )
 
 
 def get_output_content(output: dict) -> dict:
@@ -0,0 +1,218 @@
+"""Roll up the price history into OHLC buckets and apply the retention
+of the raw price records.
+
+Price records are read in id order from the last one rolled up and
+aggregated into per-minute and per-hour buckets of block time, from the
+slot of each record, per pair and source:
+open, high, low and close price, the pool's token amounts at the close
+(the volumes the submitter weighs prices by) and the number of updates.
+Only records older than the undo journal are rolled up, so that a
+rollback never has to revert a bucket.
+
+Once rolled up, raw records older than the retention window can be
+deleted. Both run in a background thread that submits them to the
+database writer a batch at a time, so the indexer's writes queued behind
+them wait for one batch at most. The thread also checkpoints the history
+database, when the price history is kept in one.
+"""
+
+import logging
+import sqlite3
+import time
+from itertools import takewhile
+from threading import Event
+from typing import Callable, Final, Optional
+
+try:
+    import config
+    import database_abstraction as dba
+    import database_derived as derived
+    import database_initialization
+    import database_writer
+    import epoch_helper
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import config
+        from src.cnt_collector_node import database_abstraction as dba
+        from src.cnt_collector_node import database_derived as derived
+        from src.cnt_collector_node import (
+            database_initialization,
+            database_writer,
+            epoch_helper,
+        )
+    except ModuleNotFoundError:
+        from cnt_collector_node import config
+        from cnt_collector_node import database_abstraction as dba
+        from cnt_collector_node import database_derived as derived
+        from cnt_collector_node import (
+            database_initialization,
+            database_writer,
+            epoch_helper,
+        )
+
+logger = logging.getLogger(__name__)
+
+# Bucket sizes in seconds.
+BUCKET_SECONDS: Final[tuple[int, ...]] = (60, 3600)
+
+MS_PER_DAY: Final[int] = 86400 * 1000
+
+
+def bucket_start(date_time: int, seconds: int) -> int:
+    """Return the start of the bucket of the given size a timestamp
+    (milliseconds since the epoch) falls in.
+    """
+    return date_time - date_time % (seconds * 1000)
+
+
+def aggregate(records: list[derived.StoredPriceRecord]) -> list[derived.PriceRollup]:
+    """Aggregate price records, in id order, into rollup buckets of the
+    time of their slots.
+
+    The date_time of a record is when it was saved, hours after its
+    block when the indexer catches up, it isn't used.
+    """
+    buckets: dict[tuple, derived.PriceRollup] = {}
+    for record in records:
+        block_time = epoch_helper.slot_time_ms(record.block_height)
+        for seconds in BUCKET_SECONDS:
+            key = (
+                seconds,
+                record.pair_id,
+                record.source_id,
+                bucket_start(block_time, seconds),
+            )
+            bucket = buckets.get(key)
+            if not bucket:
+                buckets[key] = derived.PriceRollup(
+                    *key,
+                    open=record.price,
+                    high=record.price,
+                    low=record.price,
+                    close=record.price,
+                    token_1_amount=record.token_1_amount,
+                    token_2_amount=record.token_2_amount,
+                    updates=1,
+                    open_price_id=record.id_,
+                    close_price_id=record.id_,
+                )
+                continue
+            bucket.high = max(bucket.high, record.price)
+            bucket.low = min(bucket.low, record.price)
+            bucket.close = record.price
+            bucket.token_1_amount = record.token_1_amount
+            bucket.token_2_amount = record.token_2_amount
+            bucket.updates += 1
+            bucket.close_price_id = record.id_
+    return list(buckets.values())
+
+
+def final_slot(database: dba.DBObject) -> Optional[int]:
+    """Return the last slot that can no longer be rolled back, i.e.
+    that is out of the undo journal.
+    """
+    slot = dba.get_status(database)
+    if slot is None:
+        return None
+    return slot - config.JOURNAL_RETENTION_SLOTS
+
+
+def rollup_batch(database: dba.DBObject, limit: int) -> int:
+    """Roll up the next price records that can no longer be rolled
+    back, up to `limit`, and return how many were rolled up.
+    """
+    last_price_id = derived.get_rollup_status(database)
+    if last_price_id is None:
+        last_price_id = 0
+        derived.insert_rollup_status(database, last_price_id)
+    slot = final_slot(database)
+    if slot is None:
+        return 0
+    records = list(
+        takewhile(
+            lambda record: record.block_height <= slot,
+            derived.select_price_records_after(database, last_price_id, limit),
+        )
+    )
+    if not records:
+        return 0
+    derived.upsert_price_rollups(database, aggregate(records))
+    derived.update_rollup_status(database, records[-1].id_)
+    return len(records)
+
+
+def prune_batch(database: dba.DBObject, now: int, limit: int) -> int:
+    """Delete up to `limit` of the rolled up price records older than
+    the retention window and return how many were deleted.
+    """
+    if config.PRICE_RETENTION_DAYS <= 0:
+        return 0
+    last_price_id = derived.get_rollup_status(database)
+    if not last_price_id:
+        return 0
+    return derived.prune_price_records(
+        database,
+        id_=last_price_id,
+        before=now - config.PRICE_RETENTION_DAYS * MS_PER_DAY,
+        limit=limit,
+    )
+
+
+def _run_batches(batch, limit: int, thread_event: Optional[Event]) -> int:
+    """Run batches until one is short of `limit` and return the number
+    of records they processed.
+    """
+    total = 0
+    while not (thread_event and thread_event.is_set()):
+        count = batch()
+        total += count
+        if count < limit:
+            break
+    return total
+
+
+def run_rollups(
+    write: Callable[..., int], thread_event: Optional[Event] = None
+) -> tuple[int, int]:
+    """Roll up and prune the price records until caught up and return
+    the number of records rolled up and deleted.
+
+    `write(function, *args)` applies `function(database, *args)` in a
+    transaction and returns its result, e.g. DatabaseWriter.write.
+    """
+    limit = config.PRICE_ROLLUP_BATCH
+    rolled_up = _run_batches(lambda: write(rollup_batch, limit), limit, thread_event)
+    deleted = _run_batches(
+        lambda: write(prune_batch, time.time_ns() // 1_000_000, limit),
+        limit,
+        thread_event,
+    )
+    return rolled_up, deleted
+
+
+def rollup_prices(
+    db_name: str, writer: database_writer.DatabaseWriter, thread_event: Event
+) -> None:
+    """Roll up the price history through the database writer every
+    PRICE_ROLLUP_INTERVAL seconds until the thread event is set.
+
+    The thread's own connection only checkpoints the history database,
+    a checkpoint cannot run in the writer's transactions.
+    """
+    conn = database_initialization.connect(db_name)
+    try:
+        while not thread_event.is_set():
+            try:
+                rolled_up, deleted = run_rollups(writer.write, thread_event)
+                if rolled_up or deleted:
+                    logger.info(
+                        "price records rolled up: %s, deleted: %s", rolled_up, deleted
+                    )
+                database_initialization.checkpoint_history(conn)
+            except (sqlite3.OperationalError, database_writer.WriterError) as err:
+                # e.g. the database stayed locked past the busy timeout,
+                # the batch is retried on the next run.
+                logger.error("cannot roll up the price records: %s", err)
+            thread_event.wait(config.PRICE_ROLLUP_INTERVAL)
+    finally:
+        conn.close()
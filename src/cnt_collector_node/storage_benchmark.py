@@ -0,0 +1,511 @@
+"""Benchmark the SQLite storage profiles.
+
+A writer thread saves blocks the way the indexer does, one transaction
+per block updating the status, UTxOs and price records, while a reader
+thread queries the latest UTxO of a pair the way the submitter does.
+For each profile the write throughput (blocks per second) and the
+reader latency are reported.
+
+Both go through StorageBackend, the storage operations of a block: the
+status, UTxO lookups by output reference or by pair and source, UTxO
+upserts and price appends. SQLiteStorage implements it on a database
+connection through database_abstraction, MemoryStorage in dictionaries
+without any I/O, the zero-I/O baseline the "memory" profile benchmarks.
+The backends only serve the benchmark, the indexer and the submitter
+use database_abstraction.
+
+    python -m src.cnt_collector_node.storage_benchmark --blocks 2000
+"""
+
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Callable, Optional, Protocol
+
+try:
+    import database_abstraction as dba
+    import database_initialization
+except ModuleNotFoundError:
+    try:
+        from src.cnt_collector_node import database_abstraction as dba
+        from src.cnt_collector_node import database_initialization
+    except ModuleNotFoundError:
+        from cnt_collector_node import database_abstraction as dba
+        from cnt_collector_node import database_initialization
+
+SECURITY_TOKEN_POLICY = "benchmark_policy"
+
+# Profile name of the in-memory storage backend.
+MEMORY_PROFILE = "memory"
+
+
+class StorageBackend(Protocol):
+    """Storage operations of a block, as benchmarked."""
+
+    def get_status(self) -> Optional[int]:
+        """Return the slot of the last block processed, if any."""
+
+    def set_status(self, block: int) -> None:
+        """Save the slot of the last block processed."""
+
+    def utxo_by_outref(
+        self, tx_hash: str, output_index: int
+    ) -> Optional[dba.UTxORecordResults]:
+        """Return the UTxO record of a transaction output."""
+
+    def utxo_by_pair_source(
+        self, query_obj: dba.UTxOSourcePolicyQueryParams
+    ) -> Optional[dba.UTxOSourcePolicyResults]:
+        """Return the latest UTxO of a pair on a source with the given
+        security token, whatever its address.
+        """
+
+    def upsert_utxo(self, utxo_record: dba.CompleteUTxO) -> int:
+        """Insert the UTxO record of a pair, source, address and
+        security token, or update the existing one, and return its id.
+        """
+
+    def append_price(self, price_record: dba.PriceRecord) -> Optional[int]:
+        """Append a price record and return its id, None if it is
+        already saved.
+        """
+
+    def commit(self) -> None:
+        """Make the changes so far durable."""
+
+    def close(self) -> None:
+        """Release the resources of the backend."""
+
+
+def _partial_utxo(utxo_record: dba.CompleteUTxO) -> dba.PartialUTxO:
+    """Return the values of a UTxO record that change on updates."""
+    return dba.partial_utxo_obj(
+        block_height=utxo_record.block_height,
+        price=utxo_record.price,
+        token_1_amount=utxo_record.token_1_amount,
+        token_2_amount=utxo_record.token_2_amount,
+        tx_hash=utxo_record.tx_hash,
+        tx_index=utxo_record.tx_index,
+    )
+
+
+def _utxo_key(utxo_record) -> tuple[str, str, str, str, str]:
+    """Return the pair, source, address and security token of a UTxO
+    record or query.
+    """
+    return (
+        utxo_record.pair,
+        utxo_record.source,
+        utxo_record.address,
+        utxo_record.security_token_policy,
+        utxo_record.security_token_name,
+    )
+
+
+def _pair_source_key(utxo_record) -> tuple[str, str, str, str]:
+    """Return the pair, source and security token of a UTxO record or
+    query.
+    """
+    return (
+        utxo_record.pair,
+        utxo_record.source,
+        utxo_record.security_token_policy,
+        utxo_record.security_token_name,
+    )
+
+
+class SQLiteStorage:
+    """Storage backend on a SQLite database connection."""
+
+    def __init__(self, database: dba.DBObject):
+        self.database = database
+
+    def get_status(self) -> Optional[int]:
+        """Return the slot of the last block processed, if any."""
+        return dba.get_status(self.database)
+
+    def set_status(self, block: int) -> None:
+        """Save the slot of the last block processed."""
+        if dba.get_status(self.database) is None:
+            dba.insert_status(db=self.database, block=block)
+            return
+        dba.update_status(db=self.database, block=block)
+
+    def utxo_by_outref(
+        self, tx_hash: str, output_index: int
+    ) -> Optional[dba.UTxORecordResults]:
+        """Return the UTxO record of a transaction output."""
+        return dba.select_utxo_by_outref(self.database, tx_hash, output_index)
+
+    def utxo_by_pair_source(
+        self, query_obj: dba.UTxOSourcePolicyQueryParams
+    ) -> Optional[dba.UTxOSourcePolicyResults]:
+        """Return the latest UTxO of a pair on a source with the given
+        security token, whatever its address.
+        """
+        return dba.select_utxo_record_by_pair_source_and_policy(
+            db=self.database, query_obj=query_obj
+        )
+
+    def _utxo_id(self, utxo_record: dba.CompleteUTxO) -> Optional[int]:
+        """Return the id of the UTxO record of a pair, source, address
+        and security token.
+        """
+        res = dba.select_utxo_record_by_source_address_and_policy(
+            db=self.database,
+            query_obj=dba.utxo_source_policy_query_obj(*_utxo_key(utxo_record)),
+        )
+        return res.row_id if res else None
+
+    def upsert_utxo(self, utxo_record: dba.CompleteUTxO) -> int:
+        """Insert the UTxO record of a pair, source, address and
+        security token, or update the existing one, and return its id.
+        """
+        row_id = self._utxo_id(utxo_record)
+        if row_id is None:
+            dba.insert_utxo_complete(db=self.database, utxo_record=utxo_record)
+            return self._utxo_id(utxo_record)
+        dba.update_utxo_partial(
+            db=self.database, utxo_record=_partial_utxo(utxo_record), row_id=row_id
+        )
+        return row_id
+
+    def append_price(self, price_record: dba.PriceRecord) -> Optional[int]:
+        """Append a price record and return its id, None if it is
+        already saved.
+        """
+        return dba.insert_price_record(db=self.database, price_record=price_record)
+
+    def commit(self) -> None:
+        """Commit the current transaction."""
+        self.database.connection.commit()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.database.connection.close()
+
+
+class MemoryStorage:
+    """Storage backend in memory, nothing is written anywhere.
+
+    UTxO records are kept by id with indexes by key, output reference
+    and pair, source and security token. A lock lets other threads read
+    while the indexer writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status: Optional[int] = None
+        self.utxos: dict[int, dba.CompleteUTxO] = {}
+        self.prices: list[dba.PriceRecord] = []
+        self._by_key: dict[tuple[str, str, str, str, str], int] = {}
+        self._by_outref: dict[tuple[str, int], int] = {}
+        self._by_pair_source: dict[tuple[str, str, str, str], set[int]] = {}
+
+    def get_status(self) -> Optional[int]:
+        """Return the slot of the last block processed, if any."""
+        return self.status
+
+    def set_status(self, block: int) -> None:
+        """Save the slot of the last block processed."""
+        self.status = block
+
+    def utxo_by_outref(
+        self, tx_hash: str, output_index: int
+    ) -> Optional[dba.UTxORecordResults]:
+        """Return the UTxO record of a transaction output."""
+        with self._lock:
+            row_id = self._by_outref.get((tx_hash, output_index))
+            if row_id is None:
+                return None
+            utxo = self.utxos[row_id]
+        return dba.UTxORecordResults(
+            row_id=row_id,
+            block_height=utxo.block_height,
+            token_1_amount=utxo.token_1_amount,
+            token_1_decimals=utxo.token_1_decimals,
+            token_2_amount=utxo.token_2_amount,
+            token_2_decimals=utxo.token_2_decimals,
+            tx_hash=utxo.tx_hash,
+            output_index=utxo.tx_index,
+        )
+
+    def utxo_by_pair_source(
+        self, query_obj: dba.UTxOSourcePolicyQueryParams
+    ) -> Optional[dba.UTxOSourcePolicyResults]:
+        """Return the latest UTxO of a pair on a source with the given
+        security token, whatever its address.
+        """
+        with self._lock:
+            row_ids = self._by_pair_source.get(_pair_source_key(query_obj))
+            if not row_ids:
+                return None
+            utxo = max(
+                (self.utxos[row_id] for row_id in row_ids),
+                key=lambda utxo: utxo.block_height,
+            )
+        return dba.UTxOSourcePolicyResults(
+            tx_hash=utxo.tx_hash,
+            output_index=utxo.tx_index,
+            token_1_volume=utxo.token_1_amount,
+            token_1_decimals=utxo.token_1_decimals,
+            token_2_volume=utxo.token_2_amount,
+            token_2_decimals=utxo.token_2_decimals,
+            token_1_policy=utxo.token_1_policy,
+            token_1_name=utxo.token_1_name,
+            token_2_policy=utxo.token_2_policy,
+            token_2_name=utxo.token_2_name,
+        )
+
+    def upsert_utxo(self, utxo_record: dba.CompleteUTxO) -> int:
+        """Insert the UTxO record of a pair, source, address and
+        security token, or update the existing one, and return its id.
+        """
+        with self._lock:
+            key = _utxo_key(utxo_record)
+            row_id = self._by_key.get(key)
+            if row_id is None:
+                row_id = len(self.utxos) + 1
+                self._by_key[key] = row_id
+                self._by_pair_source.setdefault(
+                    _pair_source_key(utxo_record), set()
+                ).add(row_id)
+                self.utxos[row_id] = utxo_record
+            else:
+                previous = self.utxos[row_id]
+                self._by_outref.pop((previous.tx_hash, previous.tx_index), None)
+                self.utxos[row_id] = replace(
+                    previous, **asdict(_partial_utxo(utxo_record))
+                )
+            self._by_outref[(utxo_record.tx_hash, utxo_record.tx_index)] = row_id
+        return row_id
+
+    def append_price(self, price_record: dba.PriceRecord) -> int:
+        """Append a price record and return its id."""
+        with self._lock:
+            self.prices.append(price_record)
+            return len(self.prices)
+
+    def commit(self) -> None:
+        """Nothing to commit, the changes are applied immediately."""
+
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+@dataclass
+class BenchmarkResult:
+    """Results of the benchmark of a storage profile."""
+
+    profile: str
+    blocks: int
+    write_seconds: float
+    reads: int
+    read_latencies_ms: list[float]
+
+    @property
+    def blocks_per_second(self) -> float:
+        """Write throughput."""
+        return self.blocks / self.write_seconds if self.write_seconds else 0.0
+
+    def read_latency(self, quantile: float) -> float:
+        """Reader latency at the given quantile, in milliseconds."""
+        if not self.read_latencies_ms:
+            return 0.0
+        latencies = sorted(self.read_latencies_ms)
+        return latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+
+
+def _pair(idx: int) -> str:
+    """Return the name of the idx-th benchmark pair."""
+    return f"TOKEN{idx}-ADA"
+
+
+def _utxo(idx: int, block: int, output: int = 0) -> dba.CompleteUTxO:
+    """Return the UTxO of the idx-th benchmark pair at a block."""
+    return dba.complete_utxo_obj(
+        pair=_pair(idx),
+        source="benchmark",
+        price=1.0 + output / 1000,
+        block_height=block * 20,
+        address=f"addr{idx}",
+        token_1_policy="",
+        token_1_name="lovelace",
+        token_1_decimals=6,
+        token_2_policy=f"policy{idx}",
+        token_2_name="token",
+        token_2_decimals=6,
+        security_token_policy=SECURITY_TOKEN_POLICY,
+        security_token_name=f"nft{idx}",
+        token_1_amount=1000000000 + block,
+        token_2_amount=1000000000 - block,
+        tx_hash=f"{block:064x}",
+        tx_index=output,
+    )
+
+
+def _connect(db_name: str, profile: str) -> SQLiteStorage:
+    """Return the storage backend of a connection with a profile."""
+    conn = database_initialization.connect(db_name, profile)
+    return SQLiteStorage(dba.DBObject(connection=conn, cursor=conn.cursor()))
+
+
+def _seed(backend: StorageBackend, pairs: int) -> None:
+    """Save a UTxO per pair."""
+    backend.set_status(0)
+    for idx in range(pairs):
+        backend.upsert_utxo(_utxo(idx, block=0))
+    backend.commit()
+
+
+def _write_blocks(backend: StorageBackend, blocks: int, outputs: int, pairs: int):
+    """Save blocks of `outputs` UTxO updates, one transaction each."""
+    for block in range(1, blocks + 1):
+        backend.set_status(block * 20)
+        for output in range(outputs):
+            utxo = _utxo((block * outputs + output) % pairs, block, output)
+            backend.upsert_utxo(utxo)
+            backend.append_price(
+                dba.price_record_obj(
+                    pair=utxo.pair,
+                    epoch=500,
+                    block_height=utxo.block_height,
+                    price=utxo.price,
+                    token_1_amount=utxo.token_1_amount,
+                    token_2_amount=utxo.token_2_amount,
+                    source=utxo.source,
+                )
+            )
+        backend.commit()
+
+
+def _read_until(
+    connect: Callable[[], StorageBackend], pairs: int, done: threading.Event
+):
+    """Query the latest UTxO of the pairs, on a backend connected from
+    the reader thread, until the writer is done and return the latency
+    of each query in milliseconds.
+    """
+    backend = connect()
+    latencies = []
+    idx = 0
+    while not done.is_set():
+        started = time.perf_counter()
+        backend.get_status()
+        backend.utxo_by_pair_source(
+            dba.utxo_source_policy_query_obj(
+                pair=_pair(idx),
+                source="benchmark",
+                address=None,
+                security_token_policy=SECURITY_TOKEN_POLICY,
+                security_token_name=f"nft{idx}",
+            )
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        idx = (idx + 1) % pairs
+    backend.close()
+    return latencies
+
+
+def benchmark_profile(
+    directory: str, profile: str, blocks: int, outputs: int, pairs: int
+) -> BenchmarkResult:
+    """Benchmark a storage profile on a new database in `directory`, or
+    the in-memory backend.
+    """
+    db_name = str(Path(directory) / f"benchmark_{profile}.db")
+    if profile == MEMORY_PROFILE:
+        writer = MemoryStorage()
+    else:
+        writer = _connect(db_name, profile)
+        database_initialization._create_database(  # pylint: disable=W0212
+            writer.database.connection
+        )
+
+    def connect_reader() -> StorageBackend:
+        """Return the reader's backend, connected from its thread."""
+        if profile == MEMORY_PROFILE:
+            return writer
+        return _connect(db_name, profile)
+
+    _seed(writer, pairs)
+    done = threading.Event()
+    latencies: list[float] = []
+    reader = threading.Thread(
+        target=lambda: latencies.extend(_read_until(connect_reader, pairs, done)),
+        daemon=True,
+    )
+    reader.start()
+    started = time.perf_counter()
+    try:
+        _write_blocks(writer, blocks, outputs, pairs)
+    finally:
+        write_seconds = time.perf_counter() - started
+        done.set()
+        reader.join()
+        writer.close()
+    return BenchmarkResult(
+        profile=profile,
+        blocks=blocks,
+        write_seconds=write_seconds,
+        reads=len(latencies),
+        read_latencies_ms=latencies,
+    )
+
+
+def report(results: list[BenchmarkResult]) -> str:
+    """Format the benchmark results as a table."""
+    lines = [
+        f"{'profile':<10} {'blocks/s':>10} {'reads':>8} "
+        f"{'read p50':>10} {'read p99':>10} {'read max':>10}"
+    ]
+    for res in results:
+        lines.append(
+            f"{res.profile:<10} {res.blocks_per_second:>10.1f} {res.reads:>8} "
+            f"{statistics.median(res.read_latencies_ms or [0]):>8.3f}ms "
+            f"{res.read_latency(0.99):>8.3f}ms "
+            f"{max(res.read_latencies_ms or [0]):>8.3f}ms"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """Primary entry point for this script."""
+    parser = argparse.ArgumentParser(
+        prog="storage-benchmark",
+        description="Benchmark the SQLite storage profiles of the indexer",
+    )
+    parser.add_argument("--blocks", type=int, default=1000)
+    parser.add_argument("--outputs", type=int, default=5, help="UTxO updates per block")
+    parser.add_argument("--pairs", type=int, default=100)
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(database_initialization.STORAGE_PROFILES) + [MEMORY_PROFILE],
+        choices=list(database_initialization.STORAGE_PROFILES) + [MEMORY_PROFILE],
+    )
+    parser.add_argument(
+        "--directory",
+        help="directory for the benchmark databases, on the disk to benchmark",
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        results = [
+            benchmark_profile(
+                directory=directory,
+                profile=profile,
+                blocks=args.blocks,
+                outputs=args.outputs,
+                pairs=args.pairs,
+            )
+            for profile in args.profiles
+        ]
+    print(report(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,56 +4,70 @@
 
 import argparse
 import asyncio
+import dataclasses
 import json
 import logging
 import sqlite3
 import sys
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
 
 import websocket
 
 try:
     import config
     import database_abstraction as dba
+    import database_derived as derived
     import database_initialization
+    import epoch_helper
     import global_helpers as helpers
     import helper_functions
     import kupo_helper
     import load_pairs
+    import ogmios_client
     import ogmios_helper
 except ModuleNotFoundError:
     try:
         from src.cnt_collector_node import config
         from src.cnt_collector_node import database_abstraction as dba
-        from src.cnt_collector_node import database_initialization
+        from src.cnt_collector_node import database_derived as derived
+        from src.cnt_collector_node import database_initialization, epoch_helper
         from src.cnt_collector_node import global_helpers as helpers
         from src.cnt_collector_node import (
             helper_functions,
             kupo_helper,
             load_pairs,
+            ogmios_client,
             ogmios_helper,
         )
     except ModuleNotFoundError:
         from cnt_collector_node import config
         from cnt_collector_node import database_abstraction as dba
-        from cnt_collector_node import database_initialization
+        from cnt_collector_node import database_derived as derived
+        from cnt_collector_node import database_initialization, epoch_helper
         from cnt_collector_node import global_helpers as helpers
         from cnt_collector_node import (
             helper_functions,
             kupo_helper,
             load_pairs,
+            ogmios_client,
             ogmios_helper,
         )
 
 logger = logging.getLogger(__name__)
 
 
-def database_init(db_name: str, create_db: bool) -> dict:
+def database_init(db_name: str, create_db: bool, read_only: bool = False) -> dict:
     """Database initialization.
 
     Returns database connection object for use throughout the
     submitter.
     """
+    if read_only:
+        logger.info("connecting to the database (read-only)")
+        conn = database_initialization.connect(db_name, read_only=True)
+        return dba.DBObject(connection=conn, cursor=conn.cursor())
     # Connect to the database
     db_path = Path(db_name)
     if not db_path.parent.exists():
@@ -64,7 +78,7 @@ def database_init(db_name: str, create_db: bool) -> dict:
         database_initialization.create_database(db_name=db_name)
     # Connect to the database
     logger.info("connecting to the database")
-    conn = sqlite3.connect(db_name)
+    conn = database_initialization.connect(db_name)
     cur = conn.cursor()
     # create the "database" object.
     database = dba.DBObject(connection=conn, cursor=cur)
@@ -72,12 +86,16 @@ def database_init(db_name: str, create_db: bool) -> dict:
 
 
 async def initialize_context(
-    ogmios_url: str, kupo_url: str, db_name: str, create_db: bool
+    ogmios_url: str,
+    kupo_url: str,
+    db_name: str,
+    create_db: bool,
+    read_only: bool = False,
 ) -> helpers.AppContext:
     """Initialize the context for the CNT workflow."""
-    database = database_init(db_name=db_name, create_db=create_db)
+    database = database_init(db_name=db_name, create_db=create_db, read_only=read_only)
     logger.info("connecting to ogmios")
-    ogmios_ws = websocket.create_connection(ogmios_url)
+    ogmios_ws = ogmios_client.SyncOgmiosClient(ogmios_url)
 
     if config.USE_KUPO and not kupo_helper.kupo_health(kupo_url):
         logger.error("kupo is not healthy!")
@@ -93,6 +111,8 @@ async def initialize_context(
         main_event=None,
         thread_event=None,
         reconnect_event=None,
+        epoch_resolver=epoch_helper.EpochResolver(),
+        read_only=read_only,
     )
 
 
@@ -110,6 +130,30 @@ async def connect_to_validator(identity: dict, nopublish: bool):
     return None
 
 
+@contextmanager
+def database_snapshot(
+    app_context: helpers.AppContext, read_only: bool
+) -> Iterator[helpers.AppContext]:
+    """Yield the context with the latest UTxOs of all the feeds, loaded
+    in one query for the run. In read-only mode one read transaction is
+    kept open so that every pair is read from the same snapshot of the
+    database.
+    """
+    database = app_context.database
+    if read_only:
+        database.cursor.execute("BEGIN")
+    try:
+        pool_states = derived.select_latest_pool_states(database)
+    except sqlite3.OperationalError as err:
+        logger.error("database query error: %s", err)
+        sys.exit(1)
+    try:
+        yield dataclasses.replace(app_context, pool_states=pool_states)
+    finally:
+        if read_only:
+            database.connection.rollback()
+
+
 async def process_dex_pairs(
     app_context: helpers.AppContext,
     identity: dict,
@@ -175,6 +219,7 @@ async def cnt_main(
     create_db: bool,
     pairs: load_pairs.Pairs,
     nopublish: bool,
+    read_only: bool = False,
 ) -> None:
     """CNT Collector Node workflow."""
     app_context = await initialize_context(
@@ -182,15 +227,16 @@ async def cnt_main(
         kupo_url=kupo_url,
         db_name=db_name,
         create_db=create_db,
+        read_only=read_only,
     )
-    database = app_context.database
     ogmios_ws = app_context.ogmios_ws
 
-    epoch = ogmios_helper.ogmios_epoch(ogmios_ws).get("result", 0)
-    tip = ogmios_helper.ogmios_tip(ogmios_ws)
-    last_block_slot = tip["result"]["slot"]
-    logger.info("current epoch: %s", epoch)
-    logger.info("latest block slot: %s", last_block_slot)
+    logger.info(
+        "current epoch: %s", ogmios_helper.ogmios_epoch(ogmios_ws).get("result", 0)
+    )
+    logger.info(
+        "latest block slot: %s", ogmios_helper.ogmios_tip(ogmios_ws)["result"]["slot"]
+    )
 
     identity = await helpers.read_identity(identity_file)
     logger.info("node identity: \n%s", identity)
@@ -200,16 +246,18 @@ async def cnt_main(
         nopublish=nopublish,
     )
 
-    await process_dex_pairs(
-        app_context=app_context,
-        identity=identity,
-        validator_websocket_conn=validator_websocket_conn,
-        pairs=pairs,
-    )
+    with database_snapshot(app_context, read_only) as snapshot_context:
+        await process_dex_pairs(
+            app_context=snapshot_context,
+            identity=identity,
+            validator_websocket_conn=validator_websocket_conn,
+            pairs=pairs,
+        )
 
     if validator_websocket_conn:
         validator_websocket_conn.close()
-    database.connection.close()
+    ogmios_ws.close()
+    app_context.database.connection.close()
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -264,6 +312,14 @@ def parse_arguments() -> argparse.Namespace:
         action="store_true",
     )
 
+    parser.add_argument(
+        "--read-only",
+        help="open the database read-only and read all the pairs from one snapshot",
+        required=False,
+        default=config.SUBMITTER_READ_ONLY,
+        action="store_true",
+    )
+
     parser.add_argument(
         "--pairs",
         "-p",
@@ -311,6 +367,10 @@ def main() -> None:
     # Setup global logging.
     helpers.setup_logging(args.debug)
 
+    if args.read_only and args.create_db:
+        logger.error("the database cannot be created in read-only mode")
+        sys.exit(1)
+
     pairs = load_pairs.load(path=args.pairs)
 
     # Setup global logging.
@@ -325,6 +385,7 @@ def main() -> None:
             create_db=args.create_db,
             pairs=pairs,
             nopublish=args.nopublish,
+            read_only=args.read_only,
         )
     )
 
@@ -0,0 +1,110 @@
+"""Tests for the watched addresses index."""
+
+import pytest
+
+from src.cnt_collector_node import address_index
+
+# MinSwap V2 pool address.
+POOL_ADDRESS = "addr1z8snz7c4974vzdpxu65ruphl3zjdvtxw8strf2c2tmqnxz2j2c79gy9l76sdg0xwhd7r0c0kna0tycz4y5s6mlenh8pq0xmsha"
+POOL_SCRIPT = bytes.fromhex("e1317b152faac13426e6a83e06ff88a4d62cce3c1634ab0a5ec13309")
+STAKE_KEY = bytes.fromhex("2a4bc7a54c17fbeaa3cd3ff89aac8eb0ecc3d8dc7d5567ec44ee84f7")
+OTHER_KEY = bytes.fromhex("1c4e7b2fa1ab73df6f4b7e0ddc53a8e4c03bff5b4ec5a1e3c7b9f011")
+
+
+def _bech32_polymod(values: list) -> int:
+    """Bech32 checksum, see BIP-173."""
+    generator = [0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3]
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1FFFFFF) << 5 ^ value
+        for idx in range(5):
+            chk ^= generator[idx] if ((top >> idx) & 1) else 0
+    return chk
+
+
+def _address(header: int, payment: bytes, stake: bytes = b"") -> str:
+    """Encode a Shelley mainnet address."""
+    data = []
+    acc = 0
+    bits = 0
+    for byte in bytes([header]) + payment + stake:
+        acc = (acc << 8) | byte
+        bits += 8
+        while bits >= 5:
+            bits -= 5
+            data.append((acc >> bits) & 31)
+    if bits:
+        data.append((acc << (5 - bits)) & 31)
+    hrp = "addr"
+    expanded = [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+    polymod = _bech32_polymod(expanded + data + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - idx)) & 31 for idx in range(6)]
+    return hrp + "1" + "".join(address_index.BECH32_CHARSET[d] for d in data + checksum)
+
+
+def test_payment_credential():
+    """Ensure the payment credential is read from addresses."""
+    assert address_index.payment_credential(POOL_ADDRESS) == (True, POOL_SCRIPT)
+    # Script payment, key stake, as the pool address.
+    assert _address(0x11, POOL_SCRIPT, STAKE_KEY)[:50] == POOL_ADDRESS[:50]
+    # Key payment.
+    assert address_index.payment_credential(_address(0x01, POOL_SCRIPT, STAKE_KEY)) == (
+        False,
+        POOL_SCRIPT,
+    )
+    # Reward address, no payment part.
+    assert not address_index.payment_credential(_address(0xE1, STAKE_KEY))
+    # Byron and invalid addresses.
+    assert not address_index.payment_credential(
+        "DdzFFzCqrhsrcTVhLygT24QwTnNqQqQ8mZrq5jykUzMveU26sxaH529kMpo7VhPrt5pwu"
+    )
+    assert not address_index.payment_credential("not an address")
+
+
+match_tests = [
+    # The watched address itself.
+    (POOL_ADDRESS, False, [POOL_ADDRESS]),
+    (POOL_ADDRESS, True, [POOL_ADDRESS]),
+    # Same script, different stake key.
+    (_address(0x11, POOL_SCRIPT, OTHER_KEY), False, []),
+    (_address(0x11, POOL_SCRIPT, OTHER_KEY), True, [POOL_ADDRESS]),
+    # Same script, no stake part.
+    (_address(0x71, POOL_SCRIPT), True, [POOL_ADDRESS]),
+    # A key with the same hash as the script isn't the script.
+    (_address(0x01, POOL_SCRIPT, OTHER_KEY), True, []),
+    # Different payment credential, same stake key.
+    (_address(0x11, OTHER_KEY, STAKE_KEY), True, []),
+    # Not addresses.
+    ("DdzFFzCqrhsrcTVhLygT24QwTnNqQqQ8mZrq5jykUzMveU26sxaH529kMpo7VhPrt5pwu", True, []),
+    ("", True, []),
+]
+
+
+@pytest.mark.parametrize("address, match_credentials, expected", match_tests)
+def test_watched_addresses_match(address: str, match_credentials: bool, expected):
+    """Ensure addresses are matched exactly or on the payment credential."""
+    watched = address_index.WatchedAddresses(
+        [POOL_ADDRESS, _address(0x61, OTHER_KEY)],
+        match_credentials=match_credentials,
+    )
+    assert watched.match(address) == expected
+    assert (address in watched) is bool(expected)
+
+
+def test_watched_addresses_prefilter(mocker):
+    """Ensure addresses are only decoded if they pass the prefilter."""
+    watched = address_index.WatchedAddresses([POOL_ADDRESS], match_credentials=True)
+    decode = mocker.spy(address_index, "payment_credential")
+    assert _address(0x11, OTHER_KEY, STAKE_KEY) not in watched
+    decode.assert_not_called()
+    assert _address(0x11, POOL_SCRIPT, OTHER_KEY) in watched
+    decode.assert_called_once()
+
+
+def test_watched_addresses_collection():
+    """Ensure the index iterates over the configured addresses."""
+    addresses = ["addr1c", POOL_ADDRESS, "addr1a", POOL_ADDRESS]
+    watched = address_index.WatchedAddresses(addresses, match_credentials=True)
+    assert list(watched) == ["addr1c", POOL_ADDRESS, "addr1a"]
+    assert len(watched) == 3
@@ -0,0 +1,183 @@
+"""Tests for the partial decoding of Ogmios nextBlock responses."""
+
+import copy
+import json
+
+import pytest
+
+from src.cnt_collector_node import block_decoder
+
+from . import block_example
+
+TIP = {"slot": 167589400, "id": "tip", "height": 12452808}
+
+
+def _response(block: dict, indent=None) -> str:
+    """Return a nextBlock response as sent by Ogmios."""
+    separators = None if indent else (",", ":")
+    return json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "nextBlock",
+            "result": {"direction": "forward", "block": block, "tip": TIP},
+            "id": 7,
+        },
+        indent=indent,
+        separators=separators,
+    )
+
+
+def _expected(block: dict, watched: set) -> dict:
+    """Return the compact block decoded in full."""
+    expected = copy.deepcopy(block)
+    transactions = expected.pop("transactions")
+    expected["transaction_count"] = len(transactions)
+    expected["transactions"] = [
+        {
+            "id": tx["id"],
+            "inputs": [
+                {"transaction": {"id": i["transaction"]["id"]}, "index": i["index"]}
+                for i in tx["inputs"]
+            ],
+            "outputs": [
+                {"address": o["address"], "value": o["value"]} for o in tx["outputs"]
+            ],
+        }
+        for tx in transactions
+        if any(o["address"] in watched for o in tx["outputs"])
+    ]
+    return expected
+
+
+example_transactions = block_example.example_one["transactions"]
+
+watched_tests = [
+    # Nothing watched, only the header is decoded.
+    (set(), 0),
+    # One watched address in the first transaction.
+    ({example_transactions[0]["outputs"][0]["address"]}, 1),
+    # Addresses in several transactions.
+    (
+        {
+            example_transactions[0]["outputs"][0]["address"],
+            example_transactions[1]["outputs"][1]["address"],
+            example_transactions[-1]["outputs"][0]["address"],
+        },
+        3,
+    ),
+]
+
+
+@pytest.mark.parametrize("watched, decoded_transactions", watched_tests)
+def test_decode_next_block(mocker, watched: set, decoded_transactions: int):
+    """Ensure only the transactions with watched outputs are decoded
+    and the result matches decoding the block in full.
+    """
+    loads = mocker.patch.object(block_decoder, "loads", wraps=block_decoder.loads)
+    block = block_example.example_one
+    resp = block_decoder.decode_next_block(_response(block), watched)
+    assert resp["id"] == 7
+    assert resp["result"]["tip"] == TIP
+    assert resp["result"]["block"] == _expected(block, watched)
+    assert len(resp["result"]["block"]["transactions"]) == decoded_transactions
+    # The header, the structure of the transactions array and each
+    # watched transaction.
+    assert loads.call_count == 2 + decoded_transactions
+
+
+def test_decode_next_block_fallback(mocker):
+    """Ensure responses laid out differently are decoded in full."""
+    watched = {example_transactions[0]["outputs"][0]["address"]}
+    loads = mocker.patch.object(block_decoder, "loads", wraps=block_decoder.loads)
+    block = block_example.example_one
+    resp = block_decoder.decode_next_block(_response(block, indent=1), watched)
+    assert resp["result"]["block"] == _expected(block, watched)
+    assert loads.call_count == 1
+
+
+def test_decode_next_block_nested_ids():
+    """Ensure objects that look like transactions nested in a watched
+    transaction don't confuse the decoder.
+    """
+    watched = {example_transactions[0]["outputs"][0]["address"]}
+    block = copy.deepcopy(block_example.example_one)
+    block["transactions"][0]["metadata"] = {
+        "labels": {"674": {"json": [{}, {"id": "nested", "address": "addr1"}]}}
+    }
+    raw = _response(block)
+    assert block_decoder.TRANSACTION_SEPARATOR + "nested" in raw
+    resp = block_decoder.decode_next_block(raw, watched)
+    assert resp["result"]["block"] == _expected(block, watched)
+
+
+WATCHED = example_transactions[0]["outputs"][0]["address"]
+
+layout_tests = [
+    # Objects that look like a transaction paying to a watched address
+    # nested in a transaction that doesn't.
+    (
+        "transactions",
+        1,
+        "metadata",
+        {
+            "labels": {
+                "674": {
+                    "json": [
+                        {},
+                        {
+                            "id": "fake",
+                            "inputs": [],
+                            "outputs": [
+                                {"address": WATCHED, "value": {"ada": {"lovelace": 1}}}
+                            ],
+                        },
+                        {"id": "end"},
+                    ]
+                }
+            }
+        },
+    ),
+    # An array after the transactions.
+    ("block", None, "extra", [1, [2]]),
+    # A closing bracket in a string after the transactions.
+    ("block", None, "extra", "a]b"),
+    # Escaped quotes.
+    ("transactions", 1, "metadata", {"labels": {"674": {"json": 'say "hi"'}}}),
+]
+
+
+@pytest.mark.parametrize("target, index, key, value", layout_tests)
+def test_decode_next_block_layouts(target: str, index: int, key: str, value):
+    """Ensure the transactions array isn't split at the wrong places,
+    the result must match decoding the block in full.
+    """
+    watched = {WATCHED}
+    block = copy.deepcopy(block_example.example_one)
+    if target == "block":
+        block[key] = value
+    else:
+        block["transactions"][index][key] = value
+    resp = block_decoder.decode_next_block(_response(block), watched)
+    assert resp["result"]["block"] == _expected(block, watched)
+    assert "fake" not in [tx["id"] for tx in resp["result"]["block"]["transactions"]]
+
+
+def test_decode_next_block_empty():
+    """Ensure blocks without transactions are decoded."""
+    block = dict(block_example.example_one, transactions=[])
+    resp = block_decoder.decode_next_block(_response(block), {"addr1"})
+    assert resp["result"]["block"]["transactions"] == []
+    assert resp["result"]["block"]["transaction_count"] == 0
+
+
+def test_decode_next_block_backward():
+    """Ensure rollbacks are decoded as they are."""
+    raw = json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "nextBlock",
+            "result": {"direction": "backward", "point": "origin", "tip": TIP},
+            "id": 7,
+        }
+    )
+    assert block_decoder.decode_next_block(raw, set()) == json.loads(raw)
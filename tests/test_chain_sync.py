@@ -0,0 +1,233 @@
+"""Tests for the chain-sync helpers used by parse_blocks.
+
+parse_blocks itself needs a live Ogmios connection and isn't tested
+wholesale, the functions it relies on to manage the chain-sync are
+tested here instead.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import src.cnt_collector_node.database_abstraction as dba
+from src.cnt_collector_node import config
+from src.cnt_collector_node import database_derived as derived
+from src.cnt_collector_node import global_helpers as helpers
+from src.cnt_collector_node import helper_functions, ogmios_client
+from src.cnt_collector_node.database_initialization import create_database
+
+
+def _forward(slot: int, tip_slot: int) -> dict:
+    """Return a minimal nextBlock RollForward response."""
+    return {
+        "jsonrpc": "2.0",
+        "method": "nextBlock",
+        "result": {
+            "direction": "forward",
+            "tip": {"slot": tip_slot, "id": "tip", "height": 1},
+            "block": {"slot": slot, "id": "block", "height": 1},
+        },
+    }
+
+
+def _backward(slot: int, tip_slot: int) -> dict:
+    """Return a minimal nextBlock RollBackward response."""
+    return {
+        "jsonrpc": "2.0",
+        "method": "nextBlock",
+        "result": {
+            "direction": "backward",
+            "tip": {"slot": tip_slot, "id": "tip", "height": 1},
+            "point": {"slot": slot, "id": "point"},
+        },
+    }
+
+
+pipeline_depth_tests = [
+    # At the tip.
+    (_forward(1000, 1000), 100, 1),
+    # Within the near tip window.
+    (_forward(1000, 1100), 100, 1),
+    # Roughly 50 blocks behind.
+    (_forward(1000, 2000), 100, 50),
+    # Thousands of blocks behind, capped at the maximum depth.
+    (_forward(1000, 200000), 100, 100),
+    (_forward(1000, 200000), 10, 10),
+    # Rollbacks use the point they roll back to.
+    (_backward(1000, 2000), 100, 50),
+    # Unexpected responses fall back to a single request.
+    ({}, 100, 1),
+    ({"result": {"direction": "forward"}}, 100, 1),
+    ({"error": {"code": -1}}, 100, 1),
+]
+
+
+@pytest.mark.parametrize("next_block, max_in_flight, expected", pipeline_depth_tests)
+def test_chain_sync_pipeline_depth(next_block: dict, max_in_flight: int, expected):
+    """Ensure the pipeline depth adapts to the distance to the tip."""
+    depth = helper_functions.chain_sync_pipeline_depth(
+        next_block=next_block,
+        max_in_flight=max_in_flight,
+    )
+    assert depth == expected
+
+
+request_next_blocks_tests = [
+    (0, 1, 1, 1),
+    (0, 10, 10, 10),
+    (5, 10, 5, 10),
+    # The depth dropped, nothing new is requested.
+    (10, 1, 0, 10),
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "in_flight, depth, requests_sent, expected", request_next_blocks_tests
+)
+async def test_request_next_blocks(mocker, in_flight, depth, requests_sent, expected):
+    """Ensure the pipeline is topped up to the requested depth."""
+    client = mocker.AsyncMock()
+    res = await helper_functions.request_next_blocks(client, in_flight, depth)
+    assert res == expected
+    assert client.request_next_block.await_count == requests_sent
+
+
+@pytest.mark.asyncio
+async def test_request_next_blocks_send_failure(mocker):
+    """Ensure a failed send is raised so that parse_blocks reconnects."""
+    client = mocker.AsyncMock()
+    client.request_next_block.side_effect = ogmios_client.ConnectionClosed()
+    with pytest.raises(ConnectionResetError):
+        await helper_functions.request_next_blocks(client, 0, 10)
+
+
+def _checkpoints_db(db_name: str, slots: list) -> None:
+    """Create a database with checkpoints for the given slots."""
+    create_database(db_name)
+    conn = sqlite3.connect(db_name)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    for slot in slots:
+        helper_functions.save_checkpoint(db, {"slot": slot, "id": f"id{slot}"})
+    conn.commit()
+    conn.close()
+
+
+def test_save_checkpoint(tmp_path):
+    """Ensure only the most recent checkpoints are kept."""
+    db_name = str(tmp_path / "checkpoints.db")
+    slots = list(range(1000, 1000 + (config.CHAIN_SYNC_CHECKPOINTS + 5) * 20, 20))
+    _checkpoints_db(db_name, slots)
+    points = helper_functions.load_checkpoints(db_name)
+    assert len(points) == config.CHAIN_SYNC_CHECKPOINTS
+    assert points[0] == {"slot": slots[-1], "id": f"id{slots[-1]}"}
+    assert [point["slot"] for point in points] == sorted(
+        slots[-config.CHAIN_SYNC_CHECKPOINTS :], reverse=True
+    )
+
+
+def test_load_checkpoints_no_database(tmp_path):
+    """Ensure a database without checkpoints doesn't raise."""
+    assert not helper_functions.load_checkpoints(str(tmp_path / "missing.db"))
+    assert not helper_functions.load_checkpoints(str(tmp_path / "none" / "x.db"))
+
+
+resume_tests = [
+    # Resume from the checkpoints.
+    ([100, 120, 140], 200, True),
+    # Too far behind the tip.
+    ([100, 120, 140], 140 + config.CHAIN_SYNC_RESUME_MAX_GAP + 1, False),
+    # Nothing to resume from.
+    ([], 200, False),
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("slots, tip_slot, resumed", resume_tests)
+async def test_resume_start_block(mocker, tmp_path, slots, tip_slot, resumed):
+    """Ensure the chain-sync resumes from the saved checkpoints."""
+    db_name = str(tmp_path / "checkpoints.db")
+    _checkpoints_db(db_name, slots)
+    client = mocker.AsyncMock()
+    client.tip.return_value = {"result": {"slot": tip_slot, "id": "tip"}}
+    client.find_intersection.return_value = {
+        "result": {"intersection": {"slot": 140, "id": "id140"}}
+    }
+    res = await helper_functions.resume_start_block(client, db_name)
+    assert bool(res) is resumed
+    if not resumed:
+        client.find_intersection.assert_not_awaited()
+        return
+    client.find_intersection.assert_awaited_with(
+        [
+            {"slot": 140, "id": "id140"},
+            {"slot": 120, "id": "id120"},
+            {"slot": 100, "id": "id100"},
+        ],
+    )
+
+
+@pytest.mark.asyncio
+async def test_resume_start_block_no_intersection(mocker, tmp_path):
+    """Ensure we don't resume if none of the checkpoints are on chain."""
+    db_name = str(tmp_path / "checkpoints.db")
+    _checkpoints_db(db_name, [100, 120])
+    client = mocker.AsyncMock()
+    client.tip.return_value = {"result": {"slot": 200, "id": "tip"}}
+    client.find_intersection.return_value = {
+        "error": {"code": 1000, "message": "No intersection found."}
+    }
+    assert not await helper_functions.resume_start_block(client, db_name)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "tip_slot, resumed, status",
+    [(200, True, 140), (140 + config.CHAIN_SYNC_RESUME_MAX_GAP + 1, False, None)],
+)
+async def test_start_chain_sync(mocker, tmp_path, tip_slot, resumed, status):
+    """Ensure the utxos table is kept only if the chain-sync resumes
+    from the checkpoints, and the status is set to the start point.
+    """
+    db_name = str(tmp_path / "checkpoints.db")
+    _checkpoints_db(db_name, [100, 120, 140])
+    conn = sqlite3.connect(db_name)
+    conn.execute(
+        "INSERT INTO utxos(pair_id, source_id, price, block_height, address, "
+        "token1_id, token2_id, security_token_id, token1_amount, token2_amount, "
+        "tx_hash, output_index) VALUES (1, 1, 0.5, 140, 'addr', 1, 2, 3, 2, 1, "
+        "x'00', 0)"
+    )
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    derived.insert_journal_entry(db, 140, "utxos", 1, derived.JOURNAL_INSERT)
+    dba.insert_status(db=db, block=100)
+    conn.commit()
+    conn.close()
+    tip = {"slot": tip_slot, "id": "tip"}
+    client = mocker.AsyncMock()
+    client.tip.return_value = {"result": tip}
+    client.find_intersection.side_effect = lambda points: {
+        "result": {"intersection": points[0], "tip": tip}
+    }
+    app_context = helpers.AppContext(
+        db_name=db_name,
+        database=None,
+        ogmios_url="",
+        ogmios_ws=client,
+        kupo_url=None,
+        use_kupo=False,
+        main_event=threading.Event(),
+        thread_event=threading.Event(),
+        reconnect_event=threading.Event(),
+    )
+    res = await helper_functions.start_chain_sync(app_context)
+    assert res["result"]["intersection"]["slot"] == (status or tip_slot)
+    assert app_context.reconnect_event.is_set() is not resumed
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT count(*) FROM utxos").fetchone()[0] == int(resumed)
+    assert conn.execute("SELECT count(*) FROM journal").fetchone()[0] == int(resumed)
+    assert conn.execute("SELECT current_block_slot FROM status").fetchone()[0] == (
+        status or tip_slot
+    )
+    conn.close()
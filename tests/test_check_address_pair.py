@@ -246,18 +246,14 @@ def test_check_address_pairs(
         return_value={"result": "UNUSED"},
     )
 
-    cursor.execute(
-        "INSERT INTO utxos(id, pair, source, price, block_height, "
-        "address, token1_policy, token1_name, token1_decimals, "
-        "token2_policy, token2_name, token2_decimals, "
-        "security_token_policy, security_token_name, token1_amount, "
-        "token2_amount, tx_hash, output_index)"
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        ins_mock,
+    # The id is the first UTxO's.
+    dba.insert_utxo_complete(
+        db=db,
+        utxo_record=dba.CompleteUTxO(*ins_mock[1:]),
     )
 
     mocker.patch(
-        "src.cnt_collector_node.helper_functions.get_status_block",
+        "src.cnt_collector_node.database_abstraction.get_status",
         return_value=current_status_block,
     )
 
@@ -271,7 +267,7 @@ def test_check_address_pairs(
     assert fs_info == expected
 
     # Make sure no database update is performed.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     price_table_before_update = cursor.fetchall()
     assert len(price_table_before_update) == 0
 
@@ -374,7 +370,7 @@ def test_check_address_pair_kupo(
         return_value={"result": "UNUSED"},
     )
     mocker.patch(
-        "src.cnt_collector_node.kupo_helper.get_kupo_matches",
+        "src.cnt_collector_node.kupo_helper.get_kupo_asset_matches",
         return_value=utxo_result,
     )
     mocker.patch(
@@ -387,7 +383,7 @@ def test_check_address_pair_kupo(
     )
 
     # At this point there is no information in the database.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     price_table_before_update = cursor.fetchall()
     assert len(price_table_before_update) == 0
 
@@ -400,7 +396,7 @@ def test_check_address_pair_kupo(
     assert feed_info == expected
 
     # Here we expect the database to be correctly updated.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     price_table_after_update = cursor.fetchall()
     assert len(price_table_after_update) == 1
     assert price_table_after_update == db_expected
@@ -517,7 +513,7 @@ def test_check_address_pair_ogmios(
     )
 
     # At this point there is no information in the database.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     price_table_before_update = cursor.fetchall()
     assert len(price_table_before_update) == 0
 
@@ -530,7 +526,7 @@ def test_check_address_pair_ogmios(
     assert feed_info == expected
 
     # Here we expect the database to be correctly updated.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     price_table_after_update = cursor.fetchall()
     assert len(price_table_after_update) == 1
     assert price_table_after_update == db_expected
@@ -450,11 +450,11 @@ def test_parse_utxo(
     )
     assert parsed_res == res
     # Ensure the database row was updated correctly.
-    price_data_row = cursor.execute("select * from price")
+    price_data_row = cursor.execute("select * from price_records")
     price_data = price_data_row.fetchall()
     try:
         # Ensure the database row was updated correctly.
-        price_data_row = cursor.execute("select * from price")
+        price_data_row = cursor.execute("select * from price_records")
         price_data = price_data_row.fetchall()
         assert len(price_data) == 1
         assert price_data == db_row
@@ -679,7 +679,7 @@ def test_parse_utxo_with_mocks(
     )
     assert parsed_res == res
     # Ensure the database row was updated correctly.
-    price_data_row = cursor.execute("select * from price")
+    price_data_row = cursor.execute("select * from price_records")
     price_data = price_data_row.fetchall()
     assert len(price_data) == 1
     assert price_data == db_row
@@ -856,7 +856,7 @@ def test_parse_utxo_with_mocks_negative_results(
     )
     assert parsed_res == res
     # Ensure the database row was updated correctly.
-    price_data_row = cursor.execute("select * from price")
+    price_data_row = cursor.execute("select * from price_records")
     price_data = price_data_row.fetchall()
     assert len(price_data) == 0
     assert price_data == db_row
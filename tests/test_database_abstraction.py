@@ -7,19 +7,38 @@ after refactoring.
 
 # pylint: disable=R0913
 
+import dataclasses
 import sqlite3
 
 import pytest
 
+from src.cnt_collector_node import global_helpers as helpers
+from src.cnt_collector_node import submitter
 from src.cnt_collector_node.database_abstraction import (
     DBObject,
     UTxORecordResults,
     complete_utxo_obj,
+    insert_price_record,
+    insert_price_records,
+    insert_token,
     insert_utxo_complete,
+    insert_utxos_complete,
+    partial_utxo_obj,
+    price_record_obj,
+    select_utxo_count_by_tx_info,
     select_utxo_record_by_source_address_and_policy,
+    tx_hash_from_db,
+    tx_hash_to_db,
+    update_utxo_partial,
     utxo_source_policy_query_obj,
 )
-from src.cnt_collector_node.database_initialization import _create_database
+from src.cnt_collector_node.database_derived import select_latest_pool_states
+from src.cnt_collector_node.database_initialization import (
+    _create_database,
+    create_database,
+)
+from src.cnt_collector_node.helper_functions import load_dimensions
+from src.cnt_collector_node.utxo_objects import TokensPair
 
 
 def insert_utxo_complete_(
@@ -61,13 +80,20 @@ def insert_utxo_complete_(
 
 
 def orig_utxo_by_source_query(db: DBObject, tokens_pair: dict, context: dict):
-    """Copy of the original function from the original indexer code."""
+    """Copy of the original function from the original indexer code,
+    on the pairs, sources and tokens dimension tables.
+    """
     db.cursor.execute(
-        "SELECT id, block_height, token1_amount, token1_decimals, "
-        "token2_amount, token2_decimals, tx_hash, output_index "
+        "SELECT utxos.id, block_height, token1_amount, token1.decimals, "
+        "token2_amount, token2.decimals, tx_hash, output_index "
         "FROM utxos "
-        "WHERE pair = ? AND source = ? AND address = ? "
-        "AND security_token_policy = ? AND security_token_name = ?",
+        "JOIN pairs ON pairs.id = utxos.pair_id "
+        "JOIN sources ON sources.id = utxos.source_id "
+        "JOIN tokens AS token1 ON token1.id = utxos.token1_id "
+        "JOIN tokens AS token2 ON token2.id = utxos.token2_id "
+        "JOIN tokens AS security ON security.id = utxos.security_token_id "
+        "WHERE pairs.name = ? AND sources.name = ? AND address = ? "
+        "AND security.policy = ? AND security.name = ?",
         (
             tokens_pair["pair"],
             tokens_pair["source"],
@@ -275,3 +301,297 @@ def test_select_utxo_record_by_source_address_and_policy(
         query_obj=query_obj,
     )
     assert res3 is None
+
+
+token_decimals_tests = [
+    # Inserted without decimals, e.g. a security token.
+    ([None], None),
+    ([6], 6),
+    # Decimals are kept when the token is inserted again without them.
+    ([6, None], 6),
+    ([None, 6], 6),
+    ([6, 8], 8),
+]
+
+
+@pytest.mark.parametrize("decimals, expected", token_decimals_tests)
+def test_insert_token(decimals: list, expected):
+    """Ensure tokens are inserted once and their decimals updated."""
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = DBObject(connection=conn, cursor=conn.cursor())
+    for value in decimals:
+        insert_token(db, "policy1", "token1name", value)
+    rows = db.cursor.execute("SELECT policy, name, decimals FROM tokens").fetchall()
+    assert rows == [("policy1", "token1name", expected)]
+
+
+def test_load_dimensions(tmp_path):
+    """Ensure the pairs config is loaded into the dimension tables once."""
+    db_name = str(tmp_path / "dimensions.db")
+    create_database(db_name)
+    tokens_pair = TokensPair(
+        pair="FACT-ADA",
+        source="MinswapV2",
+        token_1_policy="policy1",
+        token_1_name="token1name",
+        token_1_decimals=6,
+        token_2_policy="",
+        token_2_name="lovelace",
+        token_2_decimals=6,
+        security_token_policy="policyABC",
+        security_token_name="nameABC",
+    )
+    other_source = dataclasses.replace(
+        tokens_pair, source="SundaeSwap", security_token_name="nameDEF"
+    )
+    pairs_config_dict = {"addr1": [tokens_pair], "addr2": [other_source]}
+    load_dimensions(db_name, pairs_config_dict)
+    load_dimensions(db_name, pairs_config_dict)
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT name FROM pairs").fetchall() == [("FACT-ADA",)]
+    assert conn.execute("SELECT name FROM sources ORDER BY id").fetchall() == [
+        ("MinswapV2",),
+        ("SundaeSwap",),
+    ]
+    assert conn.execute(
+        "SELECT policy, name, decimals FROM tokens ORDER BY id"
+    ).fetchall() == [
+        ("policy1", "token1name", 6),
+        ("", "lovelace", 6),
+        ("policyABC", "nameABC", None),
+        ("policyABC", "nameDEF", None),
+    ]
+    conn.close()
+
+
+tx_hash_tests = [
+    (
+        "2f742ae5f60690f3b6166306dcfd3d7901526770ce3f3ed7a8251cdd1c297a23",
+        bytes.fromhex(
+            "2f742ae5f60690f3b6166306dcfd3d7901526770ce3f3ed7a8251cdd1c297a23"
+        ),
+    ),
+    # Values that aren't transaction hashes are stored as they are.
+    ("abc", "abc"),
+    ("2f742ae5", "2f742ae5"),
+    ("x" * 64, "x" * 64),
+]
+
+
+@pytest.mark.parametrize("tx_hash, stored", tx_hash_tests)
+def test_tx_hash_storage(tx_hash: str, stored):
+    """Ensure transaction hashes are stored as bytes and read back as
+    hex.
+    """
+    assert tx_hash_to_db(tx_hash) == stored
+    assert tx_hash_from_db(stored) == tx_hash
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = DBObject(connection=conn, cursor=conn.cursor())
+    insert_utxo_complete_(
+        db=db,
+        pair="BASE-QUOTE",
+        source="SUPERDEX",
+        address="addr123",
+        token_1_amount=200,
+        decimals_1=8,
+        token_2_amount=500,
+        decimals_2=6,
+        security_token_policy="policyABC",
+        security_token_name="nameABC",
+        tx_hash=tx_hash,
+    )
+    assert db.cursor.execute("SELECT tx_hash FROM utxos").fetchone()[0] == stored
+    assert select_utxo_count_by_tx_info(db, tx_hash, 3) == 1
+    res = select_utxo_record_by_source_address_and_policy(
+        db=db,
+        query_obj=utxo_source_policy_query_obj(
+            pair="BASE-QUOTE",
+            source="SUPERDEX",
+            address="addr123",
+            security_token_policy="policyABC",
+            security_token_name="nameABC",
+        ),
+    )
+    assert res.tx_hash == tx_hash
+    assert isinstance(
+        db.cursor.execute("SELECT date_time FROM utxos").fetchone()[0], int
+    )
+
+
+def _batch_records(idx: int):
+    """Return a UTxO and a price record for the batch tests."""
+    utxo = complete_utxo_obj(
+        pair=f"TOKEN{idx % 2}-ADA",
+        source=f"DEX{idx % 3}",
+        price=1.5 + idx,
+        block_height=10 + idx,
+        address=f"addr{idx}",
+        token_1_policy=f"policy{idx % 2}",
+        token_1_name="token",
+        token_1_decimals=idx % 2,
+        token_2_policy="",
+        token_2_name="lovelace",
+        token_2_decimals=6,
+        security_token_policy="policyABC",
+        security_token_name=f"nft{idx}",
+        token_1_amount=100 + idx,
+        token_2_amount=200 + idx,
+        tx_hash=f"{idx:064x}",
+        tx_index=idx,
+    )
+    price = price_record_obj(
+        pair=utxo.pair,
+        epoch=500,
+        block_height=utxo.block_height,
+        price=utxo.price,
+        token_1_amount=utxo.token_1_amount,
+        token_2_amount=utxo.token_2_amount,
+        source=utxo.source,
+    )
+    return utxo, price
+
+
+def test_insert_batches():
+    """Ensure the records inserted with executemany are the ones
+    inserted one by one.
+    """
+    records = [_batch_records(idx) for idx in range(6)]
+    rows = []
+    for batch in (False, True):
+        conn = sqlite3.connect(":memory:")
+        _create_database(conn)
+        db = DBObject(connection=conn, cursor=conn.cursor())
+        if batch:
+            insert_utxos_complete(db, [utxo for utxo, _ in records])
+            insert_price_records(db, [price for _, price in records])
+        else:
+            for utxo, price in records:
+                insert_utxo_complete(db, utxo)
+                insert_price_record(db, price)
+        rows.append(
+            (
+                conn.execute(
+                    "SELECT id, pair, source, price, block_height, address, "
+                    "token1_decimals, token2_decimals, security_token_name, "
+                    "tx_hash, output_index FROM utxo_records ORDER BY id"
+                ).fetchall(),
+                conn.execute(
+                    "SELECT id, pair, source, price, block_height FROM price_records "
+                    "ORDER BY id"
+                ).fetchall(),
+            )
+        )
+        conn.close()
+    assert rows[0] == rows[1]
+    assert len(rows[0][0]) == len(records)
+
+
+def test_latest_pool_state():
+    """Ensure the latest pool state follows the UTxO of a pair and
+    source with the highest block height, across addresses.
+    """
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = DBObject(connection=conn, cursor=conn.cursor())
+    for idx, address in enumerate(("addr1", "addr2")):
+        insert_utxo_complete_(
+            db=db,
+            pair="FACT-ADA",
+            source="MinswapV2",
+            address=address,
+            token_1_amount=100 + idx,
+            decimals_1=6,
+            token_2_amount=200 + idx,
+            decimals_2=6,
+            security_token_policy="policyABC",
+            security_token_name="nameABC",
+            tx_hash=f"{idx:064x}",
+        )
+    insert_utxo_complete_(
+        db=db,
+        pair="FACT-ADA",
+        source="SundaeSwap",
+        address="addr3",
+        token_1_amount=300,
+        decimals_1=6,
+        token_2_amount=400,
+        decimals_2=6,
+        security_token_policy="policyDEF",
+        security_token_name="nameDEF",
+        tx_hash=f"{3:064x}",
+    )
+
+    def latest(source: str, policy: str, name: str):
+        state = select_latest_pool_states(db).get(
+            utxo_source_policy_query_obj(
+                pair="FACT-ADA",
+                source=source,
+                address=None,
+                security_token_policy=policy,
+                security_token_name=name,
+            )
+        )
+        return state.token_1_volume if state else None
+
+    assert len(select_latest_pool_states(db).states) == 2
+    assert latest("SundaeSwap", "policyDEF", "nameDEF") == 300
+    assert latest("SundaeSwap", "policyABC", "nameABC") is None
+    for row_id, block_height, expected in ((1, 20, 500), (2, 30, 501), (2, 5, 500)):
+        update_utxo_partial(
+            db,
+            partial_utxo_obj(
+                block_height=block_height,
+                price=1.0,
+                token_1_amount=499 + row_id,
+                token_2_amount=600,
+                tx_hash=f"{row_id:064x}",
+                tx_index=0,
+            ),
+            row_id,
+        )
+        assert latest("MinswapV2", "policyABC", "nameABC") == expected
+    assert latest("SundaeSwap", "policyDEF", "nameDEF") == 300
+
+
+@pytest.mark.parametrize("read_only", [False, True])
+def test_database_snapshot(read_only: bool):
+    """Ensure the submitter gets a context with the pool states loaded
+    once for the run, in one read transaction in read-only mode.
+    """
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = DBObject(connection=conn, cursor=conn.cursor())
+    insert_utxo_complete_(
+        db=db,
+        pair="FACT-ADA",
+        source="MinswapV2",
+        address="addr1",
+        token_1_amount=100,
+        decimals_1=6,
+        token_2_amount=200,
+        decimals_2=6,
+        security_token_policy="policyABC",
+        security_token_name="nameABC",
+        tx_hash=f"{1:064x}",
+    )
+    conn.commit()
+    app_context = helpers.AppContext(
+        db_name=None,
+        database=db,
+        ogmios_url="",
+        ogmios_ws=None,
+        kupo_url="",
+        use_kupo=False,
+        main_event=None,
+        thread_event=None,
+        reconnect_event=None,
+        read_only=read_only,
+    )
+    with submitter.database_snapshot(app_context, read_only) as snapshot_context:
+        assert len(snapshot_context.pool_states.states) == 1
+        assert snapshot_context.database is db
+        assert conn.in_transaction == read_only
+    assert not conn.in_transaction
+    assert app_context.pool_states is None
@@ -0,0 +1,129 @@
+"""Tests for the single database writer."""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.cnt_collector_node import database_abstraction as dba
+from src.cnt_collector_node import database_initialization
+from src.cnt_collector_node.database_writer import DatabaseWriter, WriterError
+
+
+def _insert_status(database: dba.DBObject, block: int) -> int:
+    """Write operation inserting a status row."""
+    dba.insert_status(db=database, block=block)
+    return block
+
+
+def _fail(database: dba.DBObject, block: int) -> None:
+    """Write operation failing after inserting a status row."""
+    dba.insert_status(db=database, block=block)
+    raise ValueError(block)
+
+
+def _statuses(db_name: str) -> list[int]:
+    """Return the status rows."""
+    conn = sqlite3.connect(db_name)
+    rows = [
+        row[0]
+        for row in conn.execute("SELECT current_block_slot FROM status ORDER BY id")
+    ]
+    conn.close()
+    return rows
+
+
+@pytest.fixture(name="db_name")
+def fixture_db_name(tmp_path) -> str:
+    """Return the name of a new database."""
+    db_name = str(tmp_path / "test.db")
+    database_initialization.create_database(db_name)
+    return db_name
+
+
+@pytest.mark.parametrize("max_batch, transactions", [(1, 5), (2, 3), (5, 1), (100, 1)])
+def test_writer_batches(db_name: str, max_batch: int, transactions: int):
+    """Ensure the operations queued together are committed in
+    transactions of up to max_batch operations, in order.
+    """
+    writer = DatabaseWriter(db_name, max_batch=max_batch)
+    futures = [writer.submit(_insert_status, block) for block in range(5)]
+    assert writer.queue_depth == 5
+    writer.start()
+    assert [future.result() for future in futures] == list(range(5))
+    writer.stop()
+    assert _statuses(db_name) == list(range(5))
+    assert writer.stats.operations == 5
+    assert writer.stats.transactions == transactions
+    assert writer.stats.max_queue_depth == 5
+    assert writer.stats.mean_commit_ms >= 0
+    assert writer.queue_depth == 0
+
+
+def test_writer_failed_operation(db_name: str):
+    """Ensure a failing operation is rolled back alone and its error
+    raised to the caller.
+    """
+    writer = DatabaseWriter(db_name)
+    first = writer.submit(_insert_status, 1)
+    failed = writer.submit(_fail, 2)
+    last = writer.submit(_insert_status, 3)
+    writer.start()
+    with pytest.raises(ValueError):
+        failed.result()
+    assert first.result() == 1
+    assert last.result() == 3
+    writer.stop()
+    assert _statuses(db_name) == [1, 3]
+    assert writer.stats.failed_operations == 1
+    assert writer.stats.transactions == 1
+
+
+def test_writer_write_async(db_name: str):
+    """Ensure the operations can be awaited without blocking the loop."""
+    writer = DatabaseWriter(db_name).start()
+
+    async def write():
+        return await asyncio.gather(
+            writer.write_async(_insert_status, 1),
+            writer.write_async(_insert_status, 2),
+        )
+
+    assert asyncio.run(write()) == [1, 2]
+    assert writer.write(_insert_status, 3) == 3
+    writer.stop()
+    assert _statuses(db_name) == [1, 2, 3]
+
+
+def test_writer_stop(db_name: str):
+    """Ensure the operations submitted before stop are applied."""
+    writer = DatabaseWriter(db_name, max_batch=2)
+    for block in range(3):
+        writer.submit(_insert_status, block)
+    writer.start()
+    writer.stop()
+    assert _statuses(db_name) == [0, 1, 2]
+
+
+@pytest.mark.parametrize(
+    "target", ["database_initialization.connect", "DatabaseWriter._apply"]
+)
+def test_writer_dead(mocker, db_name: str, target: str):
+    """Ensure the queued operations fail when the writer thread dies
+    and the later ones are refused instead of waiting forever.
+    """
+    error = sqlite3.OperationalError("unable to open database file")
+    mocker.patch(f"src.cnt_collector_node.database_writer.{target}", side_effect=error)
+    writer = DatabaseWriter(db_name)
+    futures = [writer.submit(_insert_status, block) for block in range(3)]
+    writer.start()
+    for future in futures:
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(timeout=5)
+    writer.stop()
+    assert writer.stats.failed_operations == 3
+    with pytest.raises(WriterError):
+        writer.write(_insert_status, 3)
+    with pytest.raises(WriterError):
+        asyncio.run(writer.write_async(_insert_status, 4))
+    assert not _statuses(db_name)
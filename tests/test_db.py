@@ -2,11 +2,18 @@
 
 # pylint: disable=W0212
 
+import dataclasses
 import sqlite3
 
 import pytest
 
-from src.cnt_collector_node import database_initialization
+from src.cnt_collector_node import database_abstraction as dba
+from src.cnt_collector_node import database_derived as derived
+from src.cnt_collector_node import (
+    database_initialization,
+    helper_functions,
+    storage_benchmark,
+)
 
 
 def test_db_init():
@@ -33,7 +40,7 @@ def test_db_init():
     # in aid of these tests.
     cursor.execute("SELECT id from utxos;")
     with pytest.raises(sqlite3.OperationalError):
-        cursor.execute("SELECT pair from utxos;")
+        cursor.execute("SELECT pair_id from utxos;")
     # Create the database.
     database_initialization._create_database(conn=conn)
     # Ensure our three primary tables are created.
@@ -42,7 +49,11 @@ def test_db_init():
     cursor.execute("SELECT * from status;")
     # Ensure that at least one column is created correctly after UTxO
     # table is dropped during init.
-    cursor.execute("SELECT pair from utxos;")
+    cursor.execute("SELECT pair_id from utxos;")
+    # And the dimension tables.
+    cursor.execute("SELECT * from pairs;")
+    cursor.execute("SELECT * from sources;")
+    cursor.execute("SELECT * from tokens;")
     conn.close()
 
 
@@ -52,14 +63,15 @@ def test_db_indexes():
     Characterization tests for database index creation.
     """
     indexes = [
-        "CREATE INDEX price_pair ON price(pair)",
+        "CREATE UNIQUE INDEX price_pair ON price(pair_id, source_id, "
+        "block_height, token1_amount, token2_amount)",
         "CREATE INDEX price_epoch ON price(epoch)",
-        "CREATE INDEX utxos_name ON utxos(pair, source)",
-        "CREATE INDEX utxos_token1_policy ON utxos(token1_policy)",
-        "CREATE INDEX utxos_token2_policy ON utxos(token2_policy)",
-        "CREATE INDEX utxos_security_token_policy ON utxos(security_token_policy)",
-        "CREATE INDEX utxos_tx_hash ON utxos(tx_hash)",
+        "CREATE INDEX utxos_tx_output ON utxos(tx_hash, output_index, "
+        "token1_id, token2_id)",
+        "CREATE INDEX utxos_pair_source ON utxos(pair_id, source_id, "
+        "security_token_id, block_height)",
         "CREATE INDEX utxos_date_time ON utxos(date_time)",
+        "CREATE INDEX journal_slot ON journal(slot)",
     ]
     conn = sqlite3.connect(":memory:")
     database_initialization._create_database(conn=conn)
@@ -68,10 +80,426 @@ def test_db_indexes():
     created_indexes = []
     for schema in schemata.fetchall():
         ins = schema[0]
-        if "CREATE INDEX" not in ins.upper():
+        # Indexes of UNIQUE constraints have no SQL.
+        if not ins or " INDEX " not in ins.upper():
             continue
         created_indexes.append(ins.upper())
     assert len(created_indexes) == len(indexes)
     for idx in indexes:
         assert idx.upper() in created_indexes
     conn.close()
+
+
+SUPERSEDED_INDEXES = [
+    "CREATE INDEX price_pair ON price(pair)",
+    "CREATE INDEX utxos_name ON utxos(pair, source)",
+    "CREATE INDEX utxos_token1_policy ON utxos(token1_policy)",
+    "CREATE INDEX utxos_token2_policy ON utxos(token2_policy)",
+    "CREATE INDEX utxos_security_token_policy ON utxos(security_token_policy)",
+    "CREATE INDEX utxos_tx_hash ON utxos(tx_hash)",
+]
+
+
+def _create_unversioned_database(db_name: str) -> None:
+    """Create a database as laid out before the schema versions."""
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE price (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+        "pair TEXT NOT NULL, source TEXT NOT NULL, price FLOAT NOT NULL, "
+        "token1_amount INTEGER NOT NULL, token2_amount INTEGER NOT NULL, "
+        "epoch INTEGER NOT NULL, block_height INTEGER NOT NULL, date_time timestamp)"
+    )
+    cursor.execute(
+        "CREATE TABLE utxos (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+        "pair TEXT NOT NULL, source TEXT NOT NULL, token1_policy TEXT NOT NULL, "
+        "token2_policy TEXT NOT NULL, security_token_policy TEXT NOT NULL, "
+        "tx_hash TEXT NOT NULL)"
+    )
+    cursor.execute(
+        "CREATE TABLE status (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+        "current_block_slot INTEGER NOT NULL, date_time timestamp)"
+    )
+    for idx in SUPERSEDED_INDEXES:
+        cursor.execute(idx)
+    cursor.execute(
+        "INSERT INTO price(pair, source, price, token1_amount, token2_amount, "
+        "epoch, block_height, date_time) VALUES "
+        "('FACT-ADA', 'MinswapV2', 0.5, 2, 1, 500, 100, '2024-01-01'), "
+        "('FACT-ADA', 'SundaeSwap', 0.25, 4, 1, 500, 101, '2024-01-01'), "
+        "('SNEK-ADA', 'MinswapV2', 0.1, 10, 1, 500, 102, '2024-01-01')"
+    )
+    cursor.execute("INSERT INTO status(current_block_slot) VALUES(1)")
+    conn.commit()
+    conn.close()
+
+
+def _assert_migrated(db_name: str) -> None:
+    """Ensure a database created by _create_unversioned_database was
+    migrated to the current schema, keeping its price history.
+    """
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    indexes = [
+        row[0]
+        for row in cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"
+        )
+    ]
+    assert not set(indexes) & set(SUPERSEDED_INDEXES)
+    assert len(indexes) == 6
+    assert (
+        cursor.execute("PRAGMA user_version").fetchone()[0]
+        == database_initialization.SCHEMA_VERSION
+    )
+    assert cursor.execute("SELECT count(*) FROM status").fetchone()[0] == 1
+    assert cursor.execute(
+        "SELECT price.id, pairs.name, sources.name, price.price, price.block_height "
+        "FROM price JOIN pairs ON pairs.id = price.pair_id "
+        "JOIN sources ON sources.id = price.source_id ORDER BY price.id"
+    ).fetchall() == [
+        (1, "FACT-ADA", "MinswapV2", 0.5, 100),
+        (2, "FACT-ADA", "SundaeSwap", 0.25, 101),
+        (3, "SNEK-ADA", "MinswapV2", 0.1, 102),
+    ]
+    # The UTxOs are re-populated.
+    assert cursor.execute("SELECT count(*) FROM utxos").fetchone()[0] == 0
+    cursor.execute("SELECT pair_id FROM utxos")
+    conn.close()
+
+
+def test_db_migration(tmp_path):
+    """Ensure databases created before the schema versions are migrated
+    to the current schema, keeping their price history.
+    """
+    db_name = str(tmp_path / "migration.db")
+    _create_unversioned_database(db_name)
+    database_initialization.create_database(db_name, drop_utxos=False)
+    _assert_migrated(db_name)
+
+
+def test_db_migration_interrupted(mocker, tmp_path):
+    """Ensure a migration interrupted halfway is rolled back as a whole
+    and applied again by the next run.
+    """
+    db_name = str(tmp_path / "migration.db")
+    _create_unversioned_database(db_name)
+    migrations = list(database_initialization.MIGRATIONS)
+    # fails after the price table is renamed and its replacement created.
+    migrations[1] = migrations[1][:7] + ["SELECT * FROM interrupted"]
+    mocker.patch.object(database_initialization, "MIGRATIONS", migrations)
+    with pytest.raises(sqlite3.OperationalError):
+        database_initialization.create_database(db_name, drop_utxos=False)
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert _tables(db_name) >= {"price", "utxos", "status"}
+    assert not _tables(db_name) & {"price_v1", "pairs", "sources", "journal"}
+    assert conn.execute("SELECT count(pair) FROM price").fetchone()[0] == 3
+    conn.close()
+    mocker.stopall()
+    database_initialization.create_database(db_name, drop_utxos=False)
+    _assert_migrated(db_name)
+
+
+def test_db_migration_storage_v2(tmp_path):
+    """Ensure transaction hashes and timestamps saved as text are
+    converted by the migration command.
+    """
+    tx_hash = "2f742ae5f60690f3b6166306dcfd3d7901526770ce3f3ed7a8251cdd1c297a23"
+    db_name = str(tmp_path / "migration.db")
+    database_initialization.create_database(db_name)
+    conn = sqlite3.connect(db_name)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    dba.insert_status(db=db, block=1)
+    dba.insert_utxo_complete(
+        db=db,
+        utxo_record=dba.complete_utxo_obj(
+            pair="FACT-ADA",
+            source="MinswapV2",
+            price=0.5,
+            block_height=1,
+            address="addr1",
+            token_1_policy="policy1",
+            token_1_name="token1name",
+            token_1_decimals=6,
+            token_2_policy="",
+            token_2_name="lovelace",
+            token_2_decimals=6,
+            security_token_policy="policyABC",
+            security_token_name="nameABC",
+            token_1_amount=2,
+            token_2_amount=1,
+            tx_hash=tx_hash,
+            tx_index=0,
+        ),
+    )
+    # As saved by the previous storage format.
+    conn.execute("UPDATE utxos SET tx_hash = ?", (tx_hash,))
+    for table in ("status", "utxos"):
+        conn.execute(f"UPDATE {table} SET date_time = '2024-01-01T00:00:05Z'")
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+    assert (
+        database_initialization.migrate(db_name)
+        == database_initialization.SCHEMA_VERSION
+    )
+    conn = sqlite3.connect(db_name)
+    assert conn.execute(
+        "SELECT tx_hash, date_time, typeof(date_time) FROM utxos"
+    ).fetchall() == [(bytes.fromhex(tx_hash), 1704067205000, "integer")]
+    assert conn.execute("SELECT date_time FROM status").fetchone()[0] == 1704067205000
+    assert conn.execute(
+        "SELECT utxo_id, tx_hash FROM latest_pool_state"
+    ).fetchall() == [(1, bytes.fromhex(tx_hash))]
+    assert conn.execute("SELECT tx_hash, date_time FROM utxo_records").fetchall() == [
+        (tx_hash, "2024-01-01T00:00:05Z")
+    ]
+    conn.close()
+    with pytest.raises(FileNotFoundError):
+        database_initialization.migrate(str(tmp_path / "missing.db"))
+
+
+@pytest.mark.parametrize("profile", list(database_initialization.STORAGE_PROFILES))
+def test_storage_profiles(tmp_path, profile: str):
+    """Ensure the pragmas of the storage profiles are applied."""
+    expected = database_initialization.STORAGE_PROFILES[profile]
+    conn = database_initialization.connect(str(tmp_path / "profile.db"), profile)
+    cursor = conn.cursor()
+    synchronous = {"OFF": 0, "NORMAL": 1, "FULL": 2}
+    temp_store = {"DEFAULT": 0, "FILE": 1, "MEMORY": 2}
+    assert cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert (
+        cursor.execute("PRAGMA synchronous").fetchone()[0]
+        == synchronous[expected.synchronous]
+    )
+    assert cursor.execute("PRAGMA cache_size").fetchone()[0] == -expected.cache_size
+    assert (
+        cursor.execute("PRAGMA temp_store").fetchone()[0]
+        == temp_store[expected.temp_store]
+    )
+    assert cursor.execute("PRAGMA busy_timeout").fetchone()[0] == expected.busy_timeout
+    conn.close()
+
+
+def test_storage_profile_unknown(tmp_path):
+    """Ensure unknown storage profiles are rejected."""
+    with pytest.raises(ValueError):
+        database_initialization.connect(str(tmp_path / "profile.db"), "unknown")
+
+
+def test_storage_profile_concurrent_reader(tmp_path):
+    """Ensure readers aren't blocked while a write transaction is open."""
+    db_name = str(tmp_path / "profile.db")
+    database_initialization.create_database(db_name)
+    writer = database_initialization.connect(db_name)
+    reader = database_initialization.connect(db_name)
+    writer.execute("INSERT INTO status(current_block_slot) VALUES(1)")
+    writer.execute("INSERT INTO status(current_block_slot) VALUES(2)")
+    # the uncommitted rows aren't visible, and the read doesn't wait.
+    assert reader.execute("SELECT count(*) FROM status").fetchone()[0] == 0
+    writer.commit()
+    assert reader.execute("SELECT count(*) FROM status").fetchone()[0] == 2
+    writer.close()
+    reader.close()
+
+
+def test_connect_read_only(tmp_path):
+    """Ensure read-only connections can't write and read from one
+    snapshot inside a read transaction.
+    """
+    db_name = str(tmp_path / "read_only.db")
+    database_initialization.create_database(db_name)
+    writer = database_initialization.connect(db_name)
+    writer.execute("INSERT INTO status(current_block_slot) VALUES(1)")
+    writer.commit()
+    reader = database_initialization.connect(db_name, read_only=True)
+    assert reader.execute("PRAGMA query_only").fetchone()[0] == 1
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("INSERT INTO status(current_block_slot) VALUES(2)")
+    reader.rollback()
+    reader.execute("BEGIN")
+    assert reader.execute("SELECT count(*) FROM status").fetchone()[0] == 1
+    # the writer isn't blocked by the read transaction, and the reader
+    # doesn't see its commit until the transaction ends.
+    writer.execute("INSERT INTO status(current_block_slot) VALUES(2)")
+    writer.commit()
+    assert reader.execute("SELECT count(*) FROM status").fetchone()[0] == 1
+    reader.rollback()
+    assert reader.execute("SELECT count(*) FROM status").fetchone()[0] == 2
+    writer.close()
+    reader.close()
+
+
+def _tables(db_name: str) -> set[str]:
+    """Return the tables of a database file."""
+    conn = sqlite3.connect(db_name)
+    tables = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    conn.close()
+    return tables
+
+
+def _price_record(block_height: int) -> dba.PriceRecord:
+    """Return a price record at a block height."""
+    return dba.price_record_obj(
+        pair="FACT-ADA",
+        epoch=500,
+        block_height=block_height,
+        price=0.5,
+        token_1_amount=2,
+        token_2_amount=1,
+        source="MinswapV2",
+    )
+
+
+def test_history_database(tmp_path):
+    """Ensure the price history is kept in the history database, read
+    and written through the unqualified statements.
+    """
+    db_name = str(tmp_path / "hot.db")
+    history_db_name = str(tmp_path / "history.db")
+    conn = database_initialization.connect(db_name, history_db_name=history_db_name)
+    database_initialization._create_database(conn)  # pylint: disable=W0212
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    dba.insert_status(db=db, block=1)
+    dba.insert_price_records(db, [_price_record(1), _price_record(2)])
+    derived.insert_rollup_status(db, 0)
+    conn.commit()
+    assert conn.execute("PRAGMA history.journal_mode").fetchone()[0] == "wal"
+    assert [row.id_ for row in derived.select_price_records_after(db, 0, 10)] == [1, 2]
+    assert conn.execute("SELECT count(*) FROM price_records").fetchone()[0] == 2
+    database_initialization.checkpoint_history(conn)
+    conn.close()
+    hot_tables = _tables(db_name)
+    history_tables = _tables(history_db_name)
+    assert set(database_initialization.HISTORY_TABLES) <= history_tables
+    assert not set(database_initialization.HISTORY_TABLES) & hot_tables
+    assert {"status", "utxos", "latest_pool_state"} <= hot_tables
+    reader = database_initialization.connect(
+        db_name, read_only=True, history_db_name=history_db_name
+    )
+    assert reader.execute("SELECT count(*) FROM price_records").fetchone()[0] == 2
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("DELETE FROM price")
+    reader.close()
+
+
+def test_history_database_migration(tmp_path):
+    """Ensure the price history of a single database file is moved to
+    the history database, keeping its ids.
+    """
+    db_name = str(tmp_path / "hot.db")
+    history_db_name = str(tmp_path / "history.db")
+    database_initialization.create_database(db_name)
+    conn = database_initialization.connect(db_name)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    dba.insert_price_records(db, [_price_record(1), _price_record(2)])
+    conn.execute("DELETE FROM price WHERE id = 1")
+    conn.commit()
+    conn.close()
+    assert (
+        database_initialization.migrate(db_name, history_db_name=history_db_name)
+        == database_initialization.SCHEMA_VERSION
+    )
+    assert "price" not in _tables(db_name)
+    conn = sqlite3.connect(history_db_name)
+    assert conn.execute("SELECT id, block_height FROM price").fetchall() == [(2, 2)]
+    conn.close()
+    # new records follow the moved ones.
+    conn = database_initialization.connect(db_name, history_db_name=history_db_name)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    assert dba.insert_price_record(db, _price_record(3)) == 3
+    conn.close()
+
+
+def test_price_records_replayed(tmp_path):
+    """Ensure the price records of a replayed block are saved once, the
+    same record returning no id so that it isn't journaled again.
+    """
+    db_name = str(tmp_path / "hot.db")
+    history_db_name = str(tmp_path / "history.db")
+    conn = database_initialization.connect(db_name, history_db_name=history_db_name)
+    database_initialization._create_database(conn)  # pylint: disable=W0212
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    dba.insert_price_records(db, [_price_record(1), _price_record(2)])
+    dba.insert_price_records(db, [_price_record(2), _price_record(3)])
+    assert dba.insert_price_record(db, _price_record(1)) is None
+    price_id = dba.insert_price_record(db, _price_record(4))
+    assert dba.insert_price_record(db, _price_record(4)) is None
+    # another pool state in the same block.
+    other = dataclasses.replace(_price_record(4), token_1_amount=3, price=1 / 3)
+    assert dba.insert_price_record(db, other) > price_id
+    conn.commit()
+    assert [
+        row[0]
+        for row in conn.execute("SELECT block_height FROM history.price ORDER BY id")
+    ] == [1, 2, 3, 4, 4]
+    conn.close()
+
+
+def test_reconcile_history(tmp_path):
+    """Ensure the blocks whose price records were lost by the history
+    database are rolled back, and nothing else.
+    """
+    conn = database_initialization.connect(
+        str(tmp_path / "hot.db"), history_db_name=str(tmp_path / "history.db")
+    )
+    database_initialization._create_database(conn)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    for slot in (100, 200, 300):
+        price_id = dba.insert_price_record(db, _price_record(slot))
+        derived.insert_journal_entry(
+            db, slot, "price", price_id, derived.JOURNAL_INSERT
+        )
+        dba.insert_checkpoint(db, slot, f"block{slot}")
+    dba.insert_status(db=db, block=300)
+    assert helper_functions.reconcile_history(db) is None
+    # the history commit of the last two blocks is lost.
+    conn.execute("DELETE FROM history.price WHERE block_height > 100")
+    assert helper_functions.reconcile_history(db) == 199
+    assert dba.select_checkpoints(db, 10) == [{"slot": 100, "id": "block100"}]
+    assert dba.get_status(db) == 199
+    assert [row[0] for row in conn.execute("SELECT slot FROM journal")] == [100]
+    assert helper_functions.reconcile_history(db) is None
+    conn.close()
+
+
+def test_db_migration_price_duplicates(tmp_path):
+    """Ensure the price records saved twice before they were unique are
+    dropped by the migration, keeping the first ones.
+    """
+    db_name = str(tmp_path / "duplicates.db")
+    database_initialization.create_database(db_name)
+    conn = sqlite3.connect(db_name)
+    conn.execute("DROP INDEX price_pair")
+    conn.execute("PRAGMA user_version = 4")
+    conn.commit()
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    dba.insert_price_records(db, [_price_record(1), _price_record(2)])
+    dba.insert_price_records(db, [_price_record(2), _price_record(3)])
+    conn.commit()
+    conn.close()
+    assert (
+        database_initialization.migrate(db_name)
+        == database_initialization.SCHEMA_VERSION
+    )
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT id, block_height FROM price").fetchall() == [
+        (1, 1),
+        (2, 2),
+        (4, 3),
+    ]
+    conn.close()
+
+
+@pytest.mark.parametrize("profile", ["fast", storage_benchmark.MEMORY_PROFILE])
+def test_storage_benchmark(tmp_path, profile: str):
+    """Ensure the storage benchmark runs."""
+    res = storage_benchmark.benchmark_profile(
+        directory=str(tmp_path), profile=profile, blocks=20, outputs=2, pairs=5
+    )
+    assert res.blocks_per_second > 0
+    assert profile in storage_benchmark.report([res])
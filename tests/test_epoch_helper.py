@@ -0,0 +1,190 @@
+"""Tests for resolving epochs from slots."""
+
+import asyncio
+
+import pytest
+
+from src.cnt_collector_node import epoch_helper
+
+
+def _era(start_slot, start_epoch, end_slot, end_epoch, epoch_length):
+    """Return an era summary as returned by Ogmios."""
+    end = None
+    if end_slot is not None:
+        end = {"time": {"seconds": 0}, "slot": end_slot, "epoch": end_epoch}
+    return {
+        "start": {"time": {"seconds": 0}, "slot": start_slot, "epoch": start_epoch},
+        "end": end,
+        "parameters": {
+            "epochLength": epoch_length,
+            "slotLength": {"milliseconds": 1000},
+            "safeZone": 129600,
+        },
+    }
+
+
+# Mainnet era summaries, Byron through Conway.
+mainnet_era_summaries = {
+    "jsonrpc": "2.0",
+    "method": "queryLedgerState/eraSummaries",
+    "result": [
+        _era(0, 0, 4492800, 208, 21600),
+        _era(4492800, 208, 16588800, 236, 432000),
+        _era(16588800, 236, 23068800, 251, 432000),
+        _era(23068800, 251, 39916800, 290, 432000),
+        _era(39916800, 290, 72316800, 365, 432000),
+        _era(72316800, 365, 133660800, 507, 432000),
+        _era(133660800, 507, 175564800, 604, 432000),
+    ],
+}
+
+
+epoch_tests = [
+    # Byron.
+    (0, (0, 0, 21600)),
+    (21599, (0, 0, 21600)),
+    (21600, (1, 21600, 43200)),
+    # First Shelley slot.
+    (4492800, (208, 4492800, 4924800)),
+    # Last Byron slot.
+    (4492799, (207, 4471200, 4492800)),
+    # Conway, as used in other tests.
+    (168283633, (587, 168220800, 168652800)),
+    (170272922, (591, 169948800, 170380800)),
+    # Beyond the forecast horizon.
+    (175564800, None),
+]
+
+
+@pytest.mark.parametrize("slot, expected", epoch_tests)
+def test_epoch_bounds_from_slot(slot: int, expected: tuple):
+    """Ensure epochs are calculated correctly from slots."""
+    eras = epoch_helper.era_summaries_from_ogmios(mainnet_era_summaries)
+    assert len(eras) == 7
+    assert epoch_helper.epoch_bounds_from_slot(slot, eras) == expected
+
+
+def test_era_summaries_open_ended():
+    """Ensure an era without an end covers all following slots."""
+    eras = epoch_helper.era_summaries_from_ogmios(
+        {"result": [_era(0, 0, None, None, 100)]}
+    )
+    assert epoch_helper.epoch_bounds_from_slot(1050, eras) == (10, 1000, 1100)
+
+
+def test_era_summaries_unexpected():
+    """Ensure unexpected responses don't return partial summaries."""
+    assert not epoch_helper.era_summaries_from_ogmios({})
+    assert not epoch_helper.era_summaries_from_ogmios({"result": [{"start": {}}]})
+
+
+def test_epoch_resolver_caches(mocker):
+    """Ensure Ogmios is only queried when crossing epoch boundaries."""
+    summaries = mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_era_summaries",
+        return_value=mainnet_era_summaries,
+    )
+    epoch = mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_epoch",
+        return_value={"result": 592},
+    )
+    resolver = epoch_helper.EpochResolver(cross_check_every=1)
+    assert resolver.epoch(170272922, "OGMIOS_WS") == 591
+    assert summaries.call_count == 1
+    assert epoch.call_count == 1
+    for slot in range(170272922, 170380800, 1000):
+        assert resolver.epoch(slot, "OGMIOS_WS") == 591
+    assert summaries.call_count == 1
+    assert epoch.call_count == 1
+    # Crossing into the next epoch is checked again.
+    assert resolver.epoch(170380800, "OGMIOS_WS") == 592
+    assert summaries.call_count == 1
+    assert epoch.call_count == 2
+
+
+def test_epoch_resolver_cross_check_failure(mocker):
+    """Ensure the ledger epoch is used if the calculation is ahead of
+    the ledger, e.g. because the era summaries are wrong.
+    """
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_era_summaries",
+        return_value=mainnet_era_summaries,
+    )
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_epoch",
+        return_value={"result": 500},
+    )
+    resolver = epoch_helper.EpochResolver(cross_check_every=1)
+    assert resolver.epoch(170272922, "OGMIOS_WS") == 500
+    assert not resolver.eras
+
+
+def test_epoch_resolver_fallback(mocker):
+    """Ensure epochs are queried when era summaries are unavailable."""
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_era_summaries",
+        return_value={},
+    )
+    epoch = mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_epoch",
+        return_value={"result": 591},
+    )
+    resolver = epoch_helper.EpochResolver()
+    assert resolver.epoch(170272922, "OGMIOS_WS") == 591
+    assert resolver.epoch(170272923, "OGMIOS_WS") == 591
+    assert epoch.call_count == 2
+
+
+def test_epoch_resolver_async_shared(mocker):
+    """Ensure the async resolver queries Ogmios without holding the lock
+    and shares its cache with the sync callers of other threads.
+    """
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_era_summaries",
+        return_value=mainnet_era_summaries,
+    )
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_epoch",
+        return_value={"result": 592},
+    )
+    resolver = epoch_helper.EpochResolver(cross_check_every=1)
+
+    class Client:
+        """Asyncio Ogmios client resolving a slot from another thread
+        while queried.
+        """
+
+        queries = 0
+
+        async def era_summaries(self):
+            """Return the era summaries."""
+            self.queries += 1
+            assert not resolver._lock.locked()  # pylint: disable=W0212
+            assert await asyncio.to_thread(resolver.epoch, 170380800, "WS") == 592
+            return mainnet_era_summaries
+
+        async def epoch(self):
+            """Return the ledger epoch."""
+            self.queries += 1
+            assert not resolver._lock.locked()  # pylint: disable=W0212
+            return {"result": 592}
+
+    client = Client()
+    assert asyncio.run(resolver.epoch_async(170272922, client)) == 591
+    assert client.queries == 2
+    assert asyncio.run(resolver.epoch_async(170272923, client)) == 591
+    assert client.queries == 2
+
+
+@pytest.mark.parametrize(
+    "slot, expected",
+    [
+        # First Shelley slot, 2020-07-29T21:44:51Z.
+        (4492800, 1596059091000),
+        # 2024-01-01T00:00:00Z.
+        (112500909, 1704067200000),
+    ],
+)
+def test_slot_time_ms(slot: int, expected: int):
+    """Ensure mainnet slots are converted to their POSIX time."""
+    assert epoch_helper.slot_time_ms(slot) == expected
@@ -2,6 +2,8 @@
 
 import pytest
 
+from src.cnt_collector_node import utxo_objects
+from src.cnt_collector_node.helper_functions import kupo_tokens_pairs_matches
 from src.cnt_collector_node.kupo_helper import get_kupo_utxo_content
 from src.cnt_collector_node.ogmios_helper import (
     get_ogmios_utxo_content,
@@ -745,3 +747,71 @@ def test_get_kupo_content_mock(content: dict, result: dict):
     """Make sure we parse kupo content correctly."""
     res = get_kupo_utxo_content(content)
     assert res == result
+
+
+def _tokens_pair(policy: str, name: str) -> utxo_objects.TokensPair:
+    """Return a tokens pair with the given security token."""
+    return utxo_objects.TokensPair(
+        pair="FACT-ADA",
+        source="MinswapV2",
+        token_1_policy="MOCK_POLICY",
+        token_1_name="MOCK_NAME",
+        token_1_decimals=6,
+        token_2_policy="",
+        token_2_name="lovelace",
+        token_2_decimals=6,
+        security_token_policy=policy,
+        security_token_name=name,
+    )
+
+
+kupo_tokens_pairs_tests = [
+    # One query per security token, shared tokens are queried once.
+    (
+        [("POLICY_1", "NAME_1"), ("POLICY_2", ""), ("POLICY_1", "NAME_1")],
+        [
+            "KUPO/matches/addr1?unspent&policy_id=POLICY_1&asset_name=NAME_1",
+            "KUPO/matches/addr1?unspent&policy_id=POLICY_2",
+        ],
+        [("TX_1", 0), ("TX_2", 1)],
+    ),
+    # A pair without a security token policy, the address is scanned.
+    (
+        [("POLICY_1", "NAME_1"), ("", "")],
+        ["KUPO/matches/addr1?unspent"],
+        [("TX_1", 0), ("TX_2", 1), ("TX_3", 2)],
+    ),
+    ([], ["KUPO/matches/addr1?unspent"], [("TX_1", 0), ("TX_2", 1), ("TX_3", 2)]),
+]
+
+
+@pytest.mark.parametrize("security_tokens, urls, expected", kupo_tokens_pairs_tests)
+def test_kupo_tokens_pairs_matches(mocker, security_tokens, urls, expected):
+    """Ensure Kupo is queried by security token unless a pair has none,
+    and matches holding several of them are returned once.
+    """
+    responses = {
+        "KUPO/matches/addr1?unspent": '[{"transaction_id": "TX_1", "output_index": 0}, '
+        '{"transaction_id": "TX_2", "output_index": 1}, '
+        '{"transaction_id": "TX_3", "output_index": 2}]',
+        "KUPO/matches/addr1?unspent&policy_id=POLICY_1&asset_name=NAME_1": (
+            '[{"transaction_id": "TX_1", "output_index": 0}]'
+        ),
+        "KUPO/matches/addr1?unspent&policy_id=POLICY_2": (
+            '[{"transaction_id": "TX_2", "output_index": 1}, '
+            '{"transaction_id": "TX_1", "output_index": 0}]'
+        ),
+    }
+    get = mocker.patch(
+        "src.cnt_collector_node.kupo_helper.requests.get",
+        side_effect=lambda url, timeout: mocker.Mock(text=responses[url]),
+    )
+    res = kupo_tokens_pairs_matches(
+        "KUPO",
+        "addr1",
+        [_tokens_pair(policy, name) for policy, name in security_tokens],
+    )
+    assert [call.args[0] for call in get.call_args_list] == urls
+    assert [(match["transaction_id"], match["output_index"]) for match in res] == (
+        expected
+    )
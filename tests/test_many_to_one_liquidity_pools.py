@@ -542,7 +542,7 @@ def test_many_to_one_utxos(utxos, tokens_pair, expected, db_expected):
     assert res == expected
 
     # Check the database results are written as expected.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     db_res = cursor.fetchall()
     try:
         assert db_res == db_expected
@@ -633,7 +633,7 @@ def test_check_one_to_many_check_address_pair(
     )
 
     mocker.patch(
-        "src.cnt_collector_node.kupo_helper.get_kupo_matches",
+        "src.cnt_collector_node.kupo_helper.get_kupo_asset_matches",
         return_value=utxos,
     )
 
@@ -660,7 +660,7 @@ def test_check_one_to_many_check_address_pair(
         return
     assert res == address_res
 
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     db_res = cursor.fetchall()
     try:
         assert db_res == db_expected
@@ -0,0 +1,278 @@
+"""Tests for the asyncio Ogmios client.
+
+The client is tested against a fake Ogmios server running on its own
+event loop in a background thread so that both the asyncio client and
+the sync wrappers can be used against it.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+
+import pytest
+
+from src.cnt_collector_node import ogmios_client, ogmios_helper
+
+RESULTS = {
+    "queryNetwork/tip": {"slot": 170272922, "id": "tip"},
+    "queryLedgerState/epoch": 591,
+    "queryLedgerState/utxo": [{"transaction": {"id": "tx"}, "index": 0}],
+    "acquireLedgerState": {"acquired": "ledgerState"},
+    # Large enough to be sent in fragments.
+    "nextBlock": {"direction": "forward", "block": {"data": "x" * 200000}},
+}
+
+
+async def _fake_ogmios(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Answer Ogmios requests, pinging the client before each response."""
+    request = await reader.readuntil(b"\r\n\r\n")
+    key = [
+        line.split(":", 1)[1].strip()
+        for line in request.decode().split("\r\n")
+        if line.lower().startswith("sec-websocket-key")
+    ][0]
+    accept = base64.b64encode(
+        hashlib.sha1(key.encode() + ogmios_client.WS_GUID).digest()
+    ).decode()
+    writer.write(
+        (
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode()
+    )
+    tasks = set()
+    while True:
+        try:
+            _, opcode, payload = await ogmios_client.read_frame(reader)
+        except ConnectionError:
+            break
+        if opcode == ogmios_client.OPCODE_CLOSE:
+            writer.write(ogmios_client.encode_frame(opcode, payload, mask=False))
+            break
+        if opcode != ogmios_client.OPCODE_TEXT:
+            continue
+        msg = json.loads(payload)
+        if msg["method"] == "close":
+            writer.write(
+                ogmios_client.encode_frame(ogmios_client.OPCODE_CLOSE, b"", mask=False)
+            )
+            break
+        task = asyncio.create_task(_respond(writer, msg))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    writer.close()
+
+
+async def _respond(writer: asyncio.StreamWriter, msg: dict):
+    """Answer a request, after `params.delay` seconds if given, so that
+    responses can arrive out of order.
+    """
+    await asyncio.sleep((msg.get("params") or {}).get("delay", 0))
+    writer.write(
+        ogmios_client.encode_frame(ogmios_client.OPCODE_PING, b"ping", mask=False)
+    )
+    resp = json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": msg["method"],
+            "result": RESULTS.get(msg["method"]),
+            "params": msg.get("params"),
+            "id": msg.get("id"),
+        }
+    ).encode()
+    half = len(resp) // 2
+    first = ogmios_client.encode_frame(
+        ogmios_client.OPCODE_TEXT, resp[:half], mask=False
+    )
+    last = ogmios_client.encode_frame(
+        ogmios_client.OPCODE_CONTINUATION, resp[half:], mask=False
+    )
+    # Clear the fin bit of the first fragment.
+    writer.write(bytes([first[0] & 0x7F]) + first[1:] + last)
+    await writer.drain()
+
+
+@pytest.fixture(name="ogmios_url")
+def fixture_ogmios_url():
+    """Run the fake Ogmios server and return its URL."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(
+        asyncio.start_server(_fake_ogmios, "127.0.0.1", 0), loop
+    ).result()
+    port = server.sockets[0].getsockname()[1]
+    yield f"ws://127.0.0.1:{port}"
+    server.close()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+frame_tests = [0, 1, 125, 126, 65535, 65536]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", frame_tests)
+@pytest.mark.parametrize("mask", [True, False])
+async def test_frames(size: int, mask: bool):
+    """Ensure frames of every length encoding can be read back."""
+    payload = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+    reader = asyncio.StreamReader()
+    reader.feed_data(
+        ogmios_client.encode_frame(ogmios_client.OPCODE_TEXT, payload, mask)
+    )
+    reader.feed_eof()
+    fin, opcode, res = await ogmios_client.read_frame(reader)
+    assert fin
+    assert opcode == ogmios_client.OPCODE_TEXT
+    assert res == payload
+    with pytest.raises(ogmios_client.ConnectionClosed):
+        await ogmios_client.read_frame(reader)
+
+
+@pytest.mark.asyncio
+async def test_ogmios_client(ogmios_url: str):
+    """Ensure the asyncio client's queries are answered."""
+    async with ogmios_client.OgmiosClient(ogmios_url) as client:
+        assert (await client.tip())["result"] == RESULTS["queryNetwork/tip"]
+        assert (await client.epoch())["result"] == 591
+        utxos = await client.utxos_by_address(["addr1"])
+        assert utxos["params"] == {"addresses": ["addr1"]}
+        acquired = await client.acquire_ledger_state({"slot": 1, "id": "a"})
+        assert acquired["params"] == {"point": {"slot": 1, "id": "a"}}
+        assert (await client.next_block())["result"] == RESULTS["nextBlock"]
+        # Pipelined requests are answered in order.
+        for _ in range(3):
+            await client.request_next_block()
+        for _ in range(3):
+            assert (await client.receive())["method"] == "nextBlock"
+
+
+@pytest.mark.asyncio
+async def test_ogmios_client_closed(ogmios_url: str):
+    """Ensure closed connections are raised and can be reconnected."""
+    async with ogmios_client.OgmiosClient(ogmios_url) as client:
+        with pytest.raises(ConnectionResetError):
+            await client.request(ogmios_client.message("close"))
+        with pytest.raises(ConnectionResetError):
+            await client.tip()
+        await client.reconnect()
+        assert (await client.tip())["result"] == RESULTS["queryNetwork/tip"]
+
+
+@pytest.mark.asyncio
+async def test_ogmios_client_multiplexing(ogmios_url: str):
+    """Ensure responses arriving out of order reach the right caller."""
+    async with ogmios_client.OgmiosClient(ogmios_url) as client:
+        slow = await client.submit(ogmios_client.message("slow", {"delay": 0.2}))
+        fast = await client.submit(ogmios_client.message("fast", {"delay": 0}))
+        assert client.in_flight == 2
+        done, _ = await asyncio.wait([slow, fast], return_when=asyncio.FIRST_COMPLETED)
+        assert done == {fast}
+        assert (await fast)["method"] == "fast"
+        assert (await slow)["method"] == "slow"
+        assert client.in_flight == 0
+        res = await asyncio.gather(
+            *[
+                client.request(ogmios_client.message(f"m{i}", {"delay": (5 - i) / 50}))
+                for i in range(5)
+            ]
+        )
+        assert [resp["method"] for resp in res] == [f"m{i}" for i in range(5)]
+        assert client.stats.latency["slow"].count == 1
+        assert client.stats.latency["slow"].mean >= 0.2
+        assert client.stats.latency["slow"].maximum == client.stats.latency["slow"].mean
+        assert client.stats.latency["fast"].mean < client.stats.latency["slow"].mean
+        assert client.stats.requests == 7
+        assert client.stats.max_in_flight == 5
+
+
+@pytest.mark.asyncio
+async def test_ogmios_client_shared(ogmios_url: str):
+    """Ensure a thread can share the connection of the event loop."""
+    async with ogmios_client.OgmiosClient(ogmios_url) as client:
+        shared = ogmios_client.SyncOgmiosClient(
+            client=client, loop=asyncio.get_running_loop()
+        )
+
+        def _thread_queries():
+            return [ogmios_helper.ogmios_epoch(shared)["result"] for _ in range(5)]
+
+        thread_res, tip = await asyncio.gather(
+            asyncio.to_thread(_thread_queries),
+            client.request(ogmios_client.message("queryNetwork/tip", {"delay": 0.1})),
+        )
+        assert thread_res == [591] * 5
+        assert tip["result"] == RESULTS["queryNetwork/tip"]
+        # Calls from the loop itself would deadlock.
+        with pytest.raises(RuntimeError):
+            shared.request(ogmios_client.message("queryNetwork/tip"))
+        # Shared clients are closed by their owner.
+        shared.close()
+        assert (await client.epoch())["result"] == 591
+
+
+def test_ogmios_helper_sync(ogmios_url: str):
+    """Ensure the ogmios_helper functions work on top of the sync
+    wrapper, including after the connection closes.
+    """
+    with ogmios_client.SyncOgmiosClient(ogmios_url) as ogmios_ws:
+        assert ogmios_helper.ogmios_last_block_slot(ogmios_ws) == 170272922
+        assert ogmios_helper.ogmios_epoch(ogmios_ws)["result"] == 591
+        utxos = ogmios_helper.ogmios_addresses_utxos(ogmios_ws, ["addr1"])
+        assert utxos["result"] == RESULTS["queryLedgerState/utxo"]
+        assert ogmios_helper.ogmios_request_next_block(ogmios_ws)
+        assert ogmios_helper.receive_ws_response(ogmios_ws)["method"] == "nextBlock"
+        assert not ogmios_helper.send_ws_request(
+            ogmios_ws, ogmios_client.message("close")
+        )
+        assert not ogmios_helper.ogmios_tip(ogmios_ws)
+        ogmios_ws.reconnect()
+        assert ogmios_helper.ogmios_epoch(ogmios_ws)["result"] == 591
+
+
+def test_handshake_failure():
+    """Ensure servers that don't speak WebSocket are rejected."""
+
+    async def _not_websocket(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def _connect():
+        server = await asyncio.start_server(_not_websocket, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            await ogmios_client.OgmiosClient(f"ws://127.0.0.1:{port}").connect()
+
+    with pytest.raises(ogmios_client.HandshakeError):
+        asyncio.run(_connect())
+
+
+response_id_tests = [
+    ('{"jsonrpc":"2.0","result":{"slot":1,"id":"a"},"id":12}', 12),
+    ('{"jsonrpc": "2.0", "result": 1, "id": 3}\n', 3),
+    # Ids that aren't at the end of the response are found by decoding.
+    ('{"id":12,"jsonrpc":"2.0","result":{"slot":1,"id":5}}', None),
+    ('{"jsonrpc":"2.0","result":{"slot":1,"id":5}}', None),
+]
+
+
+@pytest.mark.parametrize("raw, expected", response_id_tests)
+def test_response_id(raw: str, expected):
+    """Ensure ids are only read from the end of the response."""
+    assert ogmios_client.response_id(raw) == expected
+
+
+@pytest.mark.asyncio
+async def test_ogmios_client_decode(ogmios_url: str):
+    """Ensure responses are decoded with the decoder of their request."""
+    async with ogmios_client.OgmiosClient(ogmios_url) as client:
+        await client.request_next_block(decode=lambda raw: {"size": len(raw)})
+        assert (await client.receive())["size"] > 200000
+        assert (await client.epoch())["result"] == 591
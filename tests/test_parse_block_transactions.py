@@ -17,9 +17,13 @@ from datetime import timezone
 import pytest
 import time_machine
 
-from src.cnt_collector_node import global_helpers as helpers
-from src.cnt_collector_node import utxo_objects
-from src.cnt_collector_node.database_initialization import _create_database
+from src.cnt_collector_node import address_index
+from src.cnt_collector_node import database_abstraction as dba
+from src.cnt_collector_node import helper_functions, utxo_objects
+from src.cnt_collector_node.database_initialization import (
+    _create_database,
+    create_database,
+)
 from src.cnt_collector_node.helper_functions import _parse_block_transactions_single_tx
 
 from . import parse_block_data
@@ -49,7 +53,7 @@ def test_parse_block_transactions_single_tx(
 
     conn = sqlite3.connect(":memory:")
     _create_database(conn)
-    conn.cursor()
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
     mocker.patch(
         "src.cnt_collector_node.ogmios_helper.get_output_content",
         return_value=output_contents,
@@ -57,24 +61,12 @@ def test_parse_block_transactions_single_tx(
     mocker.patch(
         "src.cnt_collector_node.helper_functions.search_db_utxo", return_value=utxo_ids
     )
-    save_output = mocker.patch("src.cnt_collector_node.helper_functions.save_output")
-
-    app_context = helpers.AppContext(
-        db_name="NOT_USED",
-        database=None,
-        ogmios_url="",
-        ogmios_ws=None,
-        kupo_url=None,
-        use_kupo=True,
-        main_event=None,
-        thread_event=None,
-        reconnect_event=None,
-    )
+    save_output = mocker.patch("src.cnt_collector_node.helper_functions._save_output")
 
     _parse_block_transactions_single_tx(
-        app_context=app_context,
+        database=db,
         transaction=tx,
-        watched_addresses=watched,
+        watched_addresses=address_index.WatchedAddresses(watched),
         slot=9999,
         epoch=9999,
         pairs_config_dict=pairs_config,
@@ -102,8 +94,77 @@ def test_parse_block_transactions_single_tx(
     tokens_pair = utxo_objects.tokens_pair_from_dict(tokens_pair_dict)
     save_output.assert_called()
     save_output.assert_called_with(
-        app_context=app_context,
+        database=db,
         initial_chain_context=chain_context,
         tokens_pair=tokens_pair,
         output_contents=output_contents,
     )
+
+
+def _fake_save_output(database, initial_chain_context, tokens_pair, output_contents):
+    """Insert a price record, failing for the first transaction."""
+    dba.insert_price_record(
+        db=database,
+        price_record=dba.price_record_obj(
+            pair=tokens_pair.pair,
+            epoch=initial_chain_context.epoch,
+            block_height=initial_chain_context.block_height,
+            price=1.0,
+            token_1_amount=output_contents["amount"],
+            token_2_amount=1,
+            source=tokens_pair.source,
+        ),
+    )
+    if initial_chain_context.tx_hash == "failing":
+        raise ValueError("cannot save output")
+
+
+@pytest.mark.parametrize("unsafe", [False, True])
+def test_parse_block_transactions_transaction(mocker, tmp_path, unsafe: bool):
+    """Ensure a block is saved in one transaction, with outputs that
+    cannot be saved rolled back on their own unless running unsafe.
+    """
+    (
+        tx,
+        watched,
+        pairs_config,
+        output_contents,
+        *_,
+    ) = parse_block_data.parse_blocks_tx_tests[0]
+    db_name = str(tmp_path / "block.db")
+    create_database(db_name)
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.get_output_content",
+        return_value=output_contents,
+    )
+    mocker.patch(
+        "src.cnt_collector_node.helper_functions._save_output",
+        side_effect=_fake_save_output,
+    )
+    block = {
+        "slot": 9999,
+        "transactions": [dict(tx, id="failing"), dict(tx, id="saved")],
+    }
+    try:
+        with helper_functions.database_transaction(db_name) as database:
+            helper_functions.update_status(db_name, database=database, block=9999)
+            helper_functions.parse_block_transactions(
+                database=database,
+                epoch=9999,
+                block=block,
+                watched_addresses=address_index.WatchedAddresses(watched),
+                pairs_config_dict=pairs_config,
+                unsafe=unsafe,
+            )
+    except ValueError:
+        assert unsafe
+    conn = sqlite3.connect(db_name)
+    cur = conn.cursor()
+    price_records = cur.execute("SELECT count(*) FROM price").fetchone()[0]
+    status = cur.execute("SELECT count(*) FROM status").fetchone()[0]
+    conn.close()
+    if unsafe:
+        # nothing from the block is saved.
+        assert (price_records, status) == (0, 0)
+        return
+    assert (price_records, status) == (1, 1)
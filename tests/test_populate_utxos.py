@@ -17,6 +17,8 @@ yet.
 
 import datetime
 import sqlite3
+import threading
+import time
 from datetime import timezone
 
 import pytest
@@ -26,8 +28,12 @@ from src.cnt_collector_node import global_helpers as helpers
 from src.cnt_collector_node import utxo_objects
 from src.cnt_collector_node.database_initialization import _create_database
 from src.cnt_collector_node.helper_functions import (
+    SweepCheckpoints,
+    SweepPoint,
+    _populate_utxos_fetch,
     _populate_utxos_from_on_chain,
     _populate_utxos_make_context,
+    populate_utxos_sweep_point,
 )
 
 make_context_tests = [
@@ -229,6 +235,308 @@ def test_populate_utxos_from_on_chain(mocker, kupo, tx, contents, expected):
 
     res = _populate_utxos_from_on_chain(
         app_context=app_context,
-        address="",
+        addresses=[""],
     )
-    assert res == expected
+    assert list(res) == [("", expected)]
+
+
+def _app_context(kupo_url: str = None) -> helpers.AppContext:
+    """Return an app context reading from Kupo if a URL is given."""
+    return helpers.AppContext(
+        db_name=None,
+        database=None,
+        ogmios_url="",
+        ogmios_ws="OGMIOS_WS",
+        kupo_url=kupo_url,
+        use_kupo=bool(kupo_url),
+        main_event=None,
+        thread_event=None,
+        reconnect_event=None,
+    )
+
+
+@pytest.mark.parametrize("concurrency", [1, 3, 20])
+def test_populate_utxos_fetch(mocker, concurrency: int):
+    """Ensure the addresses are read concurrently, up to the configured
+    limit, and yielded in order whatever the order they are read in.
+    """
+    mocker.patch(
+        "src.cnt_collector_node.config.POPULATE_UTXOS_CONCURRENCY", concurrency
+    )
+    addresses = [f"addr{idx}" for idx in range(6)]
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def fetch_batch(_, batch, pairs_config_dict, *__):
+        (address,) = batch
+        assert pairs_config_dict[address] == [address]
+        with lock:
+            running.append(address)
+            peak.append(len(running))
+        # the first addresses are the slowest to read.
+        time.sleep(0.01 * (len(addresses) - addresses.index(address)))
+        with lock:
+            running.remove(address)
+        return iter([(address, f"context-{address}", [address])])
+
+    mocker.patch(
+        "src.cnt_collector_node.helper_functions._populate_utxos_fetch_batch",
+        side_effect=fetch_batch,
+    )
+    res = list(
+        _populate_utxos_fetch(
+            app_context=_app_context(kupo_url="KUPO"),
+            watched_addresses=addresses,
+            pairs_config_dict={address: [address] for address in addresses},
+        )
+    )
+    assert res == [(address, f"context-{address}", [address]) for address in addresses]
+    assert max(peak) == min(concurrency, len(addresses))
+
+
+def test_populate_utxos_fetch_error(mocker):
+    """Ensure an error reading an address is raised when the address is
+    reached.
+    """
+
+    def fetch_batch(_, batch, *__):
+        if batch == ["addr1"]:
+            raise helpers.OgmiosError("no tip")
+        return iter([(batch[0], None, [])])
+
+    mocker.patch(
+        "src.cnt_collector_node.helper_functions._populate_utxos_fetch_batch",
+        side_effect=fetch_batch,
+    )
+    res = _populate_utxos_fetch(
+        app_context=_app_context(kupo_url="KUPO"),
+        watched_addresses=["addr0", "addr1"],
+        pairs_config_dict={"addr0": [], "addr1": []},
+    )
+    assert next(res) == ("addr0", None, [])
+    with pytest.raises(helpers.OgmiosError):
+        next(res)
+
+
+def test_populate_utxos_incremental(mocker):
+    """Ensure the sweeps between two full ones only read the UTxOs
+    created since the last one read at each address, once saved.
+    """
+    mocker.patch("src.cnt_collector_node.config.KUPO_FULL_SWEEP_EVERY", 3)
+    mocker.patch("src.cnt_collector_node.config.KUPO_SWEEP_OVERLAP_SLOTS", 10)
+    matches = {"addr1": [100, 250], "addr2": []}
+    get = mocker.patch(
+        "src.cnt_collector_node.kupo_helper.get_kupo_matches",
+        side_effect=lambda _, address, created_after: [
+            {
+                "transaction_id": f"{address}-{slot}",
+                "output_index": 0,
+                "value": {"coins": 1, "assets": {}},
+                "created_at": {"slot_no": slot},
+            }
+            for slot in matches[address]
+            if created_after is None or slot > created_after
+        ],
+    )
+    app_context = helpers.AppContext(
+        db_name=None,
+        database=None,
+        ogmios_url="",
+        ogmios_ws="UNUSED",
+        kupo_url="KUPO",
+        use_kupo=True,
+        main_event=None,
+        thread_event=None,
+        reconnect_event=None,
+    )
+    checkpoints = SweepCheckpoints()
+
+    def sweep(save: bool = True) -> dict:
+        checkpoints.start()
+        read = {
+            address: [utxo["tx_hash"] for utxo in utxos]
+            for address, utxos in _populate_utxos_from_on_chain(
+                app_context=app_context,
+                addresses=list(matches),
+                checkpoints=checkpoints,
+            )
+        }
+        if save:
+            checkpoints.done()
+        return read
+
+    assert sweep(save=False) == {"addr1": ["addr1-100", "addr1-250"], "addr2": []}
+    # the sweep wasn't saved, read the addresses in full again.
+    assert sweep() == {"addr1": ["addr1-100", "addr1-250"], "addr2": []}
+    assert checkpoints.slots == {"addr1": 250}
+    matches["addr1"].append(300)
+    # the overlap reads the last UTxO again.
+    assert sweep() == {"addr1": ["addr1-250", "addr1-300"], "addr2": []}
+    assert checkpoints.incremental
+    assert [call.kwargs["created_after"] for call in get.call_args_list[-2:]] == [
+        240,
+        None,
+    ]
+    assert sweep() == {"addr1": ["addr1-300"], "addr2": []}
+    # full sweep.
+    assert sweep() == {
+        "addr1": ["addr1-100", "addr1-250", "addr1-300"],
+        "addr2": [],
+    }
+    assert not checkpoints.incremental
+    checkpoints.reset()
+    assert sweep()["addr1"] == ["addr1-100", "addr1-250", "addr1-300"]
+
+
+sweep_point_tests = [
+    # Ogmios, the ledger state is acquired and released.
+    (None, {"result": {"acquired": "ledgerState"}}, {"slot": 9999, "id": "abc"}),
+    # Kupo reads its own index.
+    ("KUPO_URL", {"result": {"acquired": "ledgerState"}}, None),
+    # The point can't be acquired, the sweep reads at the tip.
+    (None, {"error": {"code": 2000}}, None),
+]
+
+
+@pytest.mark.parametrize("kupo_url, acquire_result, acquired", sweep_point_tests)
+def test_populate_utxos_sweep_point(mocker, kupo_url, acquire_result, acquired):
+    """Ensure the tip is read once for a sweep, with the ledger state
+    acquired at it on a connection of its own while the addresses are
+    read.
+    """
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_tip",
+        return_value={"result": {"slot": 9999, "id": "abc"}},
+    )
+    epoch = mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_epoch",
+        return_value={"result": 591},
+    )
+    connection = mocker.MagicMock()
+    connect = mocker.patch(
+        "src.cnt_collector_node.ogmios_client.SyncOgmiosClient",
+        return_value=connection,
+    )
+    acquire = mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_acquire_ledger_state",
+        return_value=acquire_result,
+    )
+    release = mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_release_ledger_state",
+        return_value={},
+    )
+    app_context = helpers.AppContext(
+        db_name=None,
+        database=None,
+        ogmios_url="ws://ogmios",
+        ogmios_ws="OGMIOS_WS",
+        kupo_url=kupo_url,
+        use_kupo=bool(kupo_url),
+        main_event=None,
+        thread_event=None,
+        reconnect_event=None,
+    )
+    with populate_utxos_sweep_point(app_context) as sweep_point:
+        assert sweep_point == SweepPoint(
+            block_height=9999,
+            epoch=591,
+            acquired=acquired,
+            ogmios_ws=connection if acquired else None,
+        )
+        assert not release.called
+        # closed once the sweep is done, or right away if not acquired.
+        assert connection.close.called == (acquire.called and not acquired)
+        assert _populate_utxos_make_context(
+            app_context=app_context, address="addr123", sweep_point=sweep_point
+        ) == utxo_objects.InitialChainContext(
+            block_height=9999,
+            epoch=591,
+            address="addr123",
+            tx_hash=None,
+            output_index=None,
+        )
+    # the shared connection isn't acquired, it answers at the tip.
+    assert epoch.call_args.args[0] == "OGMIOS_WS"
+    assert acquire.called == (kupo_url is None)
+    if acquire.called:
+        connect.assert_called_once_with("ws://ogmios")
+        assert acquire.call_args.args[0] is connection
+        connection.close.assert_called_once()
+    assert release.called == bool(acquired)
+
+
+def _ogmios_utxo(address: str, tx_id: str) -> dict:
+    """Return an Ogmios UTxO at an address."""
+    return {
+        "transaction": {"id": tx_id},
+        "index": 0,
+        "address": address,
+        "value": {"ada": {"lovelace": 1}},
+    }
+
+
+@pytest.mark.parametrize(
+    "batch_size, queries",
+    [
+        (1, [["addr0"], ["addr1"], ["addr2"]]),
+        (2, [["addr0", "addr1"], ["addr2"]]),
+        (10, [["addr0", "addr1", "addr2"]]),
+    ],
+)
+def test_populate_utxos_fetch_ogmios(mocker, batch_size: int, queries: list):
+    """Ensure the addresses are read from Ogmios in batches and their
+    UTxOs grouped by address.
+    """
+    mocker.patch(
+        "src.cnt_collector_node.config.OGMIOS_UTXO_QUERY_ADDRESSES", batch_size
+    )
+    utxos = {
+        "addr0": [_ogmios_utxo("addr0", "tx1"), _ogmios_utxo("addr0", "tx2")],
+        "addr1": [],
+        "addr2": [_ogmios_utxo("addr2", "tx3")],
+    }
+    query = mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_addresses_utxos",
+        # the UTxOs of the addresses come interleaved.
+        side_effect=lambda _, addresses: {
+            "result": sorted(
+                (utxo for address in addresses for utxo in utxos[address]),
+                key=lambda utxo: utxo["transaction"]["id"],
+                reverse=True,
+            )
+        },
+    )
+    sweep_point = SweepPoint(block_height=9999, epoch=591)
+    res = list(
+        _populate_utxos_fetch(
+            app_context=_app_context(),
+            watched_addresses=list(utxos),
+            pairs_config_dict={address: [] for address in utxos},
+            sweep_point=sweep_point,
+        )
+    )
+    assert sorted(call.args[1] for call in query.call_args_list) == queries
+    assert [
+        (address, context.address, [utxo["tx_hash"] for utxo in address_utxos])
+        for address, context, address_utxos in res
+    ] == [
+        ("addr0", "addr0", ["tx2", "tx1"]),
+        ("addr1", "addr1", []),
+        ("addr2", "addr2", ["tx3"]),
+    ]
+    assert {context.block_height for _, context, _ in res} == {9999}
+
+
+def test_populate_utxos_from_on_chain_ogmios_error(mocker):
+    """Ensure the addresses of a batch Ogmios cannot read are yielded
+    without UTxOs, for the sweep to report them.
+    """
+    mocker.patch(
+        "src.cnt_collector_node.ogmios_helper.ogmios_addresses_utxos",
+        return_value={"error": {"code": -32602}},
+    )
+    res = _populate_utxos_from_on_chain(
+        app_context=_app_context(), addresses=["addr0", "addr1"]
+    )
+    assert list(res) == [("addr0", None), ("addr1", None)]
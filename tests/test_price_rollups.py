@@ -0,0 +1,199 @@
+"""Tests for the price history rollups and retention."""
+
+import sqlite3
+import threading
+
+import pytest
+
+from src.cnt_collector_node import database_abstraction as dba
+from src.cnt_collector_node import database_derived as derived
+from src.cnt_collector_node import database_initialization, price_rollups
+from src.cnt_collector_node.database_initialization import _create_database
+from src.cnt_collector_node.database_writer import DatabaseWriter
+
+MINUTE = 60 * 1000
+# 2024-01-01T00:00:00Z
+START = 1704067200000
+
+# Slot at START, see the reference_slot fixture.
+START_SLOT = 99
+
+# pair, source, slot, time saved at, price, token1 amount. The slots
+# are the seconds after START_SLOT the records' blocks were made at.
+PRICES = [
+    ("FACT-ADA", "MinswapV2", 100, START + 1000, 2.0, 10),
+    ("FACT-ADA", "MinswapV2", 119, START + 20000, 3.0, 11),
+    ("FACT-ADA", "SundaeSwap", 129, START + 30000, 7.0, 50),
+    ("FACT-ADA", "MinswapV2", 139, START + 40000, 1.0, 12),
+    ("FACT-ADA", "MinswapV2", 158, START + 59999, 1.5, 13),
+    ("FACT-ADA", "MinswapV2", 159, START + MINUTE, 4.0, 14),
+    ("FACT-ADA", "MinswapV2", 3759, START + 61 * MINUTE, 5.0, 15),
+]
+
+
+@pytest.fixture(name="reference_slot", autouse=True)
+def fixture_reference_slot(mocker) -> None:
+    """Map START_SLOT to START."""
+    mocker.patch("src.cnt_collector_node.config.SLOT_TIME_REFERENCE_SLOT", START_SLOT)
+    mocker.patch(
+        "src.cnt_collector_node.config.SLOT_TIME_REFERENCE_SECONDS", START // 1000
+    )
+
+
+def _database(status: int, conn: sqlite3.Connection = None) -> dba.DBObject:
+    """Return a database, in memory unless a connection is given, with
+    the test prices and the given status.
+    """
+    if not conn:
+        conn = sqlite3.connect(":memory:")
+        _create_database(conn)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    for pair, source, slot, date_time, price, amount in PRICES:
+        price_id = dba.insert_price_record(
+            db=db,
+            price_record=dba.price_record_obj(
+                pair=pair,
+                epoch=500,
+                block_height=slot,
+                price=price,
+                token_1_amount=amount,
+                token_2_amount=amount * 2,
+                source=source,
+            ),
+        )
+        db.cursor.execute(
+            "UPDATE price SET date_time = ? WHERE id = ?", (date_time, price_id)
+        )
+    dba.insert_status(db=db, block=status)
+    conn.commit()
+    return db
+
+
+def _write(db: dba.DBObject):
+    """Return a write function applying operations to db and
+    committing them.
+    """
+
+    def write(function, *args):
+        result = function(db, *args)
+        db.connection.commit()
+        return result
+
+    return write
+
+
+def _rollups(db: dba.DBObject) -> list[tuple]:
+    """Return the rollups with the names of their pairs and sources."""
+    return db.cursor.execute(
+        "SELECT bucket_seconds, pairs.name, sources.name, bucket_start, "
+        "open, high, low, close, token1_amount, token2_amount, updates "
+        "FROM price_rollups "
+        "JOIN pairs ON pairs.id = price_rollups.pair_id "
+        "JOIN sources ON sources.id = price_rollups.source_id "
+        "ORDER BY bucket_seconds, pairs.name, sources.name, bucket_start"
+    ).fetchall()
+
+
+ALL_ROLLED_UP = [
+    (60, "FACT-ADA", "MinswapV2", START, 2.0, 3.0, 1.0, 1.5, 13, 26, 4),
+    (60, "FACT-ADA", "MinswapV2", START + MINUTE, 4.0, 4.0, 4.0, 4.0, 14, 28, 1),
+    (60, "FACT-ADA", "MinswapV2", START + 61 * MINUTE, 5.0, 5.0, 5.0, 5.0, 15, 30, 1),
+    (60, "FACT-ADA", "SundaeSwap", START, 7.0, 7.0, 7.0, 7.0, 50, 100, 1),
+    (3600, "FACT-ADA", "MinswapV2", START, 2.0, 4.0, 1.0, 4.0, 14, 28, 5),
+    (3600, "FACT-ADA", "MinswapV2", START + 60 * MINUTE, 5.0, 5.0, 5.0, 5.0, 15, 30, 1),
+    (3600, "FACT-ADA", "SundaeSwap", START, 7.0, 7.0, 7.0, 7.0, 50, 100, 1),
+]
+
+
+@pytest.mark.parametrize("batch", [1, 2, 3, 100])
+def test_run_rollups(mocker, batch: int):
+    """Ensure the buckets are the same whatever the batch size."""
+    mocker.patch("src.cnt_collector_node.config.PRICE_ROLLUP_BATCH", batch)
+    mocker.patch("src.cnt_collector_node.config.JOURNAL_RETENTION_SLOTS", 100)
+    db = _database(status=4000)
+    assert price_rollups.run_rollups(_write(db)) == (len(PRICES), 0)
+    assert _rollups(db) == ALL_ROLLED_UP
+    assert derived.get_rollup_status(db) == len(PRICES)
+    # Nothing left to roll up.
+    assert price_rollups.run_rollups(_write(db)) == (0, 0)
+    assert _rollups(db) == ALL_ROLLED_UP
+
+
+def test_run_rollups_final(mocker):
+    """Ensure records that can still be rolled back aren't rolled up,
+    until the chain moves on.
+    """
+    mocker.patch("src.cnt_collector_node.config.PRICE_ROLLUP_BATCH", 100)
+    mocker.patch("src.cnt_collector_node.config.JOURNAL_RETENTION_SLOTS", 100)
+    db = _database(status=258)
+    assert price_rollups.run_rollups(_write(db)) == (5, 0)
+    assert derived.get_rollup_status(db) == 5
+    dba.update_status(db=db, block=4000)
+    assert price_rollups.run_rollups(_write(db)) == (2, 0)
+    assert _rollups(db) == ALL_ROLLED_UP
+
+
+def test_run_rollups_retention(mocker):
+    """Ensure only the rolled up records older than the retention
+    window are deleted.
+    """
+    mocker.patch("src.cnt_collector_node.config.PRICE_ROLLUP_BATCH", 2)
+    mocker.patch("src.cnt_collector_node.config.JOURNAL_RETENTION_SLOTS", 100)
+    mocker.patch("src.cnt_collector_node.config.PRICE_RETENTION_DAYS", 1)
+    mocker.patch(
+        "src.cnt_collector_node.price_rollups.time.time_ns",
+        return_value=(START + price_rollups.MS_PER_DAY + MINUTE) * 1_000_000,
+    )
+    db = _database(status=258)
+    # The records of the first minute are deleted, the last one is
+    # recent and the one after it isn't rolled up yet.
+    assert price_rollups.run_rollups(_write(db)) == (5, 5)
+    assert [row[0] for row in db.cursor.execute("SELECT id FROM price")] == [6, 7]
+    dba.update_status(db=db, block=4000)
+    assert price_rollups.run_rollups(_write(db)) == (2, 0)
+    assert _rollups(db) == ALL_ROLLED_UP
+
+
+def test_run_rollups_catching_up(mocker):
+    """Ensure the records saved at once while catching up are bucketed
+    by the time of their blocks.
+    """
+    mocker.patch("src.cnt_collector_node.config.JOURNAL_RETENTION_SLOTS", 100)
+    db = _database(status=4000)
+    db.cursor.execute("UPDATE price SET date_time = ?", (START + 3 * 60 * MINUTE,))
+    assert price_rollups.run_rollups(_write(db)) == (len(PRICES), 0)
+    assert _rollups(db) == ALL_ROLLED_UP
+
+
+def test_run_rollups_no_status():
+    """Ensure nothing is rolled up before the indexer saved a status."""
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    assert price_rollups.run_rollups(_write(db)) == (0, 0)
+    assert derived.get_rollup_status(db) == 0
+
+
+def test_rollup_prices(mocker, tmp_path):
+    """Ensure the rollups are written through the database writer."""
+    mocker.patch("src.cnt_collector_node.config.JOURNAL_RETENTION_SLOTS", 100)
+    db_name = str(tmp_path / "test.db")
+    database_initialization.create_database(db_name)
+    db = _database(status=4000, conn=database_initialization.connect(db_name))
+    thread_event = threading.Event()
+    # Stop after the first run.
+    mocker.patch(
+        "src.cnt_collector_node.price_rollups.database_initialization."
+        "checkpoint_history",
+        side_effect=lambda conn: thread_event.set(),
+    )
+    writer = DatabaseWriter(db_name).start()
+    write = mocker.spy(writer, "write")
+    price_rollups.rollup_prices(db_name, writer, thread_event)
+    writer.stop()
+    assert [call.args[0] for call in write.call_args_list] == [
+        price_rollups.rollup_batch,
+        price_rollups.prune_batch,
+    ]
+    assert _rollups(db) == ALL_ROLLED_UP
+    db.connection.close()
@@ -0,0 +1,147 @@
+"""Check the query plans of the database_abstraction and database_derived
+statements.
+
+Each function is run against a new database with a cursor recording
+the statements it executes. The plan of each statement must use an
+index: no table scans and no temporary B-trees for sorting or grouping.
+"""
+
+import re
+import sqlite3
+from typing import Callable
+
+import pytest
+
+from src.cnt_collector_node import database_abstraction as dba
+from src.cnt_collector_node import database_derived as derived
+from src.cnt_collector_node import database_initialization
+
+# Tables that stay small whatever the size of the chain: status and
+# rollup_status have one row, checkpoints are pruned to
+# CHAIN_SYNC_CHECKPOINTS rows and latest_pool_state has a row per pair
+# and source.
+BOUNDED_TABLES = {"status", "rollup_status", "checkpoints", "latest_pool_state"}
+
+SCAN_RE = re.compile(r"^SCAN (\w+)")
+
+
+class _RecordingCursor:
+    """Cursor recording the statements executed through it."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+        self.statements = []
+
+    def execute(self, sql: str, params=()):
+        """Record and execute a statement."""
+        self.statements.append((sql, params))
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params):
+        """Record, with its first parameters, and execute a statement
+        run with executemany.
+        """
+        seq_of_params = list(seq_of_params)
+        self.statements.append((sql, seq_of_params[0] if seq_of_params else ()))
+        return self.cursor.executemany(sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+POLICY_QUERY = dba.utxo_source_policy_query_obj(
+    pair="FACT-ADA",
+    source="MinswapV2",
+    address="addr1",
+    security_token_policy="policy",
+    security_token_name="name",
+)
+
+PARTIAL_UTXO = dba.partial_utxo_obj(
+    block_height=1,
+    price=1.0,
+    token_1_amount=1,
+    token_2_amount=1,
+    tx_hash="tx",
+    tx_index=0,
+)
+
+statements = [
+    ("get_status", dba.get_status),
+    ("update_status", lambda db: dba.update_status(db, 1)),
+    ("select_checkpoints", lambda db: dba.select_checkpoints(db, 20)),
+    ("prune_checkpoints", lambda db: dba.prune_checkpoints(db, 20)),
+    ("delete_checkpoints_after", lambda db: dba.delete_checkpoints_after(db, 1)),
+    (
+        "select_utxo_id",
+        lambda db: dba.select_utxo_id(
+            db.cursor, dba.utxo_id_query_obj("tx", 0, "policy", "name")
+        ),
+    ),
+    (
+        "select_utxo_record_by_pair_source_and_policy",
+        lambda db: dba.select_utxo_record_by_pair_source_and_policy(db, POLICY_QUERY),
+    ),
+    (
+        "select_utxo_record_by_source_address_and_policy",
+        lambda db: dba.select_utxo_record_by_source_address_and_policy(
+            db, POLICY_QUERY
+        ),
+    ),
+    ("select_latest_pool_states", derived.select_latest_pool_states),
+    (
+        "select_utxo_by_outref",
+        lambda db: dba.select_utxo_by_outref(db, "tx", 0),
+    ),
+    ("select_utxo_by_id", lambda db: dba.select_utxo_by_id(db, 1)),
+    ("select_utxo_partial_by_id", lambda db: dba.select_utxo_partial_by_id(db, 1)),
+    ("update_utxo_partial", lambda db: dba.update_utxo_partial(db, PARTIAL_UTXO, 1)),
+    (
+        "update_utxos_partial",
+        lambda db: dba.update_utxos_partial(db, [(PARTIAL_UTXO, 1), (PARTIAL_UTXO, 2)]),
+    ),
+    (
+        "select_utxo_count_by_tx_info",
+        lambda db: dba.select_utxo_count_by_tx_info(db, "tx", 0),
+    ),
+    (
+        "select_journal_entries_after",
+        lambda db: derived.select_journal_entries_after(db, 1),
+    ),
+    (
+        "delete_journal_entries_after",
+        lambda db: derived.delete_journal_entries_after(db, 1),
+    ),
+    ("prune_journal", lambda db: derived.prune_journal(db, 1)),
+    ("delete_price_record", lambda db: dba.delete_price_record(db, 1)),
+    (
+        "select_price_records_after",
+        lambda db: derived.select_price_records_after(db, 1, 100),
+    ),
+    ("prune_price_records", lambda db: derived.prune_price_records(db, 100, 1, 100)),
+    ("get_rollup_status", derived.get_rollup_status),
+    ("update_rollup_status", lambda db: derived.update_rollup_status(db, 1)),
+]
+
+
+@pytest.mark.parametrize("history", [False, True])
+@pytest.mark.parametrize("name, function", statements)
+def test_query_plans(tmp_path, name: str, function: Callable, history: bool):
+    """Ensure the statements don't scan tables or sort in temporary
+    B-trees, with the price history in the main or the history
+    database.
+    """
+    conn = sqlite3.connect(":memory:")
+    if history:
+        database_initialization.attach_history(conn, str(tmp_path / "history.db"))
+    database_initialization._create_database(conn)  # pylint: disable=W0212
+    cursor = _RecordingCursor(conn.cursor())
+    function(dba.DBObject(connection=conn, cursor=cursor))
+    assert cursor.statements, name
+    for sql, params in cursor.statements:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        for detail in plan:
+            assert "TEMP B-TREE" not in detail, (name, sql, plan)
+            scan = SCAN_RE.match(detail)
+            assert not scan or scan.group(1) in BOUNDED_TABLES, (name, sql, plan)
+    conn.close()
@@ -0,0 +1,136 @@
+"""Tests for reverting rolled back blocks using the undo journal."""
+
+import sqlite3
+
+import pytest
+
+import src.cnt_collector_node.database_abstraction as dba
+from src.cnt_collector_node import utxo_objects
+from src.cnt_collector_node.database_initialization import _create_database
+from src.cnt_collector_node.helper_functions import _save_output, rollback_to_point
+
+tokens_pair = utxo_objects.TokensPair(
+    pair="FACT-ADA",
+    source="SuperMockDex",
+    token_1_policy="policy1",
+    token_1_name="name1",
+    token_1_decimals=6,
+    token_2_policy="",
+    token_2_name="lovelace",
+    token_2_decimals=6,
+    security_token_policy="security_policy",
+    security_token_name="security_name",
+)
+
+
+def _database() -> dba.DBObject:
+    """Return a database with one UTxO record saved at slot 100."""
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    dba.insert_utxo_complete(
+        db,
+        dba.complete_utxo_obj(
+            pair=tokens_pair.pair,
+            source=tokens_pair.source,
+            price=2.0,
+            block_height=100,
+            address="addr1",
+            token_1_policy=tokens_pair.token_1_policy,
+            token_1_name=tokens_pair.token_1_name,
+            token_1_decimals=tokens_pair.token_1_decimals,
+            token_2_policy=tokens_pair.token_2_policy,
+            token_2_name=tokens_pair.token_2_name,
+            token_2_decimals=tokens_pair.token_2_decimals,
+            security_token_policy=tokens_pair.security_token_policy,
+            security_token_name=tokens_pair.security_token_name,
+            token_1_amount=100000000,
+            token_2_amount=200000000,
+            tx_hash="tx100",
+            tx_index=0,
+        ),
+    )
+    dba.insert_status(db, 100)
+    return db
+
+
+def _save_block_output(db: dba.DBObject, slot: int, tx_hash: str, utxo_id: int):
+    """Save a block output spending the given UTxO."""
+    _save_output(
+        database=db,
+        initial_chain_context=utxo_objects.InitialChainContext(
+            block_height=slot,
+            epoch=500,
+            address="addr1",
+            tx_hash=tx_hash,
+            output_index=0,
+            utxo_ids=[utxo_id],
+        ),
+        tokens_pair=tokens_pair,
+        output_contents={
+            "amount": slot * 1000000,
+            "assets": {
+                "policy1": {"name1": 100000000},
+                "security_policy": {"security_name": 1},
+            },
+        },
+    )
+
+
+def _utxo(db: dba.DBObject) -> tuple:
+    """Return the values of the UTxO record that change on update."""
+    db.cursor.execute(
+        "SELECT block_height, price, token1_amount, token2_amount, "
+        "tx_hash, output_index FROM utxos WHERE id = 1"
+    )
+    return db.cursor.fetchone()
+
+
+def _count(db: dba.DBObject, table: str) -> int:
+    """Return the number of rows in a table."""
+    db.cursor.execute(f"SELECT count(*) FROM {table}")
+    return db.cursor.fetchone()[0]
+
+
+rollback_tests = [
+    # Roll back both blocks.
+    ({"slot": 150, "id": "point"}, (100, 2.0, 100000000, 200000000, "tx100", 0), 0),
+    # Roll back the last block only.
+    ({"slot": 250, "id": "point"}, (200, 2.0, 100000000, 200000000, "tx200", 0), 1),
+    # Roll back to origin.
+    ("origin", (100, 2.0, 100000000, 200000000, "tx100", 0), 0),
+    # Nothing to roll back.
+    ({"slot": 300, "id": "point"}, (300, 3.0, 100000000, 300000000, "tx300", 0), 2),
+]
+
+
+@pytest.mark.parametrize("point, expected_utxo, expected_prices", rollback_tests)
+def test_rollback_to_point(point, expected_utxo: tuple, expected_prices: int):
+    """Ensure rolled back blocks are reverted using the journal."""
+    db = _database()
+    _save_block_output(db, 200, "tx200", 1)
+    _save_block_output(db, 300, "tx300", 1)
+    assert _utxo(db) == (300, 3.0, 100000000, 300000000, "tx300", 0)
+    assert _count(db, "price") == 2
+    assert _count(db, "journal") == 4
+    rollback_to_point(db, point)
+    assert _utxo(db) == expected_utxo
+    assert _count(db, "price") == expected_prices
+    assert _count(db, "journal") == expected_prices * 2
+    slot = point["slot"] if isinstance(point, dict) else 0
+    assert dba.get_status(db) == min(300, slot)
+
+
+def test_rollback_keeps_newer_writes():
+    """Ensure UTxO records written by populate_utxos before the
+    rollback point aren't reverted.
+    """
+    db = _database()
+    _save_block_output(db, 200, "tx200", 1)
+    # Populate UTxOs writes the record again at slot 140.
+    dba.update_utxo_partial(
+        db, dba.partial_utxo_obj(140, 1.5, 1, 2, "tx140", 1), row_id=1
+    )
+    rollback_to_point(db, {"slot": 150, "id": "point"})
+    assert _utxo(db) == (140, 1.5, 1, 2, "tx140", 1)
+    assert _count(db, "price") == 0
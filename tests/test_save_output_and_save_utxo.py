@@ -166,7 +166,7 @@ def test_save_output(
         output_contents=output_contents,
     )
     assert ret is None  # Function returns None by default.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     res = cursor.fetchall()
     # Make sure nothing was written to the database.
     assert not res
@@ -182,7 +182,7 @@ def test_save_output(
         output_contents=output_contents,
     )
     assert ret is None  # Function returns None by default.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     res = cursor.fetchall()
     assert res == expected
     # The other dicts are prone to change. Ensure they remain
@@ -341,7 +341,7 @@ def test_save_output_dont_write(
         output_contents=output_contents,
     )
     assert ret is None  # Function returns None by default.
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     res = cursor.fetchall()
     assert res == expected
     assert output_contents_copy == output_contents
@@ -59,6 +59,68 @@ ins_mock_1 = (
 
 rollback_mocks = [(context_mock_1, record_mock_1, ins_mock_1)]
 
+UTXO_COLUMNS = (
+    "tx_hash",
+    "output_index",
+    "pair",
+    "source",
+    "price",
+    "block_height",
+    "address",
+    "token1_policy",
+    "token1_name",
+    "token1_decimals",
+    "token2_policy",
+    "token2_name",
+    "token2_decimals",
+    "security_token_policy",
+    "security_token_name",
+    "token1_amount",
+    "token2_amount",
+    "date_time",
+)
+
+
+def insert_utxo_row(db: dba.DBObject, row: dict):
+    """Insert a UTxO row given with the names of its pair, source and
+    tokens, and its id if given.
+    """
+    dba.insert_pair(db, row["pair"])
+    dba.insert_source(db, row["source"])
+    dba.insert_token(
+        db, row["token1_policy"], row["token1_name"], row["token1_decimals"]
+    )
+    dba.insert_token(
+        db, row["token2_policy"], row["token2_name"], row["token2_decimals"]
+    )
+    dba.insert_token(db, row["security_token_policy"], row["security_token_name"])
+    db.cursor.execute(
+        "INSERT INTO utxos(id, tx_hash, output_index, pair_id, source_id, price, "
+        "block_height, address, token1_id, token2_id, security_token_id, "
+        "token1_amount, token2_amount, date_time) "
+        f"VALUES (?, ?, ?, {dba.PAIR_ID}, {dba.SOURCE_ID}, ?, ?, ?, "
+        f"{dba.TOKEN_ID}, {dba.TOKEN_ID}, {dba.TOKEN_ID}, ?, ?, ?)",
+        (
+            row.get("id"),
+            dba.tx_hash_to_db(row["tx_hash"]),
+            row["output_index"],
+            row["pair"],
+            row["source"],
+            row["price"],
+            row["block_height"],
+            row["address"],
+            row["token1_policy"],
+            row["token1_name"],
+            row["token2_policy"],
+            row["token2_name"],
+            row["security_token_policy"],
+            row["security_token_name"],
+            row["token1_amount"],
+            row["token2_amount"],
+            row.get("date_time"),
+        ),
+    )
+
 
 @pytest.mark.parametrize("context, record, ins_mock", rollback_mocks)
 def test_rollback_mock(
@@ -83,16 +145,7 @@ def test_rollback_mock(
         connection=conn,
         cursor=cursor,
     )
-    cursor.execute(
-        "INSERT INTO utxos(tx_hash, output_index, "
-        "pair, source, price, block_height, address, "
-        "token1_policy, token1_name, token1_decimals, "
-        "token2_policy, token2_name, token2_decimals, "
-        "security_token_policy, security_token_name, "
-        "token1_amount, token2_amount, date_time) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        ins_mock,
-    )
+    insert_utxo_row(db, dict(zip(UTXO_COLUMNS, ins_mock)))
     context_copy = copy.deepcopy(context)
     record_copy = copy.deepcopy(record)
     updated = save_utxo_record(
@@ -389,20 +442,33 @@ def test_save_utxo_record_1(
         cursor=cursor,
     )
     utxo_id = context.utxo_ids[0]
-    ins_mock = row + ("", "", "", "", "", "", "", "", "", "")
-    cursor.execute(
-        "INSERT INTO utxos(id, block_height, token1_amount, "
-        "token1_decimals, token2_amount, token2_decimals, tx_hash, "
-        "output_index, pair, source, price, address, token1_policy, "
-        "token1_name, token2_policy, token2_name, security_token_policy, "
-        "security_token_name)"
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        ins_mock,
+    insert_utxo_row(
+        db,
+        dict(
+            record,
+            **dict(
+                zip(
+                    (
+                        "id",
+                        "block_height",
+                        "token1_amount",
+                        "token1_decimals",
+                        "token2_amount",
+                        "token2_decimals",
+                        "tx_hash",
+                        "output_index",
+                    ),
+                    row,
+                )
+            ),
+            price="",
+            address="",
+        ),
     )
     save_output_select = f"""
         SELECT id, block_height, token1_amount, token1_decimals,
         token2_amount, token2_decimals, tx_hash, output_index
-        FROM utxos WHERE id = {utxo_id}
+        FROM utxo_records WHERE id = {utxo_id}
         """.strip().replace(
         "  ", " "
     )
@@ -616,7 +682,7 @@ def test_update_utxo_record(
     save_utxo_select = """
         SELECT id, block_height, token1_amount, token1_decimals,
         token2_amount, token2_decimals, tx_hash, output_index
-        FROM utxos WHERE pair = ? AND source = ?
+        FROM utxo_records WHERE pair = ? AND source = ?
         AND address = ? AND security_token_policy = ? AND security_token_name = ?
     """.strip().replace(
         "  ", " "
@@ -2,6 +2,7 @@
 
 # pylint: disable=E0401
 
+import copy
 import datetime
 import sqlite3
 from datetime import timezone
@@ -11,6 +12,7 @@ import pytest
 import time_machine
 
 import src.cnt_collector_node.database_abstraction as dba
+from src.cnt_collector_node import helper_functions
 from src.cnt_collector_node.database_initialization import _create_database
 from src.cnt_collector_node.helper_functions import _save_utxos_dict
 
@@ -505,7 +507,7 @@ save_utxos_tests = [
 
 @time_machine.travel(datetime.datetime(2018, 2, 19, 12, 55, 00, tzinfo=timezone.utc))
 @pytest.mark.parametrize("values, expected", save_utxos_tests)
-def test_save_utxos_dict(mocker, values: dict, expected: list):
+def test_save_utxos_dict(values: dict, expected: list):
     """Make sure save UTxOs performs consistently.
 
     Res provides a sample check to ensure some of the values are written
@@ -518,25 +520,8 @@ def test_save_utxos_dict(mocker, values: dict, expected: list):
         connection=conn,
         cursor=cursor,
     )
-    # Mock save_utxo record. We manage to test most of its routing in
-    # other unit tests.
-    #
-    # First mock ensures we don't write data when the expected
-    # conditions are not met -- return_value == False.
-    mocker.patch(
-        "src.cnt_collector_node.helper_functions.save_utxo_record", return_value=False
-    )
     _save_utxos_dict(db, values)
-    cursor.execute("select * from price;")
-    res = cursor.fetchall()
-    assert not res
-    # Make sure we write when the expected conditions are met
-    # -- return_value == True.
-    mocker.patch(
-        "src.cnt_collector_node.helper_functions.save_utxo_record", return_value=True
-    )
-    _save_utxos_dict(db, values)
-    cursor.execute("select * from price;")
+    cursor.execute("select * from price_records;")
     res = cursor.fetchall()
     assert len(res) > 0
     no_columns = 9
@@ -544,6 +529,63 @@ def test_save_utxos_dict(mocker, values: dict, expected: list):
         # Ensure we insert: pair, epoch, block_height, price,
         # token1_amount, token2_amount, source, date_time + IDX.
         assert len(row) == no_columns
-    cursor.execute("select pair, block_height, price, source, date_time from price;")
+    cursor.execute(
+        "select pair, block_height, price, source, date_time from price_records;"
+    )
     res = cursor.fetchall()
     assert res == expected
+    # A UTxO per pair and source, and the status is the latest block.
+    cursor.execute("select count(*) from utxos;")
+    assert cursor.fetchone()[0] == len(expected)
+    assert dba.get_status(db) == max(row[1] for row in expected)
+    # Make sure we don't write again when nothing changed.
+    _save_utxos_dict(db, values)
+    cursor.execute("select count(*) from price_records;")
+    assert cursor.fetchone()[0] == len(expected)
+
+
+def test_save_utxos_dict_update(mocker):
+    """Ensure the UTxOs that changed since the previous sweep are
+    updated in a batch, with a single status update.
+    """
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    _save_utxos_dict(db, copi_ada_utxos)
+    values = copy.deepcopy(copi_ada_utxos)
+    changed = next(iter(values["COPI-ADA"].values()))["context"]
+    changed["block_height"] += 100
+    changed["tx_hash"] = "00" * 32
+    update_status = mocker.spy(helper_functions, "update_status")
+    update_utxos = mocker.spy(dba, "update_utxos_partial")
+    _save_utxos_dict(db, values)
+    update_status.assert_called_once()
+    assert update_status.call_args.kwargs["block"] == changed["block_height"]
+    assert len(update_utxos.call_args.kwargs["updates"]) == 1
+    assert db.cursor.execute("select count(*) from price").fetchone()[0] == (
+        len(copi_res) + 1
+    )
+
+
+@pytest.mark.parametrize("scale, updated", [(0.5, False), (2, True)])
+def test_save_utxos_dict_incremental(scale: float, updated: bool):
+    """Ensure a pool read by an incremental sweep replaces the stored
+    one only if bigger.
+    """
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    db = dba.DBObject(connection=conn, cursor=conn.cursor())
+    _save_utxos_dict(db, copi_ada_utxos)
+    values = copy.deepcopy(copi_ada_utxos)
+    changed = next(iter(values["COPI-ADA"].values()))["context"]
+    changed["block_height"] += 100
+    changed["tx_hash"] = "00" * 32
+    changed["token1_amount"] = int(changed["token1_amount"] * scale)
+    changed["token2_amount"] = int(changed["token2_amount"] * scale)
+    _save_utxos_dict(db, values, incremental=True)
+    assert db.cursor.execute(
+        "select count(*) from utxos where tx_hash = ?", (bytes(32),)
+    ).fetchone()[0] == int(updated)
+    assert db.cursor.execute("select count(*) from price").fetchone()[0] == (
+        len(copi_res) + int(updated)
+    )
@@ -10,6 +10,7 @@ from datetime import timezone
 import pytest
 import time_machine
 
+from src.cnt_collector_node import database_abstraction as dba
 from src.cnt_collector_node.database_initialization import _create_database
 from src.cnt_collector_node.global_helpers import get_utc_timestamp_now
 from src.cnt_collector_node.helper_functions import _search_db_utxo
@@ -89,13 +90,22 @@ def get_utxo_obj(
 
 def update_utxos(cursor: sqlite3.Cursor, utxo_data: UTxO):
     """Provide a way to write UTxO information to the database."""
+    db = dba.DBObject(connection=cursor.connection, cursor=cursor)
+    dba.insert_pair(db, utxo_data.pair)
+    dba.insert_source(db, utxo_data.source)
+    dba.insert_token(
+        db, utxo_data.token1_policy, utxo_data.token1_name, utxo_data.token1_decimals
+    )
+    dba.insert_token(
+        db, utxo_data.token2_policy, utxo_data.token2_name, utxo_data.token2_decimals
+    )
+    dba.insert_token(db, utxo_data.security_token_policy, utxo_data.security_token_name)
     cursor.execute(
-        "INSERT INTO utxos(id, pair, source, price, block_height, address, "
-        "token1_policy, token1_name, token1_decimals, "
-        "token2_policy, token2_name, token2_decimals, "
-        "security_token_policy, security_token_name, "
+        "INSERT INTO utxos(id, pair_id, source_id, price, block_height, address, "
+        "token1_id, token2_id, security_token_id, "
         "token1_amount, token2_amount, tx_hash, output_index, date_time) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        f"VALUES (?, {dba.PAIR_ID}, {dba.SOURCE_ID}, ?, ?, ?, "
+        f"{dba.TOKEN_ID}, {dba.TOKEN_ID}, {dba.TOKEN_ID}, ?, ?, ?, ?, ?)",
         (
             utxo_data.id,
             utxo_data.pair,
@@ -105,15 +115,13 @@ def update_utxos(cursor: sqlite3.Cursor, utxo_data: UTxO):
             utxo_data.address,
             utxo_data.token1_policy,
             utxo_data.token1_name,
-            utxo_data.token1_decimals,
             utxo_data.token2_policy,
             utxo_data.token2_name,
-            utxo_data.token2_decimals,
             utxo_data.security_token_policy,
             utxo_data.security_token_name,
             utxo_data.token1_amount,
             utxo_data.token2_amount,
-            utxo_data.tx_hash,
+            dba.tx_hash_to_db(utxo_data.tx_hash),
             utxo_data.output_index,
             utxo_data.date_time,
         ),
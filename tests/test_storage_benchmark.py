@@ -0,0 +1,119 @@
+"""Test the storage backends of the benchmark against the same
+expectations.
+"""
+
+import sqlite3
+
+import pytest
+
+from src.cnt_collector_node import database_abstraction as dba
+from src.cnt_collector_node import storage_benchmark
+from src.cnt_collector_node.database_initialization import _create_database
+
+
+def _sqlite_storage() -> storage_benchmark.SQLiteStorage:
+    """Return a SQLite backend on a new in-memory database."""
+    conn = sqlite3.connect(":memory:")
+    _create_database(conn)
+    return storage_benchmark.SQLiteStorage(
+        dba.DBObject(connection=conn, cursor=conn.cursor())
+    )
+
+
+backends = [
+    pytest.param(_sqlite_storage, id="sqlite"),
+    pytest.param(storage_benchmark.MemoryStorage, id="memory"),
+]
+
+
+def _utxo(address: str, block_height: int, tx_index: int) -> dba.CompleteUTxO:
+    """Return a UTxO of the FACT-ADA pair on MinswapV2."""
+    return dba.complete_utxo_obj(
+        pair="FACT-ADA",
+        source="MinswapV2",
+        price=0.5,
+        block_height=block_height,
+        address=address,
+        token_1_policy="policy1",
+        token_1_name="FACT",
+        token_1_decimals=6,
+        token_2_policy="",
+        token_2_name="lovelace",
+        token_2_decimals=6,
+        security_token_policy="policyABC",
+        security_token_name="nameABC",
+        token_1_amount=block_height * 10,
+        token_2_amount=block_height * 20,
+        tx_hash=f"{block_height:064x}",
+        tx_index=tx_index,
+    )
+
+
+QUERY = dba.utxo_source_policy_query_obj(
+    pair="FACT-ADA",
+    source="MinswapV2",
+    address=None,
+    security_token_policy="policyABC",
+    security_token_name="nameABC",
+)
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_storage_status(backend):
+    """Ensure the status is saved and replaced."""
+    store = backend()
+    assert store.get_status() is None
+    store.set_status(10)
+    store.set_status(20)
+    store.commit()
+    assert store.get_status() == 20
+    store.close()
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_storage_utxos(backend):
+    """Ensure UTxOs are upserted by pair, source, address and security
+    token and found by output reference and by pair and source.
+    """
+    store = backend()
+    assert store.utxo_by_pair_source(QUERY) is None
+    first = store.upsert_utxo(_utxo("addr1", 10, 0))
+    second = store.upsert_utxo(_utxo("addr2", 20, 1))
+    assert first != second
+    assert store.utxo_by_pair_source(QUERY).tx_hash == f"{20:064x}"
+    # addr1 moves to a later output than addr2.
+    assert store.upsert_utxo(_utxo("addr1", 30, 2)) == first
+    latest = store.utxo_by_pair_source(QUERY)
+    assert (latest.tx_hash, latest.output_index, latest.token_1_volume) == (
+        f"{30:064x}",
+        2,
+        300,
+    )
+    assert (latest.token_1_policy, latest.token_2_name) == ("policy1", "lovelace")
+    assert store.utxo_by_outref(f"{10:064x}", 0) is None
+    res = store.utxo_by_outref(f"{30:064x}", 2)
+    assert (res.row_id, res.block_height, res.token_1_decimals) == (first, 30, 6)
+    assert store.utxo_by_outref(f"{20:064x}", 1).row_id == second
+    store.close()
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_storage_prices(backend):
+    """Ensure price records are appended with increasing ids."""
+    store = backend()
+    ids = [
+        store.append_price(
+            dba.price_record_obj(
+                pair="FACT-ADA",
+                epoch=500,
+                block_height=block_height,
+                price=0.5,
+                token_1_amount=10,
+                token_2_amount=20,
+                source="MinswapV2",
+            )
+        )
+        for block_height in (10, 20, 30)
+    ]
+    assert ids == [1, 2, 3]
+    store.close()